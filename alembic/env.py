@@ -16,6 +16,7 @@ from database.connection import Base
 from app.models.pizza import Pizza
 from app.models.cliente import Cliente
 from app.models.pedido import Pedido, DetallePedido
+from app.models.carrito_item import CarritoItem
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
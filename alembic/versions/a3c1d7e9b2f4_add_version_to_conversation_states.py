@@ -0,0 +1,28 @@
+"""add_version_to_conversation_states
+
+Revision ID: a3c1d7e9b2f4
+Revises: 919b56b2fd8b
+Create Date: 2026-10-16 10:12:41.318205
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3c1d7e9b2f4'
+down_revision = '919b56b2fd8b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Versión para control de concurrencia optimista (compare-and-swap)
+    op.add_column(
+        'conversation_states',
+        sa.Column('version', sa.Integer(), server_default='1', nullable=False)
+    )
+
+
+def downgrade() -> None:
+    op.drop_column('conversation_states', 'version')
@@ -0,0 +1,42 @@
+"""add_carrito_items_table
+
+Revision ID: b7e2f4a91c3d
+Revises: a3c1d7e9b2f4
+Create Date: 2026-10-16 11:03:27.540912
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e2f4a91c3d'
+down_revision = 'a3c1d7e9b2f4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Carrito normalizado: una fila por pizza y tamaño en lugar del JSON en datos_temporales
+    op.create_table('carrito_items',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('numero_whatsapp', sa.String(length=20), nullable=False),
+    sa.Column('pizza_id', sa.Integer(), nullable=False),
+    sa.Column('pizza_nombre', sa.String(length=100), nullable=False),
+    sa.Column('pizza_emoji', sa.String(length=10), nullable=True),
+    sa.Column('tamano', sa.String(length=20), nullable=False),
+    sa.Column('precio', sa.Float(), nullable=False),
+    sa.Column('cantidad', sa.Integer(), nullable=False),
+    sa.Column('fecha_creacion', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.ForeignKeyConstraint(['pizza_id'], ['pizzas.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('numero_whatsapp', 'pizza_id', 'tamano', name='uq_carrito_items_linea')
+    )
+    op.create_index(op.f('ix_carrito_items_id'), 'carrito_items', ['id'], unique=False)
+    op.create_index(op.f('ix_carrito_items_numero_whatsapp'), 'carrito_items', ['numero_whatsapp'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_carrito_items_numero_whatsapp'), table_name='carrito_items')
+    op.drop_index(op.f('ix_carrito_items_id'), table_name='carrito_items')
+    op.drop_table('carrito_items')
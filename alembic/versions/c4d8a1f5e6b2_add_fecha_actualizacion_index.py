@@ -0,0 +1,25 @@
+"""add_fecha_actualizacion_index
+
+Revision ID: c4d8a1f5e6b2
+Revises: b7e2f4a91c3d
+Create Date: 2026-10-16 11:48:05.216734
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4d8a1f5e6b2'
+down_revision = 'b7e2f4a91c3d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Índice para que la limpieza encuentre las conversaciones inactivas sin recorrer la tabla
+    op.create_index(op.f('ix_conversation_states_fecha_actualizacion'), 'conversation_states', ['fecha_actualizacion'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_conversation_states_fecha_actualizacion'), table_name='conversation_states')
@@ -0,0 +1,25 @@
+"""add_historial_to_conversation_states
+
+Revision ID: d9f3b6c2a7e1
+Revises: c4d8a1f5e6b2
+Create Date: 2026-10-16 12:25:51.903417
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd9f3b6c2a7e1'
+down_revision = 'c4d8a1f5e6b2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Últimos turnos de la conversación (ring buffer acotado en JSON)
+    op.add_column('conversation_states', sa.Column('historial', sa.Text(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('conversation_states', 'historial')
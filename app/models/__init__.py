@@ -2,5 +2,6 @@ from .pizza import Pizza
 from .cliente import Cliente
 from .pedido import Pedido, DetallePedido
 from .conversation_state import ConversationState
+from .carrito_item import CarritoItem
 
-__all__ = ["Pizza", "Cliente", "Pedido", "DetallePedido", "ConversationState"] 
\ No newline at end of file
+__all__ = ["Pizza", "Cliente", "Pedido", "DetallePedido", "ConversationState", "CarritoItem"] 
\ No newline at end of file
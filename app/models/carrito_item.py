@@ -0,0 +1,24 @@
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, UniqueConstraint
+from sqlalchemy.sql import func
+from database.connection import Base
+
+# Línea del carrito de una conversación en curso
+class CarritoItem(Base):
+    __tablename__ = "carrito_items"
+    __table_args__ = (
+        # Una línea por pizza y tamaño; agregar la misma pizza suma cantidad
+        UniqueConstraint('numero_whatsapp', 'pizza_id', 'tamano', name='uq_carrito_items_linea'),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    numero_whatsapp = Column(String(20), nullable=False, index=True)
+    pizza_id = Column(Integer, ForeignKey("pizzas.id"), nullable=False)
+    pizza_nombre = Column(String(100), nullable=False)
+    pizza_emoji = Column(String(10), default="🍕")
+    tamano = Column(String(20), nullable=False)  # pequeña, mediana, grande
+    precio = Column(Float, nullable=False)  # Precio unitario
+    cantidad = Column(Integer, nullable=False, default=1)
+    fecha_creacion = Column(DateTime(timezone=True), server_default=func.now())
+    
+    def __repr__(self):
+        return f"<CarritoItem(numero_whatsapp='{self.numero_whatsapp}', pizza_id={self.pizza_id}, cantidad={self.cantidad})>"
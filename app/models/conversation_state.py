@@ -10,7 +10,12 @@ class ConversationState(Base):
     estado_actual = Column(String(50), default='inicio')
     datos_temporales = Column(Text)  # JSON string para guardar datos temporales
     ultimo_mensaje = Column(String(500))
-    fecha_actualizacion = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    historial = Column(Text)  # JSON compacto con los últimos turnos [[rol, texto], ...]
+    fecha_actualizacion = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), index=True)
+    # Control de concurrencia optimista: cada UPDATE verifica y avanza la versión
+    version = Column(Integer, nullable=False, default=1, server_default='1')
+    
+    __mapper_args__ = {"version_id_col": version}
     
     def __repr__(self):
         return f"<ConversationState(numero_whatsapp='{self.numero_whatsapp}', estado='{self.estado_actual}')>"
@@ -1,8 +1,9 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Header, Response
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 from database.connection import get_db
-from app.models.pizza import Pizza
+from app.services.menu_catalog import get_menu_catalog
+from app.services.menu_renderer import etag_matches, menu_renderer
 
 router = APIRouter()
 
@@ -10,54 +11,29 @@ router = APIRouter()
 @router.get("/", response_model=List[dict])
 async def get_pizzas(db: Session = Depends(get_db)):
     """Obtener todas las pizzas disponibles"""
-    pizzas = db.query(Pizza).filter(Pizza.disponible == True).all()
-    return [
-        {
-            "id": pizza.id,
-            "nombre": pizza.nombre,
-            "descripcion": pizza.descripcion,
-            "precio_pequena": pizza.precio_pequena,
-            "precio_mediana": pizza.precio_mediana,
-            "precio_grande": pizza.precio_grande,
-            "emoji": pizza.emoji
-        }
-        for pizza in pizzas
-    ]
+    return [pizza.to_dict() for pizza in get_menu_catalog(db)]
 
 # Obtener una pizza específica por ID
 @router.get("/{pizza_id}")
 async def get_pizza(pizza_id: int, db: Session = Depends(get_db)):
     """Obtener una pizza específica por ID"""
-    pizza = db.query(Pizza).filter(Pizza.id == pizza_id).first()
+    pizza = get_menu_catalog(db).get(pizza_id)
     if not pizza:
         raise HTTPException(status_code=404, detail="Pizza no encontrada")
     
-    return {
-        "id": pizza.id,
-        "nombre": pizza.nombre,
-        "descripcion": pizza.descripcion,
-        "precio_pequena": pizza.precio_pequena,
-        "precio_mediana": pizza.precio_mediana,
-        "precio_grande": pizza.precio_grande,
-        "emoji": pizza.emoji
-    }
+    return pizza.to_dict()
 
 # Obtener el menú en formato texto para WhatsApp
 @router.get("/menu/text")
-async def get_menu_text(db: Session = Depends(get_db)):
-    """Obtener el menú en formato texto para WhatsApp"""
-    pizzas = db.query(Pizza).filter(Pizza.disponible == True).all()
+async def get_menu_text(
+    db: Session = Depends(get_db),
+    if_none_match: Optional[str] = Header(None)
+):
+    """Obtener el menú en formato texto para WhatsApp (con ETag por versión del catálogo)"""
+    menu = menu_renderer.rendered(get_menu_catalog(db))
+    headers = {"ETag": menu.etag, "Cache-Control": "no-cache"}
     
-    menu_text = "🍕 *MENÚ DE PIZZAS* 🍕\n\n"
+    if etag_matches(if_none_match, menu.etag):
+        return Response(status_code=304, headers=headers)
     
-    for i, pizza in enumerate(pizzas, 1):
-        menu_text += f"{i}. {pizza.emoji} *{pizza.nombre}*\n"
-        menu_text += f"   {pizza.descripcion}\n"
-        menu_text += f"   • Pequeña: ${pizza.precio_pequena:.2f}\n"
-        menu_text += f"   • Mediana: ${pizza.precio_mediana:.2f}\n"
-        menu_text += f"   • Grande: ${pizza.precio_grande:.2f}\n\n"
-    
-    menu_text += "Para hacer un pedido, responde con el número de la pizza y el tamaño.\n"
-    menu_text += "Ejemplo: '1 mediana' o '2 grande'"
-    
-    return {"menu": menu_text} 
\ No newline at end of file
+    return Response(content=menu.api_body, media_type="application/json", headers=headers)
@@ -1,12 +1,23 @@
 from fastapi import APIRouter, Request, Depends, HTTPException, Form, Body
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 from sqlalchemy.orm import Session
 from slowapi import Limiter
 from slowapi.util import get_remote_address
-from database.connection import get_db
+from database.connection import get_db, SessionLocal
 from app.services.whatsapp_service import WhatsAppService
 from app.services.enhanced_bot_service import EnhancedBotService
 from app.services.cache_service import cache_service
+from app.services.message_queue_service import message_queue_service
+from app.services.conversation_dispatcher import conversation_dispatcher
+from app.services.dedupe_service import message_deduplicator
+from app.services.outbound_queue_service import outbound_message_queue
+from app.services.optimized_conversation_service import conversation_state_cache
+from app.services.write_behind_service import conversation_write_behind
+from app.services.conversation_context import get_conversation_context_stats
+from app.services.conversation_sweeper import conversation_sweeper
+from app.services.prompt_assembler import prompt_assembler
+from app.services.menu_catalog import menu_catalog
+from app.services.menu_renderer import menu_renderer
 from twilio.request_validator import RequestValidator
 from twilio.base.exceptions import TwilioRestException
 from config.settings import settings
@@ -21,6 +32,19 @@ limiter = Limiter(key_func=get_remote_address)
 # Router de webhook
 router = APIRouter()
 
+async def send_outbound_message(to_number: str, message: str) -> str:
+    """Enviar un mensaje encolado en la cola saliente (usado por sus workers)"""
+    return await WhatsAppService().send_message(to_number, message)
+
+# Registrar la función de envío de la cola saliente
+outbound_message_queue.register_sender(send_outbound_message)
+
+async def deliver_response(whatsapp_service: WhatsAppService, to_number: str, message: str):
+    """Entregar una respuesta por la cola saliente si está activa, si no enviarla directamente"""
+    if outbound_message_queue.running and outbound_message_queue.enqueue(to_number, message):
+        return
+    await whatsapp_service.send_message(to_number, message)
+
 async def process_whatsapp_message(from_number: str, message_body: str, db: Session) -> dict:
     """Procesar mensaje de WhatsApp con bot híbrido (IA + tradicional)"""
     if not from_number or not message_body:
@@ -45,11 +69,13 @@ async def process_whatsapp_message(from_number: str, message_body: str, db: Sess
         logger.info(f"🔧 Bot híbrido en modo tradicional para {from_number} (sin OpenAI)")
     
     try:
-        # Procesar mensaje con el bot
-        response = await bot_service.process_message(from_number, message_body)
-        
-        # Enviar respuesta por WhatsApp
-        await whatsapp_service.send_message(from_number, response)
+        # Mensajes del mismo número se procesan en orden; números distintos en paralelo
+        async with conversation_dispatcher.serialize(from_number):
+            # Procesar mensaje con el bot
+            response = await bot_service.process_message(from_number, message_body)
+            
+            # Enviar respuesta por WhatsApp (con reintentos si la cola saliente está activa)
+            await deliver_response(whatsapp_service, from_number, response)
         
         # Calcular tiempo de procesamiento
         processing_time = time.time() - start_time
@@ -86,7 +112,8 @@ async def process_whatsapp_message(from_number: str, message_body: str, db: Sess
         
         # Enviar mensaje de error al usuario
         try:
-            await whatsapp_service.send_message(
+            await deliver_response(
+                whatsapp_service,
                 from_number, 
                 "Lo siento, hubo un error procesando tu mensaje. Por favor, intenta de nuevo."
             )
@@ -95,6 +122,59 @@ async def process_whatsapp_message(from_number: str, message_body: str, db: Sess
         
         raise HTTPException(status_code=500, detail=str(e))
 
+async def process_queued_message(from_number: str, message_body: str):
+    """Procesar un mensaje encolado con su propia sesión de BD (usado por los workers)"""
+    db = SessionLocal()
+    try:
+        await process_whatsapp_message(from_number, message_body, db)
+    except HTTPException as e:
+        logger.error(f"❌ Error procesando mensaje encolado de {from_number}: {e.detail}")
+    finally:
+        db.close()
+
+# Registrar el procesador de la cola de mensajes entrantes
+message_queue_service.register_processor(process_queued_message)
+
+async def dispatch_whatsapp_message(
+    from_number: str,
+    message_body: str,
+    db: Session,
+    message_sid: Optional[str] = None
+) -> JSONResponse:
+    """Encolar el mensaje si el modo asíncrono está activo, si no procesarlo en línea"""
+    if not from_number or not message_body:
+        raise HTTPException(status_code=400, detail="Datos incompletos")
+    
+    # Descartar reintentos de Twilio antes de hacer cualquier trabajo
+    if await message_deduplicator.is_duplicate(message_sid):
+        return JSONResponse(
+            status_code=200,
+            content={"status": "duplicate", "message": "Mensaje ya procesado"}
+        )
+    
+    if message_queue_service.running:
+        if not message_queue_service.enqueue(from_number, message_body):
+            # Cola llena: pedir a Twilio que reintente más tarde
+            await message_deduplicator.release(message_sid)
+            raise HTTPException(
+                status_code=503,
+                detail="Cola de mensajes llena",
+                headers={"Retry-After": "5"}
+            )
+        
+        return JSONResponse(
+            status_code=200,
+            content={"status": "accepted", "message": "Mensaje encolado"}
+        )
+    
+    try:
+        result = await process_whatsapp_message(from_number, message_body, db)
+    except Exception:
+        # Permitir que el reintento de Twilio vuelva a procesar el mensaje
+        await message_deduplicator.release(message_sid)
+        raise
+    return JSONResponse(status_code=200, content=result)
+
 # Webhook para recibir mensajes de WhatsApp (Form data)
 @router.post("/whatsapp/form")
 @limiter.limit("30/minute")
@@ -102,6 +182,7 @@ async def whatsapp_webhook_form(
     request: Request,
     From: str = Form(...),
     Body: str = Form(...),
+    MessageSid: Optional[str] = Form(None),
     db: Session = Depends(get_db)
 ):
     """Webhook para recibir mensajes de WhatsApp via form data"""
@@ -123,8 +204,7 @@ async def whatsapp_webhook_form(
     
     try:
         from_number = From.replace("whatsapp:", "")
-        result = await process_whatsapp_message(from_number, Body, db)
-        return JSONResponse(status_code=200, content=result)
+        return await dispatch_whatsapp_message(from_number, Body, db, MessageSid)
     except HTTPException as e:
         raise e
     except Exception as e:
@@ -143,12 +223,12 @@ async def whatsapp_webhook_json(
     try:
         from_number = str(data.get("From", "")).replace("whatsapp:", "")
         message_body = str(data.get("Body", ""))
+        message_sid = data.get("MessageSid")
         
         if not from_number or not message_body:
             raise HTTPException(status_code=400, detail="Datos incompletos")
             
-        result = await process_whatsapp_message(from_number, message_body, db)
-        return JSONResponse(status_code=200, content=result)
+        return await dispatch_whatsapp_message(from_number, message_body, db, message_sid)
     except HTTPException as e:
         raise e
     except Exception as e:
@@ -199,6 +279,20 @@ async def test_webhook():
     """Endpoint para probar el webhook"""
     return {"status": "success", "message": "Webhook funcionando correctamente"}
 
+# Métricas de caché para Prometheus
+@router.get("/metrics")
+async def prometheus_metrics():
+    """Métricas de caché por keyspace en formato de texto de Prometheus"""
+    gauges = {
+        'redis_circuit_open': 0 if cache_service.breaker.state == 'closed' else 1,
+        'cache_l1_entries': len(cache_service.local),
+        'conversation_memory_entries': len(conversation_state_cache)
+    }
+    return PlainTextResponse(
+        cache_service.metrics.render_prometheus(gauges),
+        media_type="text/plain; version=0.0.4"
+    )
+
 # Endpoint para monitoreo de rendimiento y caché
 @router.get("/performance")
 async def performance_stats(db: Session = Depends(get_db)):
@@ -207,20 +301,18 @@ async def performance_stats(db: Session = Depends(get_db)):
         # Estadísticas básicas del caché
         cache_stats: Dict[str, Any] = {
             'redis_enabled': cache_service.enabled,
-            'redis_connected': cache_service.redis is not None if cache_service else False
+            'redis_connected': cache_service.redis_available,
+            **cache_service.get_stats()
         }
         
-        # Estadísticas de Redis si está disponible
-        if cache_service.redis:
-            try:
-                info = await cache_service.redis.info()
-                cache_stats.update({
-                    'redis_memory_used': info.get('used_memory_human', 'Unknown'),
-                    'redis_connected_clients': info.get('connected_clients', 0),
-                    'redis_total_commands': info.get('total_commands_processed', 0)
-                })
-            except Exception as redis_error:
-                cache_stats['redis_error'] = str(redis_error)
+        # Estadísticas de Redis si está disponible (respeta el circuit breaker)
+        info = await cache_service.info()
+        if info:
+            cache_stats.update({
+                'redis_memory_used': info.get('used_memory_human', 'Unknown'),
+                'redis_connected_clients': info.get('connected_clients', 0),
+                'redis_total_commands': info.get('total_commands_processed', 0)
+            })
         
         # Estadísticas de la base de datos (versión más robusta)
         db_stats = {}
@@ -252,6 +344,18 @@ async def performance_stats(db: Session = Depends(get_db)):
                 "status": "success",
                 "cache_stats": cache_stats,
                 "database_stats": db_stats,
+                "queue_stats": message_queue_service.get_stats(),
+                "dispatcher_stats": conversation_dispatcher.get_stats(),
+                "dedupe_stats": message_deduplicator.get_stats(),
+                "whatsapp_sender_stats": WhatsAppService.get_sender_stats(),
+                "outbound_queue_stats": outbound_message_queue.get_stats(),
+                "conversation_cache_stats": conversation_state_cache.get_stats(),
+                "write_behind_stats": conversation_write_behind.get_stats(),
+                "conversation_context_stats": get_conversation_context_stats(),
+                "conversation_sweeper_stats": conversation_sweeper.get_stats(),
+                "ai_prompt_stats": prompt_assembler.get_stats(),
+                "menu_catalog_stats": menu_catalog.get_stats(),
+                "menu_render_stats": menu_renderer.get_stats(),
                 "timestamp": time.time()
             }
         )
@@ -2,9 +2,11 @@
 Servicio de IA para manejar conversaciones inteligentes del bot de pizza
 """
 
+import asyncio
 import openai
 import json
 import logging
+from datetime import timedelta
 from typing import Dict, List, Optional, Tuple, cast
 from sqlalchemy.orm import Session
 from sqlalchemy import func
@@ -12,10 +14,18 @@ from app.models.cliente import Cliente
 from app.models.pizza import Pizza
 from app.models.pedido import Pedido, DetallePedido
 from app.services.bot_service import BotService
+from app.services.cache_service import cache_service
+from app.services.menu_catalog import CatalogPizza, get_menu_catalog
+from app.services.prompt_assembler import PromptSection, prompt_assembler
 from config.settings import settings
+from database.connection import own_session
 
 logger = logging.getLogger(__name__)
 
+# Prefijo de la clave del prompt del sistema en caché (compartido por todas las
+# peticiones); la clave lleva la versión del catálogo de pizzas
+SYSTEM_PROMPT_CACHE_KEY = "ai:system_prompt"
+
 # AIService para manejar la lógica de IA
 # Este servicio se encarga de procesar mensajes, extraer intenciones y manejar el contexto
 # Utiliza OpenAI para generar respuestas inteligentes basadas en el contexto del cliente y la conversación
@@ -25,20 +35,64 @@ class AIService:
         self.bot_service = BotService(db)
         self.openai_client = openai.OpenAI(api_key=settings.OPENAI_API_KEY)
         
-        # Configurar el contexto del sistema
-        self.system_prompt = self._create_system_prompt()
-        
-    def _create_system_prompt(self) -> str:
+    async def get_system_prompt(self) -> str:
+        """
+        Prompt del sistema desde caché. Si expiró, una sola petición lo
+        reconstruye (4 consultas de agregación) y las concurrentes la esperan.
+        """
+        return await cache_service.get_or_load(
+            self._system_prompt_key(),
+            lambda: asyncio.to_thread(self._with_own_session, self._create_system_prompt),
+            ttl=timedelta(seconds=settings.AI_SYSTEM_PROMPT_TTL)
+        )
+    
+    def _system_prompt_key(self) -> str:
+        """
+        Clave del prompt para el catálogo vigente: el prompt trae precios y
+        disponibilidad, así que un cambio del menú usa otra clave en lugar de
+        servir el prompt viejo hasta que expire.
+        """
+        return f"{SYSTEM_PROMPT_CACHE_KEY}:{get_menu_catalog(self.db).version}"
+    
+    async def get_client_profile(self, cliente: Cliente) -> str:
+        """
+        Resumen del cliente (datos y últimos pedidos) desde caché; las
+        peticiones concurrentes del mismo número comparten una sola carga.
+        """
+        cliente_id = cliente.id
+        try:
+            return await cache_service.get_or_load(
+                cache_service.client_profile_key(str(cliente.numero_whatsapp)),
+                lambda: asyncio.to_thread(
+                    self._with_own_session,
+                    lambda db: self._get_client_context(db.get(Cliente, cliente_id), db)
+                ),
+                ttl=timedelta(seconds=settings.AI_CLIENT_PROFILE_TTL)
+            )
+        except Exception as e:
+            logger.error(f"Error obteniendo perfil del cliente: {str(e)}")
+            return "Información del cliente no disponible."
+    
+    def _with_own_session(self, build):
+        """
+        Ejecutar `build(db)` con una sesión propia. Las cargas de get_or_load se
+        comparten entre peticiones y corren en otro hilo: pueden seguir después
+        de que la petición que las inició se cancele y cierre su sesión.
+        """
+        with own_session(self.db) as db:
+            return build(db)
+    
+    def _create_system_prompt(self, db: Optional[Session] = None) -> str:
         """Crear el prompt del sistema para la IA con contexto completo de la base de datos"""
         
         # Obtener información de pizzas
-        pizzas_info = self._get_pizzas_context()
+        pizzas_info = self._get_pizzas_context(db)
         
         # Obtener estadísticas de la base de datos
-        db_stats = self._get_database_stats()
+        db_stats = self._get_database_stats(db)
         
         # Obtener pizzas más populares
-        popular_pizzas = self._get_popular_pizzas()
+        popular_pizzas = self._get_popular_pizzas(db)
         
         return f"""
 Eres un asistente de ventas especializado en una pizzería que opera por WhatsApp.
@@ -135,10 +189,10 @@ PALABRAS CLAVE PARA MODIFICACIÓN:
 IMPORTANTE: Cuando el usuario dice "Solo quiero X" significa que quiere REEMPLAZAR todo el carrito actual con únicamente X.
 """
     
-    def _get_pizzas_context(self) -> str:
+    def _get_pizzas_context(self, db: Optional[Session] = None) -> str:
         """Obtener contexto completo de pizzas desde la base de datos"""
         try:
-            pizzas = self.db.query(Pizza).filter(Pizza.disponible == True).all()
+            pizzas = get_menu_catalog(db or self.db)
             
             if not pizzas:
                 return "No hay pizzas disponibles en este momento."
@@ -160,20 +214,21 @@ IMPORTANTE: Cuando el usuario dice "Solo quiero X" significa que quiere REEMPLAZ
             logger.error(f"Error obteniendo contexto de pizzas: {str(e)}")
             return "Error al cargar información de pizzas."
     
-    def _get_database_stats(self) -> str:
+    def _get_database_stats(self, db: Optional[Session] = None) -> str:
         """Obtener estadísticas de la base de datos"""
+        db = db or self.db
         try:
             # Contar clientes registrados
-            total_clientes = self.db.query(Cliente).count()
+            total_clientes = db.query(Cliente).count()
             
             # Contar pedidos realizados
-            total_pedidos = self.db.query(Pedido).count()
+            total_pedidos = db.query(Pedido).count()
             
             # Contar pizzas disponibles
-            total_pizzas = self.db.query(Pizza).filter(Pizza.disponible == True).count()
+            total_pizzas = len(get_menu_catalog(db))
             
             # Calcular valor promedio de pedido
-            avg_pedido = self.db.query(func.avg(Pedido.total)).scalar() or 0
+            avg_pedido = db.query(func.avg(Pedido.total)).scalar() or 0
             
             stats = f"""- Total de clientes registrados: {total_clientes}
 - Total de pedidos realizados: {total_pedidos}
@@ -186,12 +241,13 @@ IMPORTANTE: Cuando el usuario dice "Solo quiero X" significa que quiere REEMPLAZ
             logger.error(f"Error obteniendo estadísticas: {str(e)}")
             return "- Estadísticas no disponibles"
     
-    def _get_popular_pizzas(self) -> str:
+    def _get_popular_pizzas(self, db: Optional[Session] = None) -> str:
         """Obtener pizzas más populares basadas en pedidos"""
+        db = db or self.db
         try:
             # Consulta para obtener pizzas más vendidas
             popular_query = (
-                self.db.query(
+                db.query(
                     Pizza.nombre,
                     Pizza.emoji,
                     func.sum(DetallePedido.cantidad).label('total_vendidas'),
@@ -221,15 +277,16 @@ IMPORTANTE: Cuando el usuario dice "Solo quiero X" significa que quiere REEMPLAZ
             logger.error(f"Error obteniendo pizzas populares: {str(e)}")
             return "Información de popularidad no disponible."
     
-    def _get_client_context(self, cliente: Cliente) -> str:
+    def _get_client_context(self, cliente: Optional[Cliente], db: Optional[Session] = None) -> str:
         """Obtener contexto específico del cliente"""
+        db = db or self.db
         try:
             if not cliente:
                 return "Cliente nuevo (no registrado)"
             
             # Obtener últimos pedidos del cliente
             ultimos_pedidos = (
-                self.db.query(Pedido)
+                db.query(Pedido)
                 .filter(Pedido.cliente_id == cliente.id)
                 .order_by(Pedido.fecha_pedido.desc())
                 .limit(3)
@@ -250,7 +307,7 @@ IMPORTANTE: Cuando el usuario dice "Solo quiero X" significa que quiere REEMPLAZ
                     
                     # Obtener detalles del pedido
                     detalles = (
-                        self.db.query(DetallePedido, Pizza.nombre)
+                        db.query(DetallePedido, Pizza.nombre)
                         .join(Pizza, DetallePedido.pizza_id == Pizza.id)
                         .filter(DetallePedido.pedido_id == pedido.id)
                         .all()
@@ -281,22 +338,18 @@ IMPORTANTE: Cuando el usuario dice "Solo quiero X" significa que quiere REEMPLAZ
         if not cliente and contexto_dinamico.get('cliente'):
             cliente = contexto_dinamico['cliente']
         
-        # Construir contexto de la conversación
-        context = self._build_conversation_context(numero_whatsapp, cliente, contexto_conversacion)
-        
-        # Agregar contexto dinámico
-        if contexto_dinamico:
-            context += f"\n\nCONTEXTO DINÁMICO:\n"
-            context += f"- Pedidos recientes (30 días): {contexto_dinamico.get('pedidos_recientes_30_dias', 0)}\n"
-            context += f"- Pizzas disponibles: {contexto_dinamico.get('pizzas_disponibles', 0)}\n"
-            if contexto_dinamico.get('recomendaciones'):
-                context += f"\nRECOMENDACIONES:\n{contexto_dinamico['recomendaciones']}\n"
-        
-        # Preparar mensajes para OpenAI con tipos correctos
-        messages = [
-            {"role": "system", "content": self.system_prompt},
-            {"role": "user", "content": f"Contexto: {context}\n\nMensaje del usuario: {mensaje}"}
-        ]
+        # Armar el prompt dentro del presupuesto de tokens (historial reciente incluido)
+        perfil_cliente = await self.get_client_profile(cliente) if cliente else None
+        sections = self._build_prompt_sections(
+            numero_whatsapp, cliente, contexto_conversacion, contexto_dinamico, perfil_cliente
+        )
+        prompt = prompt_assembler.assemble(
+            system_prompt=await self.get_system_prompt(),
+            user_message=mensaje,
+            sections=sections,
+            history=(contexto_conversacion or {}).get('historial')
+        )
+        messages = prompt.messages
         
         try:
             # Llamar a OpenAI
@@ -307,6 +360,10 @@ IMPORTANTE: Cuando el usuario dice "Solo quiero X" significa que quiere REEMPLAZ
                 max_tokens=500
             )
             
+            # Tokens reales del prompt según la API (para comparar con la estimación local)
+            usage = getattr(response, 'usage', None)
+            prompt_assembler.record_usage(getattr(usage, 'prompt_tokens', None))
+            
             # Verificar que el contenido no sea None
             content = response.choices[0].message.content
             if content is None:
@@ -341,36 +398,65 @@ IMPORTANTE: Cuando el usuario dice "Solo quiero X" significa que quiere REEMPLAZ
                                   cliente: Optional[Cliente],
                                   contexto_conversacion: Optional[Dict]) -> str:
         """Construir contexto completo de la conversación"""
+        sections = self._build_prompt_sections(numero_whatsapp, cliente, contexto_conversacion)
+        return "\n\n".join(section.text for section in sections) + "\n"
+    
+    def _build_prompt_sections(self, 
+                               numero_whatsapp: str, 
+                               cliente: Optional[Cliente],
+                               contexto_conversacion: Optional[Dict],
+                               contexto_dinamico: Optional[Dict] = None,
+                               perfil_cliente: Optional[str] = None) -> List[PromptSection]:
+        """
+        Partes del contexto con su valor (las de menor valor se descartan primero).
+        `perfil_cliente` es el resumen cacheado de get_client_profile; sin él se arma aquí.
+        """
         
-        context = f"CONVERSACIÓN CON: {numero_whatsapp}\n\n"
-        
-        # Agregar contexto del cliente si existe
-        if cliente:
-            context += self._get_client_context(cliente) + "\n\n"
-        else:
-            context += "CLIENTE NUEVO (no registrado)\n\n"
-        
-        # Agregar contexto de la conversación actual
+        # Estado de la conversación y carrito: lo más valioso para decidir la acción
+        conversacion = f"CONVERSACIÓN CON: {numero_whatsapp}\n"
         if contexto_conversacion:
-            context += f"ESTADO ACTUAL DE LA CONVERSACIÓN:\n"
-            context += f"- Estado: {contexto_conversacion.get('estado', 'inicio')}\n"
+            conversacion += f"\nESTADO ACTUAL DE LA CONVERSACIÓN:\n"
+            conversacion += f"- Estado: {contexto_conversacion.get('estado', 'inicio')}\n"
             
             carrito = contexto_conversacion.get('carrito', [])
             if carrito:
-                context += "- Carrito actual:\n"
+                conversacion += "- Carrito actual:\n"
                 total_carrito = 0
                 for item in carrito:
-                    context += f"  • {item['pizza_nombre']} ({item['tamano']}): ${item['precio']:.2f}\n"
-                    total_carrito += item['precio']
-                context += f"- Total del carrito: ${total_carrito:.2f}\n"
+                    cantidad = item.get('cantidad', 1)
+                    conversacion += f"  • {item['pizza_nombre']} ({item['tamano']}) x{cantidad}: ${item['precio']:.2f}\n"
+                    total_carrito += item['precio'] * cantidad
+                conversacion += f"- Total del carrito: ${total_carrito:.2f}\n"
             else:
-                context += "- Carrito: vacío\n"
+                conversacion += "- Carrito: vacío\n"
             
             # Agregar información de entrega si existe
             if contexto_conversacion.get('direccion_entrega'):
-                context += f"- Dirección de entrega: {contexto_conversacion['direccion_entrega']}\n"
+                conversacion += f"- Dirección de entrega: {contexto_conversacion['direccion_entrega']}\n"
         
-        return context
+        sections = [PromptSection('conversacion', conversacion.rstrip(), priority=90)]
+        
+        # Resumen del cliente (crece con su historial de pedidos)
+        if cliente:
+            perfil = perfil_cliente if perfil_cliente is not None else self._get_client_context(cliente)
+            sections.append(PromptSection('cliente', perfil, priority=50))
+        else:
+            sections.append(PromptSection('cliente', "CLIENTE NUEVO (no registrado)", priority=50))
+        
+        # Contexto dinámico y recomendaciones: lo primero que se descarta
+        if contexto_dinamico:
+            dinamico = "CONTEXTO DINÁMICO:\n"
+            dinamico += f"- Pedidos recientes (30 días): {contexto_dinamico.get('pedidos_recientes_30_dias', 0)}\n"
+            dinamico += f"- Pizzas disponibles: {contexto_dinamico.get('pizzas_disponibles', 0)}"
+            sections.append(PromptSection('contexto_dinamico', dinamico, priority=30))
+            if contexto_dinamico.get('recomendaciones'):
+                sections.append(PromptSection(
+                    'recomendaciones',
+                    f"RECOMENDACIONES:\n{contexto_dinamico['recomendaciones']}",
+                    priority=20
+                ))
+        
+        return sections
     
     def get_personalized_recommendations(self, cliente: Optional[Cliente]) -> str:
         """Obtener recomendaciones personalizadas para el cliente"""
@@ -423,7 +509,7 @@ IMPORTANTE: Cuando el usuario dice "Solo quiero X" significa que quiere REEMPLAZ
             )
             
             # Obtener pizzas con stock bajo (simulado - podrías agregar un campo stock a Pizza)
-            pizzas_disponibles = self.db.query(Pizza).filter(Pizza.disponible == True).count()
+            pizzas_disponibles = len(get_menu_catalog(self.db))
             
             return {
                 "cliente": cliente,
@@ -436,33 +522,19 @@ IMPORTANTE: Cuando el usuario dice "Solo quiero X" significa que quiere REEMPLAZ
             logger.error(f"Error obteniendo contexto dinámico: {str(e)}")
             return {}
     
-    def refresh_system_context(self):
+    async def refresh_system_context(self):
         """Refrescar el contexto del sistema cuando hay cambios en la base de datos"""
         try:
-            self.system_prompt = self._create_system_prompt()
+            await cache_service.delete_many([self._system_prompt_key()])
             logger.info("Sistema de IA actualizado con nuevo contexto de base de datos")
         except Exception as e:
             logger.error(f"Error refrescando contexto del sistema: {str(e)}")
     
-    def get_pizza_by_name_or_number(self, identifier: str) -> Optional[Pizza]:
+    def get_pizza_by_name_or_number(self, identifier: str) -> Optional[CatalogPizza]:
         """Obtener pizza por nombre o número de menú"""
         try:
-            # Intentar como número primero
-            if identifier.isdigit():
-                pizzas = self.db.query(Pizza).filter(Pizza.disponible == True).all()
-                pizza_num = int(identifier)
-                if 1 <= pizza_num <= len(pizzas):
-                    return pizzas[pizza_num - 1]
-            
-            # Buscar por nombre (case insensitive)
-            pizza = (
-                self.db.query(Pizza)
-                .filter(Pizza.disponible == True)
-                .filter(Pizza.nombre.ilike(f"%{identifier}%"))
-                .first()
-            )
-            
-            return pizza
+            # Por número de menú primero y luego por nombre (case insensitive)
+            return get_menu_catalog(self.db).find(identifier)
             
         except Exception as e:
             logger.error(f"Error buscando pizza: {str(e)}")
@@ -4,7 +4,7 @@ Nuevo BotService refactorizado que usa handlers separados
 
 from sqlalchemy.orm import Session
 from app.models.cliente import Cliente
-from app.models.conversation_state import ConversationState
+from app.services.conversation_context import ConversationContext, conversation_unit_of_work
 from app.services.handlers import (
     RegistrationHandler,
     MenuHandler,
@@ -55,7 +55,18 @@ class BotService:
     
     async def process_message(self, numero_whatsapp: str, mensaje: str) -> str:
         """
-        Procesar mensaje del usuario y generar respuesta
+        Procesar mensaje del usuario y generar respuesta.
+        El bot y los handlers comparten un contexto de conversación que se escribe una sola vez.
+        """
+        async with conversation_unit_of_work(self.db, numero_whatsapp) as conversation:
+            response = await self._process_turn(numero_whatsapp, mensaje)
+            # Guardar el turno en el historial persistente (se escribe con el resto del turno)
+            conversation.record_turn(mensaje.strip(), response)
+            return response
+    
+    async def _process_turn(self, numero_whatsapp: str, mensaje: str) -> str:
+        """
+        Procesar un turno dentro de la unidad de trabajo de la conversación
         """
         try:
             # Limpiar mensaje
@@ -213,41 +224,29 @@ class BotService:
         return self._handle_registered_greeting(numero_whatsapp, cliente)
     
     # Métodos de utilidad para manejo de estado y datos
+    def _conversation(self, numero_whatsapp: str) -> ConversationContext:
+        """
+        Contexto del turno en curso (o transitorio si se llama fuera de un turno)
+        """
+        return ConversationContext.for_number(self.db, numero_whatsapp)
+    
     def get_cliente(self, numero_whatsapp: str) -> Optional[Cliente]:
         """
         Obtener cliente por número de WhatsApp
         """
-        return self.db.query(Cliente).filter(
-            Cliente.numero_whatsapp == numero_whatsapp
-        ).first()
+        return self._conversation(numero_whatsapp).cliente
     
     def get_conversation_state(self, numero_whatsapp: str) -> str:
         """
         Obtener estado actual de la conversación
         """
-        conv_state = self.db.query(ConversationState).filter(
-            ConversationState.numero_whatsapp == numero_whatsapp
-        ).first()
-        
-        if conv_state:
-            return getattr(conv_state, 'estado_actual', self._ESTADOS['INICIO'])
-        
-        return self._ESTADOS['INICIO']
+        return self._conversation(numero_whatsapp).estado
     
     def set_conversation_state(self, numero_whatsapp: str, estado: str):
         """
         Establecer estado de la conversación
         """
-        conv_state = self.db.query(ConversationState).filter(
-            ConversationState.numero_whatsapp == numero_whatsapp
-        ).first()
-        
-        if not conv_state:
-            conv_state = ConversationState(numero_whatsapp=numero_whatsapp)
-            self.db.add(conv_state)
-        
-        setattr(conv_state, 'estado_actual', estado)
-        self.db.commit()
+        self._conversation(numero_whatsapp).set_estado(estado)
         
         logger.info(f"💾 Estado guardado - Usuario: {numero_whatsapp}, Estado: {estado}")
     
@@ -255,14 +254,10 @@ class BotService:
         """
         Limpiar datos de conversación
         """
-        conv_state = self.db.query(ConversationState).filter(
-            ConversationState.numero_whatsapp == numero_whatsapp
-        ).first()
+        conversation = self._conversation(numero_whatsapp)
         
-        if conv_state:
-            setattr(conv_state, 'estado_actual', self._ESTADOS['INICIO'])
-            setattr(conv_state, 'datos_temporales', None)
-            self.db.commit()
+        if conversation.exists:
+            conversation.clear(self._ESTADOS['INICIO'])
             
             logger.info(f"🗑️ Datos de conversación limpiados - Usuario: {numero_whatsapp}")
     
@@ -0,0 +1,146 @@
+"""
+Agrupación de ráfagas de mensajes (debounce por número)
+
+Los usuarios de WhatsApp suelen partir una idea en varios mensajes
+("hola" / "quiero una hawaiana" / "grande"). En lugar de ejecutar un turno
+del bot (y a menudo una llamada a la IA) por fragmento, se esperan unos
+milisegundos por número y se unen los fragmentos en un solo turno.
+
+La ventana se reinicia con cada fragmento nuevo, pero nunca supera la
+ventana máxima contada desde el primer fragmento. Con carga alta (cola
+llena de trabajo) la ventana crece, ya que los workers están ocupados y
+esperar un poco más no añade latencia real.
+"""
+import asyncio
+import logging
+import time
+from typing import Callable, Dict, List, Optional, Any
+
+logger = logging.getLogger(__name__)
+
+# Función que recibe el turno agrupado: (numero_whatsapp, mensaje) -> aceptado
+BurstSink = Callable[[str, str], bool]
+# Función que retorna la carga actual (0 = ociosa, 1 = un mensaje por worker, ...)
+LoadProbe = Callable[[], float]
+
+
+class _PendingBurst:
+    """Fragmentos acumulados de un número a la espera de la ventana"""
+    __slots__ = ('fragments', 'first_at', 'timer')
+
+    def __init__(self):
+        self.fragments: List[str] = []
+        self.first_at = time.monotonic()
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+class BurstCoalescer:
+    """Une mensajes consecutivos del mismo número en un solo turno"""
+
+    # Separador entre fragmentos del turno agrupado
+    SEPARATOR = "\n"
+
+    # Factor máximo de crecimiento de la ventana por carga
+    MAX_LOAD_FACTOR = 2.0
+
+    def __init__(
+        self,
+        window_ms: int,
+        max_window_ms: int,
+        sink: BurstSink,
+        load_probe: Optional[LoadProbe] = None
+    ):
+        self.window_ms = window_ms
+        self.max_window_ms = max(max_window_ms, window_ms)
+        self._sink = sink
+        self._load_probe = load_probe
+        self._pending: Dict[str, _PendingBurst] = {}
+
+        # Métricas
+        self.fragments = 0
+        self.turns = 0
+        self.llm_calls_saved = 0
+        self.dropped = 0
+
+    @property
+    def enabled(self) -> bool:
+        """La agrupación está activa si la ventana es mayor que cero"""
+        return self.window_ms > 0
+
+    def current_window_ms(self) -> float:
+        """Ventana actual, ampliada según la carga de los workers"""
+        load = self._load_probe() if self._load_probe else 0.0
+        factor = 1.0 + min(max(load, 0.0), self.MAX_LOAD_FACTOR)
+        return min(self.window_ms * factor, self.max_window_ms)
+
+    def add(self, numero_whatsapp: str, mensaje: str):
+        """Agregar un fragmento y (re)programar el envío del turno agrupado"""
+        self.fragments += 1
+
+        if not self.enabled:
+            self._emit(numero_whatsapp, [mensaje])
+            return
+
+        burst = self._pending.get(numero_whatsapp)
+        if burst is None:
+            burst = _PendingBurst()
+            self._pending[numero_whatsapp] = burst
+        elif burst.timer is not None:
+            burst.timer.cancel()
+
+        burst.fragments.append(mensaje)
+
+        # Debounce acotado: nunca esperar más que la ventana máxima desde el primer fragmento
+        elapsed_ms = (time.monotonic() - burst.first_at) * 1000
+        delay_ms = min(self.current_window_ms(), max(self.max_window_ms - elapsed_ms, 0.0))
+
+        loop = asyncio.get_running_loop()
+        burst.timer = loop.call_later(delay_ms / 1000, self._flush, numero_whatsapp)
+
+    def _flush(self, numero_whatsapp: str):
+        """Enviar el turno agrupado de un número"""
+        burst = self._pending.pop(numero_whatsapp, None)
+        if burst is None:
+            return
+        if burst.timer is not None:
+            burst.timer.cancel()
+        self._emit(numero_whatsapp, burst.fragments)
+
+    def flush_all(self):
+        """Enviar de inmediato todas las ráfagas pendientes (ej: al apagar)"""
+        for numero_whatsapp in list(self._pending):
+            self._flush(numero_whatsapp)
+
+    def _emit(self, numero_whatsapp: str, fragments: List[str]):
+        """Unir fragmentos y entregarlos al destino"""
+        self.turns += 1
+        if len(fragments) > 1:
+            # Cada fragmento unido es un turno (y una posible llamada a la IA) menos
+            self.llm_calls_saved += len(fragments) - 1
+            logger.info(f"🧩 {len(fragments)} mensajes de {numero_whatsapp} agrupados en un turno")
+
+        if not self._sink(numero_whatsapp, self.SEPARATOR.join(fragments)):
+            # El webhook ya respondió 200 por estos mensajes: Twilio no los reenviará
+            self.dropped += 1
+            logger.error(
+                f"❌ Turno agrupado de {numero_whatsapp} descartado: el destino no lo aceptó "
+                f"({len(fragments)} mensajes)"
+            )
+
+    def pending_count(self) -> int:
+        """Número de ráfagas esperando su ventana"""
+        return len(self._pending)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Obtener métricas de agrupación para monitoreo"""
+        return {
+            'enabled': self.enabled,
+            'window_ms': self.window_ms,
+            'current_window_ms': round(self.current_window_ms(), 1) if self.enabled else 0,
+            'max_window_ms': self.max_window_ms,
+            'pending_bursts': len(self._pending),
+            'fragments': self.fragments,
+            'turns': self.turns,
+            'llm_calls_saved': self.llm_calls_saved,
+            'dropped': self.dropped
+        }
@@ -1,7 +1,28 @@
+"""
+Caché de dos niveles: L1 en memoria del proceso delante de Redis (L2)
+
+Las lecturas de claves simples (`get_many` y el estado de conversación) se
+sirven desde el L1 cuando es posible. Cada escritura o borrado publica las
+claves afectadas en CACHE_INVALIDATION_CHANNEL dentro del mismo pipeline, y
+cada worker suscrito las descarta de su L1, así todos ven los mismos datos.
+El TTL del L1 acota lo que puede durar un valor viejo si se pierde un mensaje.
+
+La conexión usa redis.asyncio con un pool de tamaño fijo y timeouts cortos.
+Un circuit breaker deja de intentar Redis después de varios fallos seguidos
+(sin latencia ni errores en el log por cada mensaje) y vuelve a probar
+pasado el cool-down.
+"""
+import asyncio
 import json
 import logging
-from typing import Optional, Dict, Any
+import time
+import uuid
+from typing import Optional, Dict, Any, List, Callable, Awaitable, Iterable
 from datetime import timedelta
+from app.utils.bounded_cache import BoundedTTLCache
+from app.utils.cache_metrics import CacheMetrics
+from app.utils.circuit_breaker import CircuitBreaker, CLOSED
+from app.utils.single_flight import SingleFlight
 from config.settings import settings
 
 logger = logging.getLogger(__name__)
@@ -9,12 +30,48 @@ logger = logging.getLogger(__name__)
 class CacheService:
     """Servicio de caché para optimizar acceso a datos frecuentes"""
     
+    # Datos de usuario: un hash por usuario (user:{id} -> campo -> JSON)
+    USER_DATA_PREFIX = "user:"
+    # Estado ligero de conversación (conversation:{id})
+    CONVERSATION_STATE_PREFIX = "conversation:"
+    # Resumen del cliente para el prompt de la IA (client_profile:{id})
+    CLIENT_PROFILE_PREFIX = "client_profile:"
+    
     def __init__(self):
         self.redis: Optional[Any] = None
+        self._pool: Optional[Any] = None
         self.enabled = settings.REDIS_ENABLED
         self.default_ttl = timedelta(hours=2)  # TTL por defecto de 2 horas
         self.redis_available = False
         
+        # L1 en memoria (valores JSON tal como están en Redis)
+        self.local = BoundedTTLCache(
+            max_entries=settings.CACHE_L1_MAX_ENTRIES,
+            ttl_seconds=settings.CACHE_L1_TTL,
+            name="cache_l1"
+        )
+        self.instance_id = uuid.uuid4().hex
+        self.invalidation_channel = settings.CACHE_INVALIDATION_CHANNEL
+        self._invalidation_task: Optional[asyncio.Task] = None
+        self._invalidation_listeners: List[Callable[[Optional[List[str]]], None]] = []
+        # Cambia con cada invalidación; evita guardar en L1 lecturas que quedaron viejas
+        self._invalidation_generation = 0
+        
+        # Evita esperar timeouts en cada llamada mientras Redis está caído
+        self.breaker = CircuitBreaker(
+            failure_threshold=settings.REDIS_BREAKER_FAILURE_THRESHOLD,
+            reset_timeout=settings.REDIS_BREAKER_RESET_TIMEOUT,
+            name="redis"
+        )
+        
+        # Una sola recarga por clave cuando un valor sale del caché
+        self.single_flight = SingleFlight(name="cache")
+        
+        # Métricas
+        self.metrics = CacheMetrics()
+        self.invalidations_published = 0
+        self.invalidations_received = 0
+        
     async def connect(self):
         """Conectar al servidor Redis"""
         if not self.enabled:
@@ -22,68 +79,92 @@ class CacheService:
             return
             
         try:
-            # Intentar importar aioredis de forma segura
-            try:
-                import aioredis
-            except ImportError as e:
-                logger.warning(f"⚠️ aioredis no disponible: {e}. Continuando sin Redis.")
-                self.enabled = False
-                return
-            
-            self.redis = aioredis.from_url(
-                settings.REDIS_URL,
-                encoding="utf-8",
-                decode_responses=True,
-                socket_connect_timeout=5,
-                socket_timeout=5,
-                retry_on_timeout=True,
-                health_check_interval=30
-            )
-            
-            # Probar conexión
-            await self.redis.ping()
-            self.redis_available = True
-            logger.info("✅ Conectado a Redis para caché")
-            
+            import redis.asyncio as redis_asyncio
         except ImportError as e:
             logger.warning(f"⚠️ Módulos de Redis no disponibles: {e}. Continuando sin caché distribuido.")
             self.enabled = False
-            self.redis = None
-        except Exception as e:
-            logger.warning(f"⚠️ No se pudo conectar a Redis: {e}. Continuando sin caché distribuido.")
-            self.enabled = False
-            self.redis = None
-            self.redis_available = False
+            return
+            
+        # Pool con tope de conexiones: si se llena, se espera como máximo un timeout
+        self._pool = redis_asyncio.BlockingConnectionPool.from_url(
+            settings.REDIS_URL,
+            max_connections=settings.REDIS_MAX_CONNECTIONS,
+            timeout=settings.REDIS_SOCKET_TIMEOUT,
+            decode_responses=True,
+            socket_connect_timeout=settings.REDIS_CONNECT_TIMEOUT,
+            socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+            health_check_interval=30
+        )
+        self.redis = redis_asyncio.Redis(connection_pool=self._pool)
+        self.breaker.reset()
+        
+        # Escuchar las invalidaciones del L1 publicadas por otros workers
+        self.start_invalidation_listener()
+        
+        if await self.ping():
+            logger.info(f"✅ Conectado a Redis para caché (pool de {settings.REDIS_MAX_CONNECTIONS} conexiones)")
+        else:
+            # El circuit breaker reintenta solo; no hace falta reiniciar la app
+            self.breaker.trip()
+            logger.warning(
+                f"⚠️ No se pudo conectar a Redis. Continuando sin caché distribuido; "
+                f"se reintentará en {self.breaker.reset_timeout}s."
+            )
     
     async def disconnect(self):
         """Desconectar del servidor Redis"""
+        await self.stop_invalidation_listener()
         if self.redis:
             try:
-                await self.redis.close()
+                await self.redis.aclose()
+                if self._pool is not None:
+                    await self._pool.disconnect()
                 logger.info("🔌 Desconectado de Redis")
             except Exception as e:
                 logger.warning(f"⚠️ Error desconectando Redis: {e}")
             finally:
                 self.redis = None
+                self._pool = None
                 self.redis_available = False
     
-    async def get_conversation_state(self, user_id: str) -> Optional[Dict[str, Any]]:
-        """Obtener estado de conversación desde caché"""
-        if not self.enabled or not self.redis:
-            return None
-            
+    def _usable(self) -> bool:
+        """Redis habilitado, conectado y con el circuito cerrado (o en prueba)"""
+        return self.enabled and self.redis is not None and self.breaker.allow()
+    
+    async def _call(self, awaitable: Any, keys: Iterable[str] = (), operation: str = 'read') -> Any:
+        """
+        Ejecutar un comando de Redis registrando el resultado en el circuit breaker
+        y la latencia (o el error) en las métricas del keyspace de `keys`.
+        """
+        started_at = time.perf_counter()
         try:
-            key = f"conversation:{user_id}"
-            cached_data = await self.redis.get(key)
-            
-            if cached_data:
-                logger.debug(f"🎯 Estado de conversación encontrado en caché para {user_id}")
-                return json.loads(cached_data)
-                
+            result = await awaitable
         except Exception as e:
-            logger.error(f"❌ Error obteniendo estado de caché para {user_id}: {e}")
-            
-        return None
+            self.metrics.record_error(keys, operation)
+            if self.breaker.record_failure(e):
+                self.redis_available = False
+                # Sin Redis tampoco llegan invalidaciones: el L1 ya no es confiable
+                self._forget_local(None, notify=True)
+                logger.warning(
+                    f"⚡ Circuito de Redis abierto tras {self.breaker.consecutive_failures} fallos; "
+                    f"se omite Redis durante {self.breaker.reset_timeout}s"
+                )
+            raise
+        
+        self.metrics.record_latency(keys, operation, time.perf_counter() - started_at)
+        if self.breaker.state != CLOSED:
+            logger.info("✅ Redis respondió de nuevo; circuito cerrado")
+        self.breaker.record_success()
+        self.redis_available = True
+        return result
+    
+    async def get_conversation_state(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """Obtener estado de conversación desde caché (L1 y luego Redis)"""
+        key = self.conversation_key(user_id)
+        cached_data = (await self.get_many([key])).get(key)
+        if cached_data:
+            logger.debug(f"🎯 Estado de conversación encontrado en caché para {user_id}")
+        return cached_data
     
     async def set_conversation_state(
         self, 
@@ -92,53 +173,49 @@ class CacheService:
         ttl: Optional[timedelta] = None
     ):
         """Guardar estado de conversación en caché"""
-        if not self.enabled or not self.redis:
-            return
-            
-        try:
-            key = f"conversation:{user_id}"
-            ttl_seconds = int((ttl or self.default_ttl).total_seconds())
-            
-            await self.redis.setex(
-                key,
-                ttl_seconds,
-                json.dumps(state_data, default=str)
-            )
-            
+        if await self.set_many({self.conversation_key(user_id): state_data}, ttl=ttl):
             logger.debug(f"💾 Estado de conversación guardado en caché para {user_id}")
-            
-        except Exception as e:
-            logger.error(f"❌ Error guardando estado en caché para {user_id}: {e}")
     
     async def delete_conversation_state(self, user_id: str):
         """Eliminar estado de conversación del caché"""
-        if not self.enabled or not self.redis:
-            return
-            
-        try:
-            key = f"conversation:{user_id}"
-            await self.redis.delete(key)
-            logger.debug(f"🗑️ Estado de conversación eliminado del caché para {user_id}")
-            
-        except Exception as e:
-            logger.error(f"❌ Error eliminando estado de caché para {user_id}: {e}")
+        await self.delete_many([self.conversation_key(user_id)])
+        logger.debug(f"🗑️ Estado de conversación eliminado del caché para {user_id}")
+    
+    def conversation_key(self, user_id: str) -> str:
+        """Clave del estado ligero de conversación de un usuario"""
+        return f"{self.CONVERSATION_STATE_PREFIX}{user_id}"
+    
+    def client_profile_key(self, user_id: str) -> str:
+        """Clave del resumen del cliente que se agrega al prompt de la IA"""
+        return f"{self.CLIENT_PROFILE_PREFIX}{user_id}"
+    
+    def _user_key(self, user_id: str) -> str:
+        return f"{self.USER_DATA_PREFIX}{user_id}"
     
     async def get_user_data(self, user_id: str, data_key: str) -> Optional[Any]:
         """Obtener datos de usuario específicos desde caché"""
-        if not self.enabled or not self.redis:
-            return None
+        values = await self.get_user_data_many(user_id, [data_key])
+        return values.get(data_key)
+    
+    async def get_user_data_many(self, user_id: str, data_keys: List[str]) -> Dict[str, Any]:
+        """Obtener varios campos de datos de un usuario con un solo HMGET"""
+        if not data_keys or not self._usable():
+            return {}
             
         try:
-            key = f"user:{user_id}:{data_key}"
-            cached_data = await self.redis.get(key)
+            key = self._user_key(user_id)
+            values = await self._call(self.redis.hmget(key, data_keys), [key])
+            for value in values:
+                self.metrics.record_lookup(key, 'redis', value is not None)
+            return {
+                data_key: json.loads(value)
+                for data_key, value in zip(data_keys, values)
+                if value is not None
+            }
             
-            if cached_data:
-                return json.loads(cached_data)
-                
         except Exception as e:
-            logger.error(f"❌ Error obteniendo datos de usuario {user_id}:{data_key}: {e}")
-            
-        return None
+            logger.error(f"❌ Error obteniendo datos de usuario {user_id}:{data_keys}: {e}")
+            return {}
     
     async def set_user_data(
         self, 
@@ -148,40 +225,462 @@ class CacheService:
         ttl: Optional[timedelta] = None
     ):
         """Guardar datos de usuario en caché"""
-        if not self.enabled or not self.redis:
+        await self.set_user_data_many(user_id, {data_key: data}, ttl)
+    
+    async def set_user_data_many(
+        self,
+        user_id: str,
+        data: Dict[str, Any],
+        ttl: Optional[timedelta] = None
+    ):
+        """
+        Guardar varios campos de datos de un usuario (HSET + EXPIRE en un pipeline).
+        El TTL aplica al hash completo y se renueva en cada escritura.
+        """
+        if not data or not self._usable():
             return
             
         try:
-            key = f"user:{user_id}:{data_key}"
+            key = self._user_key(user_id)
             ttl_seconds = int((ttl or self.default_ttl).total_seconds())
+            pipe = self.redis.pipeline()
+            pipe.hset(key, mapping={
+                data_key: json.dumps(value, default=str)
+                for data_key, value in data.items()
+            })
+            pipe.expire(key, ttl_seconds)
+            await self._call(pipe.execute(), [key], 'write')
+            
+        except Exception as e:
+            logger.error(f"❌ Error guardando datos de usuario {user_id}:{list(data)}: {e}")
+    
+    async def delete_user_data(self, user_id: str, *data_keys: str):
+        """Eliminar campos de datos de un usuario"""
+        if not data_keys or not self._usable():
+            return
+            
+        try:
+            key = self._user_key(user_id)
+            await self._call(self.redis.hdel(key, *data_keys), [key], 'delete')
+            
+        except Exception as e:
+            logger.error(f"❌ Error eliminando datos de usuario {user_id}:{data_keys}: {e}")
+    
+    async def get_many(self, keys: List[str]) -> Dict[str, Any]:
+        """
+        Obtener varias claves: primero del L1 y las que falten con un solo MGET.
+        Retorna solo las claves encontradas (valores ya decodificados de JSON).
+        """
+        if not keys or not self._usable():
+            return {}
+        
+        result: Dict[str, Any] = {}
+        misses: List[str] = []
+        for key in keys:
+            raw = self.local.get(key)
+            self.metrics.record_lookup(key, 'l1', raw is not None)
+            if raw is None:
+                misses.append(key)
+            else:
+                result[key] = json.loads(raw)
+        if not misses:
+            return result
+            
+        try:
+            generation = self._invalidation_generation
+            values = await self._call(self.redis.mget(misses), misses)
+            # Si llegó una invalidación durante el MGET, no guardar en L1 lo leído
+            fresh = generation == self._invalidation_generation
+            for key, value in zip(misses, values):
+                self.metrics.record_lookup(key, 'redis', value is not None)
+                if value is None:
+                    continue
+                if fresh:
+                    self.local.set(key, value)
+                result[key] = json.loads(value)
+            
+        except Exception as e:
+            logger.error(f"❌ Error en MGET de {len(misses)} claves: {e}")
+            
+        return result
+    
+    async def set_many(
+        self,
+        values: Dict[str, Any],
+        ttl: Optional[timedelta] = None,
+        ttls: Optional[Dict[str, timedelta]] = None
+    ) -> bool:
+        """
+        Guardar varias claves en un solo viaje (pipeline de SETEX + aviso de invalidación).
+        `ttls` permite un TTL distinto por clave; el resto usa `ttl` o el TTL por defecto.
+        """
+        if not values or not self._usable():
+            return False
+            
+        encoded = {key: json.dumps(value, default=str) for key, value in values.items()}
+        try:
+            ttls = ttls or {}
+            pipe = self.redis.pipeline(transaction=False)
+            for key, raw in encoded.items():
+                ttl_seconds = int((ttls.get(key) or ttl or self.default_ttl).total_seconds())
+                pipe.setex(key, ttl_seconds, raw)
+            self._publish_invalidation(pipe, list(encoded))
+            await self._call(pipe.execute(), encoded, 'write')
+            
+        except Exception as e:
+            logger.error(f"❌ Error guardando {len(values)} claves en pipeline: {e}")
+            self._forget_local(list(encoded))
+            return False
+        
+        for key, raw in encoded.items():
+            self.local.set(key, raw)
+        return True
+    
+    async def delete_many(self, keys: List[str]):
+        """Eliminar varias claves con un solo DEL (y avisar a los demás workers)"""
+        if not keys:
+            return
+            
+        # También sin Redis: get_or_load pudo guardar estas claves solo en el L1
+        self._forget_local(keys)
+        if not self._usable():
+            return
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.delete(*keys)
+            self._publish_invalidation(pipe, keys)
+            await self._call(pipe.execute(), keys, 'delete')
             
-            await self.redis.setex(
-                key,
-                ttl_seconds,
-                json.dumps(data, default=str)
+        except Exception as e:
+            logger.error(f"❌ Error eliminando {len(keys)} claves: {e}")
+    
+    async def get_or_load(
+        self,
+        key: str,
+        loader: Callable[[], Awaitable[Any]],
+        ttl: Optional[timedelta] = None,
+        cached: Optional[Dict[str, Any]] = None
+    ) -> Any:
+        """
+        Obtener una clave del caché o cargarla con `loader` y guardarla.
+        Las peticiones concurrentes con la misma clave comparten una sola carga
+        (single-flight). Sin Redis, el valor cargado queda solo en el L1 del
+        proceso (con el TTL del L1 como máximo) y se sigue compartiendo.
+        `cached` es una lectura en lote que ya incluyó `key` (evita otro MGET).
+        El loader puede terminar después de que el llamador se cancele: no debe
+        usar la sesión de BD de la petición.
+        """
+        if not self._usable():
+            raw = self.local.get(key)
+            if raw is not None:
+                return json.loads(raw)
+        else:
+            if cached is None:
+                cached = await self.get_many([key])
+            if key in cached:
+                return cached[key]
+        
+        async def load_and_store() -> Any:
+            value = await loader()
+            if not await self.set_many({key: value}, ttl=ttl):
+                self._set_local(key, value, ttl)
+            return value
+        
+        return await self.single_flight.do(key, load_and_store)
+    
+    def _set_local(self, key: str, value: Any, ttl: Optional[timedelta] = None):
+        """Guardar un valor solo en el L1 (sin Redis no llegan invalidaciones: TTL corto)"""
+        ttl_seconds = self.local.ttl_seconds
+        if ttl is not None:
+            ttl_seconds = min(ttl_seconds, ttl.total_seconds())
+        self.local.set(key, json.dumps(value, default=str), ttl_seconds=ttl_seconds)
+    
+    async def set_if_absent(self, key: str, value: Any, ttl: Optional[timedelta] = None) -> Optional[bool]:
+        """
+        Guardar una clave solo si no existe (SET NX EX).
+        Retorna True si se guardó, False si ya existía y None si Redis no está disponible.
+        """
+        if not self._usable():
+            return None
+            
+        try:
+            ttl_seconds = int((ttl or self.default_ttl).total_seconds())
+            result = await self._call(
+                self.redis.set(key, json.dumps(value, default=str), ex=ttl_seconds, nx=True),
+                [key], 'write'
             )
+            return bool(result)
             
         except Exception as e:
-            logger.error(f"❌ Error guardando datos de usuario {user_id}:{data_key}: {e}")
+            logger.error(f"❌ Error en SET NX para {key}: {e}")
+            return None
     
-    async def invalidate_user_cache(self, user_id: str):
-        """Invalidar todo el caché de un usuario"""
-        if not self.enabled or not self.redis:
+    async def delete_key(self, key: str):
+        """Eliminar una clave del caché"""
+        if not self._usable():
             return
             
         try:
-            # Buscar todas las claves relacionadas al usuario
-            patterns = [f"conversation:{user_id}", f"user:{user_id}:*"]
+            await self._call(self.redis.delete(key), [key], 'delete')
+            
+        except Exception as e:
+            logger.error(f"❌ Error eliminando clave {key}: {e}")
+    
+    # Estado de conversación como almacén primario (modo write-behind)
+    CONVERSATION_SNAPSHOT_PREFIX = "conversation_state:"
+    CONVERSATION_DIRTY_SET = "conversation_state:dirty"
+    
+    async def save_conversation_snapshot(self, user_id: str, snapshot: Dict[str, Any], ttl: timedelta) -> bool:
+        """
+        Guardar el estado completo de una conversación y marcarla como pendiente
+        de escribir en la base de datos. Retorna False si Redis no está disponible.
+        """
+        if not self._usable():
+            return False
+            
+        try:
+            key = f"{self.CONVERSATION_SNAPSHOT_PREFIX}{user_id}"
+            pipe = self.redis.pipeline()
+            pipe.setex(key, int(ttl.total_seconds()), json.dumps(snapshot, default=str))
+            pipe.sadd(self.CONVERSATION_DIRTY_SET, user_id)
+            await self._call(pipe.execute(), [key], 'write')
+            return True
+            
+        except Exception as e:
+            logger.error(f"❌ Error guardando snapshot de conversación para {user_id}: {e}")
+            return False
+    
+    async def get_conversation_snapshot(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """Obtener el estado completo de una conversación guardado en modo write-behind"""
+        snapshots = await self.get_conversation_snapshots([user_id])
+        return snapshots.get(user_id)
+    
+    async def get_conversation_snapshots(self, user_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Obtener varios snapshots de conversación con un solo MGET"""
+        if not user_ids or not self._usable():
+            return {}
+            
+        try:
+            keys = [f"{self.CONVERSATION_SNAPSHOT_PREFIX}{user_id}" for user_id in user_ids]
+            values = await self._call(self.redis.mget(keys), keys)
+            for key, value in zip(keys, values):
+                self.metrics.record_lookup(key, 'redis', bool(value))
+            return {
+                user_id: json.loads(value)
+                for user_id, value in zip(user_ids, values)
+                if value
+            }
+            
+        except Exception as e:
+            logger.error(f"❌ Error obteniendo snapshots de conversación: {e}")
+            return {}
+    
+    async def pop_dirty_conversations(self, count: int) -> List[str]:
+        """Tomar (y quitar) hasta `count` conversaciones pendientes de escribir"""
+        if not self._usable():
+            return []
+            
+        try:
+            return list(await self._call(
+                self.redis.spop(self.CONVERSATION_DIRTY_SET, count), [self.CONVERSATION_DIRTY_SET], 'write'
+            ) or [])
+            
+        except Exception as e:
+            logger.error(f"❌ Error obteniendo conversaciones pendientes: {e}")
+            return []
+    
+    async def mark_conversations_dirty(self, user_ids: List[str]) -> bool:
+        """Volver a marcar conversaciones como pendientes (ej: si falló la escritura)"""
+        if not user_ids or not self._usable():
+            return False
+            
+        try:
+            await self._call(
+                self.redis.sadd(self.CONVERSATION_DIRTY_SET, *user_ids), [self.CONVERSATION_DIRTY_SET], 'write'
+            )
+            return True
+            
+        except Exception as e:
+            logger.error(f"❌ Error marcando conversaciones pendientes: {e}")
+            return False
+    
+    async def count_dirty_conversations(self) -> int:
+        """Número de conversaciones pendientes de escribir en la base de datos"""
+        if not self._usable():
+            return 0
+            
+        try:
+            return int(await self._call(
+                self.redis.scard(self.CONVERSATION_DIRTY_SET), [self.CONVERSATION_DIRTY_SET]
+            ))
+            
+        except Exception as e:
+            logger.error(f"❌ Error contando conversaciones pendientes: {e}")
+            return 0
+    
+    async def discard_conversation_snapshots(self, user_ids: List[str]) -> bool:
+        """Eliminar snapshots (y su marca de pendiente) que quedaron obsoletos"""
+        if not user_ids or not self._usable():
+            return False
+            
+        try:
+            keys = [f"{self.CONVERSATION_SNAPSHOT_PREFIX}{user_id}" for user_id in user_ids]
+            pipe = self.redis.pipeline()
+            pipe.delete(*keys)
+            pipe.srem(self.CONVERSATION_DIRTY_SET, *user_ids)
+            await self._call(pipe.execute(), keys, 'delete')
+            return True
+            
+        except Exception as e:
+            logger.error(f"❌ Error eliminando snapshots de conversación: {e}")
+            return False
+    
+    async def ping(self) -> bool:
+        """Verificar si Redis responde"""
+        if not self._usable():
+            return False
+            
+        try:
+            return bool(await self._call(self.redis.ping()))
             
-            for pattern in patterns:
-                keys = await self.redis.keys(pattern)
-                if keys:
-                    await self.redis.delete(*keys)
+        except Exception:
+            return False
+    
+    async def info(self) -> Dict[str, Any]:
+        """Información del servidor Redis (INFO); vacío si no está disponible"""
+        if not self._usable():
+            return {}
             
+        try:
+            return dict(await self._call(self.redis.info()))
+            
+        except Exception as e:
+            logger.warning(f"⚠️ Error obteniendo INFO de Redis: {e}")
+            return {}
+    
+    async def invalidate_user_cache(self, user_id: str):
+        """Invalidar todo el caché de un usuario (claves conocidas, sin recorrer el keyspace)"""
+        try:
+            await self.delete_many([
+                self.conversation_key(user_id), self._user_key(user_id), self.client_profile_key(user_id)
+            ])
             logger.debug(f"🧹 Caché invalidado para usuario {user_id}")
             
         except Exception as e:
             logger.error(f"❌ Error invalidando caché para {user_id}: {e}")
+    
+    # ------------------------------------------------------------------
+    # Invalidación del L1 entre workers (pub/sub)
+    # ------------------------------------------------------------------
+    def add_invalidation_listener(self, callback: Callable[[Optional[List[str]]], None]):
+        """
+        Registrar una función que recibe las claves invalidadas por otros workers
+        (None significa que hay que descartar todo).
+        """
+        self._invalidation_listeners.append(callback)
+    
+    def _publish_invalidation(self, pipe: Any, keys: List[str]):
+        """Agregar al pipeline el aviso de invalidación de `keys`"""
+        pipe.publish(
+            self.invalidation_channel,
+            json.dumps({'origin': self.instance_id, 'keys': keys})
+        )
+        self.invalidations_published += 1
+    
+    def _forget_local(self, keys: Optional[List[str]], notify: bool = False):
+        """Descartar claves del L1 (todas si `keys` es None)"""
+        self._invalidation_generation += 1
+        if keys is None:
+            self.local.clear()
+        else:
+            for key in keys:
+                self.local.delete(key)
+        if not notify:
+            return
+        for callback in self._invalidation_listeners:
+            try:
+                callback(keys)
+            except Exception as e:
+                logger.warning(f"⚠️ Error en listener de invalidación: {e}")
+    
+    def handle_invalidation(self, data: Any):
+        """Aplicar un aviso de invalidación recibido por el canal"""
+        try:
+            payload = json.loads(data)
+        except (TypeError, ValueError):
+            logger.warning(f"⚠️ Aviso de invalidación inválido: {data!r}")
+            return
+        if payload.get('origin') == self.instance_id:
+            return
+        self.invalidations_received += 1
+        self._forget_local(list(payload.get('keys') or []), notify=True)
+    
+    def start_invalidation_listener(self):
+        """Iniciar la suscripción al canal de invalidaciones"""
+        if not self.enabled or self.redis is None:
+            return
+        if self._invalidation_task and not self._invalidation_task.done():
+            return
+        self._invalidation_task = asyncio.create_task(self._listen_invalidations())
+    
+    async def stop_invalidation_listener(self):
+        """Detener la suscripción al canal de invalidaciones"""
+        task, self._invalidation_task = self._invalidation_task, None
+        if task and not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+    
+    async def _listen_invalidations(self):
+        """Recibir avisos de invalidación; se resuscribe si se corta la conexión"""
+        failures = 0
+        while True:
+            pubsub = None
+            try:
+                pubsub = self.redis.pubsub()
+                await pubsub.subscribe(self.invalidation_channel)
+                # Mientras no hubo suscripción se pudieron perder avisos
+                self._forget_local(None, notify=True)
+                failures = 0
+                logger.info(f"📡 Suscrito a invalidaciones de caché en '{self.invalidation_channel}'")
+                
+                while True:
+                    message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                    if message and message.get('type') == 'message':
+                        self.handle_invalidation(message.get('data'))
+                        
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                failures += 1
+                if failures == 1:
+                    logger.warning(f"⚠️ Suscripción de invalidaciones interrumpida: {e}. Reintentando...")
+                # Con Redis caído, reintentar al ritmo del circuit breaker
+                await asyncio.sleep(1 if failures == 1 else self.breaker.reset_timeout)
+            finally:
+                if pubsub is not None:
+                    try:
+                        await pubsub.aclose()
+                    except Exception:
+                        pass
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Obtener métricas del caché de dos niveles para monitoreo"""
+        return {
+            'l1': self.local.get_stats(),
+            'invalidation_channel': self.invalidation_channel,
+            'invalidation_listener_running': bool(
+                self._invalidation_task and not self._invalidation_task.done()
+            ),
+            'invalidations_published': self.invalidations_published,
+            'invalidations_received': self.invalidations_received,
+            'pool_max_connections': settings.REDIS_MAX_CONNECTIONS,
+            'single_flight': self.single_flight.get_stats(),
+            'keyspaces': self.metrics.get_stats(),
+            'circuit_breaker': self.breaker.get_stats()
+        }
 
 # Instancia global del servicio de caché
 cache_service = CacheService()
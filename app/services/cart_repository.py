@@ -0,0 +1,223 @@
+"""
+Carrito normalizado de la conversación
+
+Cada línea del carrito es una fila de `carrito_items` (una por pizza y
+tamaño), así que agregar, quitar o cambiar la cantidad es una sola
+sentencia en lugar de decodificar y reescribir el JSON completo de
+`datos_temporales`. El resumen del pedido sale de una sola consulta por el
+índice de `numero_whatsapp`.
+
+Los carritos guardados con el formato anterior (clave 'carrito' en los
+datos temporales) se migran a la tabla la primera vez que se accede a ellos.
+"""
+import logging
+from typing import Optional, Dict, Any, List, Tuple
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app.models.carrito_item import CarritoItem
+from app.services.conversation_context import ConversationContext
+from app.services.order_parser import ParsedItem
+
+logger = logging.getLogger(__name__)
+
+# Clave del carrito en el formato anterior (JSON en datos_temporales)
+LEGACY_CART_KEY = 'carrito'
+
+
+class CartRepository:
+    """Operaciones sobre el carrito de un número de WhatsApp"""
+
+    def __init__(self, db: Session, numero_whatsapp: str):
+        self.db = db
+        self.numero_whatsapp = numero_whatsapp
+
+    def _lines(self):
+        return self.db.query(CarritoItem).filter(CarritoItem.numero_whatsapp == self.numero_whatsapp)
+
+    def _line(self, pizza_id: int, tamano: str):
+        return self._lines().filter(CarritoItem.pizza_id == pizza_id, CarritoItem.tamano == tamano)
+
+    def _flush(self):
+        """
+        Enviar los cambios con flush; el commit lo hace la unidad de trabajo del turno,
+        así que si el turno falla el carrito vuelve atrás junto con el estado.
+        Fuera de un turno (scripts, llamadas sueltas) se confirma en cada cambio,
+        igual que el contexto transitorio de la conversación.
+        """
+        self.db.flush()
+        if ConversationContext.current(self.db, self.numero_whatsapp) is None:
+            self.db.commit()
+
+    # ------------------------------------------------------------------
+    # Escritura: una sentencia por operación
+    # ------------------------------------------------------------------
+    def _update_line(self, pizza_id: int, tamano: str, precio: float, cantidad: int) -> int:
+        """Sumar la cantidad a la línea si existe; retorna las filas actualizadas"""
+        return self._line(pizza_id, tamano).update(
+            {CarritoItem.cantidad: CarritoItem.cantidad + cantidad, CarritoItem.precio: precio},
+            synchronize_session=False
+        )
+
+    def _new_line(
+        self,
+        pizza_id: int,
+        pizza_nombre: str,
+        tamano: str,
+        precio: float,
+        cantidad: int,
+        pizza_emoji: Optional[str]
+    ) -> CarritoItem:
+        return CarritoItem(
+            numero_whatsapp=self.numero_whatsapp,
+            pizza_id=pizza_id,
+            pizza_nombre=pizza_nombre,
+            pizza_emoji=pizza_emoji or '🍕',
+            tamano=tamano,
+            precio=precio,
+            cantidad=cantidad
+        )
+
+    def _stage_add(
+        self,
+        pizza_id: int,
+        pizza_nombre: str,
+        tamano: str,
+        precio: float,
+        cantidad: int,
+        pizza_emoji: Optional[str]
+    ):
+        """Sumar a la línea existente o crearla (sin flush ni commit)"""
+        if not self._update_line(pizza_id, tamano, precio, cantidad):
+            self.db.add(self._new_line(pizza_id, pizza_nombre, tamano, precio, cantidad, pizza_emoji))
+
+    def add(
+        self,
+        pizza_id: int,
+        pizza_nombre: str,
+        tamano: str,
+        precio: float,
+        cantidad: int = 1,
+        pizza_emoji: Optional[str] = None
+    ):
+        """Agregar pizzas al carrito; si la línea ya existe se suma la cantidad"""
+        cantidad = max(int(cantidad), 1)
+        precio = float(precio)
+        if not self._update_line(pizza_id, tamano, precio, cantidad):
+            try:
+                # SAVEPOINT: si otro mensaje creó la misma línea al mismo tiempo,
+                # se deshace solo este INSERT y no el resto del turno
+                with self.db.begin_nested():
+                    self.db.add(self._new_line(pizza_id, pizza_nombre, tamano, precio, cantidad, pizza_emoji))
+                    self.db.flush()
+            except IntegrityError:
+                self._update_line(pizza_id, tamano, precio, cantidad)
+        self._flush()
+
+    def add_many(self, lines: List[Dict[str, Any]]) -> int:
+        """Agregar varias líneas con un solo flush (se suman a las existentes)"""
+        return self.import_items(lines)
+
+    def remove(self, pizza_id: int, tamano: Optional[str] = None) -> int:
+        """Quitar una pizza (de un tamaño o de todos); retorna las líneas eliminadas"""
+        query = self._line(pizza_id, tamano) if tamano else self._lines().filter(CarritoItem.pizza_id == pizza_id)
+        removed = query.delete(synchronize_session=False)
+        self._flush()
+        return removed
+
+    def set_quantity(self, pizza_id: int, tamano: str, cantidad: int) -> bool:
+        """Fijar la cantidad de una línea (0 la elimina); retorna False si no existe"""
+        if cantidad <= 0:
+            return self.remove(pizza_id, tamano) > 0
+        updated = self._line(pizza_id, tamano).update(
+            {CarritoItem.cantidad: int(cantidad)},
+            synchronize_session=False
+        )
+        self._flush()
+        return updated > 0
+
+    def clear(self) -> int:
+        """Vaciar el carrito; retorna las líneas eliminadas"""
+        removed = self._lines().delete(synchronize_session=False)
+        self._flush()
+        return removed
+
+    # ------------------------------------------------------------------
+    # Lectura
+    # ------------------------------------------------------------------
+    def items(self) -> List[Dict[str, Any]]:
+        """Líneas del carrito en el orden en que se agregaron"""
+        return [
+            {
+                'pizza_id': item.pizza_id,
+                'pizza_nombre': item.pizza_nombre,
+                'pizza_emoji': item.pizza_emoji or '🍕',
+                'tamano': item.tamano,
+                'precio': item.precio,
+                'cantidad': item.cantidad
+            }
+            for item in self._lines().order_by(CarritoItem.id).all()
+        ]
+
+    def total(self) -> float:
+        """Total del carrito calculado por la base de datos"""
+        total = self.db.query(
+            func.coalesce(func.sum(CarritoItem.precio * CarritoItem.cantidad), 0.0)
+        ).filter(CarritoItem.numero_whatsapp == self.numero_whatsapp).scalar()
+        return float(total or 0.0)
+
+    def is_empty(self) -> bool:
+        """Indica si el carrito no tiene líneas"""
+        return self._lines().first() is None
+
+    # ------------------------------------------------------------------
+    # Migración del formato anterior
+    # ------------------------------------------------------------------
+    def import_items(self, carrito: List[Dict[str, Any]]) -> int:
+        """Cargar un carrito en formato JSON con un solo flush; retorna las líneas escritas"""
+        lines: Dict[Tuple[int, str], Dict[str, Any]] = {}
+        for item in carrito or []:
+            if not isinstance(item, dict) or item.get('pizza_id') is None or 'precio' not in item:
+                continue
+            key = (item['pizza_id'], item.get('tamano', 'mediana'))
+            line = lines.setdefault(key, {**item, 'cantidad': 0})
+            line['cantidad'] += int(item.get('cantidad', 1) or 1)
+
+        for (pizza_id, tamano), item in lines.items():
+            self._stage_add(
+                pizza_id,
+                item.get('pizza_nombre') or item.get('nombre', ''),
+                tamano,
+                float(item['precio']),
+                item['cantidad'],
+                item.get('pizza_emoji')
+            )
+        self._flush()
+        return len(lines)
+
+
+def get_cart(db: Session, numero_whatsapp: str) -> CartRepository:
+    """Carrito del número, migrando primero el carrito JSON si todavía existe"""
+    cart = CartRepository(db, numero_whatsapp)
+    conversation = ConversationContext.for_number(db, numero_whatsapp)
+    legacy = conversation.get_value(LEGACY_CART_KEY)
+    if legacy is not None:
+        if legacy:
+            migrated = cart.import_items(legacy)
+            logger.info(f"🛒 Carrito de {numero_whatsapp} migrado a carrito_items ({migrated} líneas)")
+        # La migración y la clave quitada se escriben juntas al cerrar el turno
+        conversation.pop_value(LEGACY_CART_KEY)
+    return cart
+
+
+def add_parsed_items(cart: CartRepository, items: List[ParsedItem]) -> Tuple[List[ParsedItem], List[ParsedItem]]:
+    """
+    Agregar las líneas leídas que tienen tamaño (un solo flush) y retornar
+    (agregadas, sin tamaño). Las líneas completas no esperan a las que falta
+    preguntar, en todos los flujos que leen pedidos sin IA.
+    """
+    agregados = [item for item in items if item.tamano]
+    sin_tamano = [item for item in items if not item.tamano]
+    if agregados:
+        cart.add_many([item.to_cart_line() for item in agregados])
+    return agregados, sin_tamano
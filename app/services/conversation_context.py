@@ -0,0 +1,586 @@
+"""
+Contexto de conversación como unidad de trabajo por turno
+
+Un turno del bot leía y escribía `ConversationState` muchas veces (cada
+get/set volvía a consultar la fila, parsear el JSON y hacer commit).
+`ConversationContext` carga el `Cliente` y el `ConversationState` una sola
+vez, mantiene estado y datos temporales en memoria y los escribe con un
+único commit al final del turno.
+
+Uso:
+    async with conversation_unit_of_work(db, numero) as ctx:
+        ...  # bot y handlers comparten `ctx` a través de la sesión
+
+Fuera de un turno (scripts, tests, llamadas sueltas) los helpers usan un
+contexto transitorio que escribe en cada cambio, igual que antes.
+
+La escritura es compare-and-swap sobre `ConversationState.version`: si otro
+worker cambió la fila desde que se leyó, se vuelve a leer, se reaplican los
+cambios del turno (no el estado completo) y se reintenta.
+"""
+import copy
+import json
+import logging
+from collections import deque
+from typing import Optional, Dict, Any, List, Tuple, Deque
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.exc import StaleDataError
+from app.models.cliente import Cliente
+from app.models.conversation_state import ConversationState
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Clave en `Session.info` donde se registran los contextos activos por número
+SESSION_INFO_KEY = "conversation_contexts"
+
+# Marca en `Session.info` de una sesión con escrituras enviadas con flush y sin commit
+PENDING_WRITES_KEY = "pending_writes"
+
+ESTADO_INICIAL = 'inicio'
+
+# Historial de turnos: ring buffer de entradas [rol, texto] ('u' usuario, 'b' bot)
+HISTORY_MAX_ENTRIES = settings.CONVERSATION_HISTORY_TURNS * 2
+HISTORY_MAX_CHARS = settings.CONVERSATION_HISTORY_MAX_CHARS
+HISTORY_ROLES = {'u': 'user', 'b': 'bot'}
+
+
+class ConversationContext:
+    """Estado y datos temporales de una conversación cargados una vez por turno"""
+
+    # Reintentos ante conflicto de versión antes de propagar el error
+    MAX_CONFLICT_RETRIES = settings.CONVERSATION_CAS_MAX_RETRIES
+
+    # Métricas de concurrencia del proceso
+    conflicts = 0
+    conflicts_unresolved = 0
+
+    def __init__(self, db: Session, numero_whatsapp: str, write_through: bool = False):
+        self.db = db
+        self.numero_whatsapp = numero_whatsapp
+        self.write_through = write_through
+
+        self._loaded = False
+        self._row_checked = False
+        self._seeded_exists: Optional[bool] = None
+        self._row: Optional[ConversationState] = None
+        self._estado: str = ESTADO_INICIAL
+        self._datos: Dict[str, Any] = {}
+        self._historial: Deque[List[str]] = deque(maxlen=HISTORY_MAX_ENTRIES)
+        self._cliente: Optional[Cliente] = None
+
+        self._dirty = False
+        self._delete_row = False
+        self._ops: List[Tuple[Any, ...]] = []  # Cambios del turno, para reaplicar tras un conflicto
+
+        # Métricas del turno
+        self.queries = 0
+        self.writes = 0
+
+    # ------------------------------------------------------------------
+    # Acceso al contexto activo
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _registry(db: Session) -> Optional[Dict[str, "ConversationContext"]]:
+        """Contextos activos de la sesión (None si la sesión no admite `info`)"""
+        info = getattr(db, 'info', None)
+        if not isinstance(info, dict):
+            return None
+        return info.setdefault(SESSION_INFO_KEY, {})
+
+    @classmethod
+    def current(cls, db: Session, numero_whatsapp: str) -> Optional["ConversationContext"]:
+        """Contexto del turno en curso para el número, si existe"""
+        registry = cls._registry(db)
+        if registry is None:
+            return None
+        return registry.get(numero_whatsapp)
+
+    @classmethod
+    def for_number(cls, db: Session, numero_whatsapp: str) -> "ConversationContext":
+        """Contexto del turno en curso o, si no hay, uno transitorio que escribe en cada cambio"""
+        return cls.current(db, numero_whatsapp) or cls(db, numero_whatsapp, write_through=True)
+
+    # ------------------------------------------------------------------
+    # Carga
+    # ------------------------------------------------------------------
+    def _load(self):
+        """Cargar la fila de estado una sola vez"""
+        if self._loaded:
+            return
+        self._loaded = True
+        self._row = self._query_row()
+
+        if self._row is None:
+            return
+
+        self._estado = self._row.estado_actual or ESTADO_INICIAL  # type: ignore
+        if self._row.datos_temporales:  # type: ignore
+            try:
+                self._datos = json.loads(str(self._row.datos_temporales))
+            except (json.JSONDecodeError, TypeError):
+                self._datos = {}
+        self._historial = self._parse_history(self._row.historial)  # type: ignore
+
+    @staticmethod
+    def _parse_history(raw: Any) -> Deque[List[str]]:
+        """Convertir el historial guardado (JSON o lista) en el ring buffer"""
+        historial: Deque[List[str]] = deque(maxlen=HISTORY_MAX_ENTRIES)
+        if not raw:
+            return historial
+        try:
+            entries = json.loads(raw) if isinstance(raw, str) else raw
+        except (json.JSONDecodeError, TypeError):
+            return historial
+        historial.extend(
+            [str(entry[0]), str(entry[1])] for entry in entries
+            if isinstance(entry, (list, tuple)) and len(entry) == 2
+        )
+        return historial
+
+    def _query_row(self) -> Optional[ConversationState]:
+        """Consultar la fila de estado de la conversación"""
+        self.queries += 1
+        self._row_checked = True
+        return self.db.query(ConversationState).filter(
+            ConversationState.numero_whatsapp == self.numero_whatsapp
+        ).first()
+
+    @property
+    def exists(self) -> bool:
+        """Indica si la conversación tiene estado persistido"""
+        self._load()
+        if self._delete_row:
+            return False
+        if self._seeded_exists is not None and not self._row_checked:
+            return self._seeded_exists
+        return self._row is not None
+
+    @property
+    def cliente(self) -> Optional[Cliente]:
+        """Cliente del número (solo se cachea si existe, para ver registros hechos en el turno)"""
+        if self._cliente is None:
+            self.queries += 1
+            self._cliente = self.db.query(Cliente).filter(
+                Cliente.numero_whatsapp == self.numero_whatsapp
+            ).first()
+        return self._cliente
+
+    def set_cliente(self, cliente: Optional[Cliente]):
+        """Actualizar el cliente cacheado (ej: tras registrarlo en este turno)"""
+        self._cliente = cliente
+
+    # ------------------------------------------------------------------
+    # Estado
+    # ------------------------------------------------------------------
+    @property
+    def estado(self) -> str:
+        """Estado actual de la conversación"""
+        self._load()
+        return self._estado
+
+    def set_estado(self, estado: str):
+        """Cambiar el estado de la conversación"""
+        self._record(('estado', estado))
+
+    def ensure_persisted(self):
+        """Marcar la conversación para crearse si todavía no tiene fila"""
+        if not self.exists:
+            self._record(('ensure',))
+
+    # ------------------------------------------------------------------
+    # Datos temporales (se copian al leer y al escribir, como con JSON)
+    # ------------------------------------------------------------------
+    def get_datos(self) -> Dict[str, Any]:
+        """Copia de todos los datos temporales"""
+        self._load()
+        return copy.deepcopy(self._datos)
+
+    def get_value(self, key: str, default: Any = None) -> Any:
+        """Copia de un valor temporal"""
+        self._load()
+        return copy.deepcopy(self._datos.get(key, default))
+
+    def set_value(self, key: str, value: Any):
+        """Guardar un valor temporal"""
+        self._record(('set', key, copy.deepcopy(value)))
+
+    def pop_value(self, key: str) -> Any:
+        """Quitar un valor temporal y retornarlo"""
+        value = self.get_value(key)
+        if key in self._datos:
+            self._record(('pop', key))
+        return value
+
+    def replace_datos(self, datos: Dict[str, Any]):
+        """Reemplazar todos los datos temporales"""
+        self._record(('replace', copy.deepcopy(datos)))
+
+    def clear(self, estado: str = ESTADO_INICIAL, delete_row: bool = False):
+        """Reiniciar la conversación; con `delete_row` la fila se elimina al escribir"""
+        self._record(('clear', estado, delete_row))
+
+    # ------------------------------------------------------------------
+    # Historial de turnos (acotado a HISTORY_MAX_ENTRIES entradas)
+    # ------------------------------------------------------------------
+    def record_turn(self, mensaje: str, respuesta: Optional[str] = None):
+        """Agregar el mensaje del usuario y la respuesta del bot al historial"""
+        try:
+            self._load()
+        except Exception as e:
+            # Sin acceso al estado no hay historial; la respuesta igual se envía
+            logger.warning(f"⚠️ No se pudo cargar el historial de {self.numero_whatsapp}: {e}")
+            return
+        self._record(('turn', mensaje, respuesta))
+
+    def get_history(self, limit: Optional[int] = None) -> List[Dict[str, str]]:
+        """Últimas entradas del historial, de la más antigua a la más reciente"""
+        self._load()
+        entries = list(self._historial)
+        if limit is not None:
+            entries = entries[-limit:] if limit > 0 else []
+        return [{'role': HISTORY_ROLES.get(rol, rol), 'text': texto} for rol, texto in entries]
+
+    def last_bot_message(self) -> str:
+        """Último mensaje enviado por el bot (vacío si no hay)"""
+        self._load()
+        for rol, texto in reversed(self._historial):
+            if rol == 'b':
+                return texto
+        return ""
+
+    # ------------------------------------------------------------------
+    # Escritura
+    # ------------------------------------------------------------------
+    def _record(self, op: Tuple[Any, ...]):
+        """Aplicar un cambio, guardarlo para reaplicarlo si hay conflicto (y escribir ya en modo transitorio)"""
+        self._load()
+        self._ops.append(op)
+        self._apply(op)
+        self._dirty = True
+        if self.write_through:
+            self.flush()
+
+    def _apply(self, op: Tuple[Any, ...]):
+        """Aplicar un cambio sobre el estado en memoria"""
+        kind = op[0]
+        if kind == 'turn':
+            # El historial no cambia si la fila se elimina o no
+            self._historial.append(['u', op[1][:HISTORY_MAX_CHARS]])
+            if op[2]:
+                self._historial.append(['b', op[2][:HISTORY_MAX_CHARS]])
+            return
+
+        self._delete_row = False
+        if kind == 'estado':
+            self._estado = op[1]
+        elif kind == 'set':
+            self._datos[op[1]] = copy.deepcopy(op[2])
+        elif kind == 'pop':
+            self._datos.pop(op[1], None)
+        elif kind == 'replace':
+            self._datos = copy.deepcopy(op[1])
+        elif kind == 'clear':
+            self._estado = op[1]
+            self._datos = {}
+            self._delete_row = op[2]
+
+    @property
+    def dirty(self) -> bool:
+        """Indica si hay cambios sin escribir"""
+        return self._dirty
+
+    def flush(self):
+        """
+        Escribir los cambios pendientes con un solo commit (compare-and-swap por versión).
+        La fila se escribe dentro de un SAVEPOINT: un conflicto deshace solo la fila y no
+        el resto del turno (ej: líneas del carrito ya enviadas con flush).
+        """
+        if not self._dirty:
+            return
+
+        for attempt in range(self.MAX_CONFLICT_RETRIES + 1):
+            inserting = False
+            try:
+                with self.db.begin_nested():
+                    inserting = self._stage_row()
+                    self.db.flush()
+                break
+            except (StaleDataError, IntegrityError) as e:
+                # Un IntegrityError solo es conflicto si otro worker creó la misma fila
+                if isinstance(e, IntegrityError) and not inserting:
+                    self._rollback()
+                    raise
+                ConversationContext.conflicts += 1
+                if attempt == self.MAX_CONFLICT_RETRIES:
+                    ConversationContext.conflicts_unresolved += 1
+                    logger.error(f"❌ Conflicto de versión sin resolver para {self.numero_whatsapp}")
+                    self._rollback()
+                    raise
+                logger.warning(
+                    f"⚔️ Conflicto de versión para {self.numero_whatsapp}; "
+                    f"releyendo y reintentando ({attempt + 1}/{self.MAX_CONFLICT_RETRIES})"
+                )
+                self._reload_and_replay()
+            except Exception as e:
+                if all(op[0] == 'turn' for op in self._ops):
+                    # Solo cambió el historial: no romper la respuesta por no poder guardarlo
+                    logger.warning(f"⚠️ No se pudo guardar el historial de {self.numero_whatsapp}: {e}")
+                    self._dirty = False
+                    self._ops = []
+                    self._commit()
+                    return
+                self._rollback()
+                raise
+
+        self._commit()
+        self.writes += 1
+        self._dirty = False
+        self._delete_row = False
+        self._ops = []
+
+    def _commit(self):
+        try:
+            self.db.commit()
+        except Exception:
+            self._rollback()
+            raise
+
+    def _rollback(self):
+        self.db.rollback()
+        # Lo leído antes del rollback ya no es válido
+        self._row = None
+        self._row_checked = False
+
+    def _stage_row(self) -> bool:
+        """Preparar la fila en la sesión; retorna True si es una inserción"""
+        # Contexto cargado desde un snapshot: la fila aún no se consultó
+        if self._row is None and not self._row_checked:
+            self._row = self._query_row()
+
+        if self._delete_row:
+            if self._row is not None:
+                self.db.delete(self._row)
+                self._row = None
+            return False
+
+        inserting = self._row is None
+        if inserting:
+            self._row = ConversationState(numero_whatsapp=self.numero_whatsapp)
+            self.db.add(self._row)
+        self._row.estado_actual = self._estado  # type: ignore
+        self._row.datos_temporales = json.dumps(self._datos) if self._datos else None  # type: ignore
+        self._row.historial = self._dump_history()  # type: ignore
+        return inserting
+
+    def _dump_history(self) -> Optional[str]:
+        """Historial en JSON compacto (None si está vacío)"""
+        if not self._historial:
+            return None
+        return json.dumps(list(self._historial), ensure_ascii=False, separators=(',', ':'))
+
+    def _reload_and_replay(self):
+        """Volver a leer la fila y reaplicar los cambios del turno sobre ella"""
+        ops = self._ops
+        self._reset()
+        self._load()
+        for op in ops:
+            self._apply(op)
+        self._ops = ops
+        self._dirty = True
+
+    def mark_clean(self):
+        """Dar por escritos los cambios (ej: guardados en Redis por el modo write-behind)"""
+        self._dirty = False
+        self._delete_row = False
+        self._ops = []
+        self.writes += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Estado completo de la conversación para guardarlo fuera de la base de datos"""
+        self._load()
+        return {
+            'estado': self._estado,
+            'datos': copy.deepcopy(self._datos),
+            'historial': [list(entry) for entry in self._historial],
+            'deleted': self._delete_row
+        }
+
+    def seed(self, snapshot: Dict[str, Any]):
+        """Cargar el contexto desde un snapshot (sin consultar la base de datos)"""
+        self._loaded = True
+        self._row = None
+        self._row_checked = False
+        self._seeded_exists = not snapshot.get('deleted', False)
+        if snapshot.get('deleted'):
+            self._estado = ESTADO_INICIAL
+            self._datos = {}
+            self._historial = self._parse_history(None)
+        else:
+            self._estado = snapshot.get('estado') or ESTADO_INICIAL
+            self._datos = copy.deepcopy(snapshot.get('datos') or {})
+            self._historial = self._parse_history(snapshot.get('historial'))
+
+    def discard(self):
+        """Descartar los cambios pendientes del turno"""
+        self._ops = []
+        self._reset()
+
+    def _reset(self):
+        """Olvidar lo cargado y lo pendiente"""
+        self._dirty = False
+        self._delete_row = False
+        self._loaded = False
+        self._row_checked = False
+        self._seeded_exists = None
+        self._row = None
+        self._estado = ESTADO_INICIAL
+        self._datos = {}
+        self._historial = self._parse_history(None)
+
+
+def get_conversation_context_stats() -> Dict[str, Any]:
+    """Métricas de concurrencia de los contextos de conversación"""
+    return {
+        'version_conflicts': ConversationContext.conflicts,
+        'unresolved_conflicts': ConversationContext.conflicts_unresolved,
+        'max_conflict_retries': ConversationContext.MAX_CONFLICT_RETRIES
+    }
+
+
+class ConversationUnitOfWork:
+    """
+    Turno de un número: todos los helpers que usen la misma sesión comparten
+    el contexto, y los cambios se escriben una sola vez al salir, con un solo
+    commit que incluye lo que otros repositorios (ej: el carrito) enviaron con
+    flush. Si el turno falla, se descartan el contexto y la transacción.
+
+    Con `async with`, si el modo write-behind está activo, el estado se lee y
+    se guarda en Redis y el flusher lo lleva luego a la base de datos.
+    """
+
+    def __init__(self, db: Session, numero_whatsapp: str):
+        self.db = db
+        self.numero_whatsapp = numero_whatsapp
+        self.ctx: Optional[ConversationContext] = None
+        self._registry = ConversationContext._registry(db)
+        self._nested = False
+
+    def _open(self) -> ConversationContext:
+        # Turno anidado (ej: un handler llamado desde el bot): reutilizar el contexto
+        if self._registry is not None and self.numero_whatsapp in self._registry:
+            self._nested = True
+            self.ctx = self._registry[self.numero_whatsapp]
+            return self.ctx
+
+        self.ctx = ConversationContext(self.db, self.numero_whatsapp)
+        if self._registry is not None:
+            self._registry[self.numero_whatsapp] = self.ctx
+        return self.ctx
+
+    def _close(self):
+        if self._nested or self.ctx is None:
+            return
+        if self._registry is not None:
+            self._registry.pop(self.numero_whatsapp, None)
+        logger.debug(
+            f"🧾 Turno de {self.numero_whatsapp}: {self.ctx.queries} consultas de contexto, "
+            f"{self.ctx.writes} escrituras"
+        )
+
+    def __enter__(self) -> ConversationContext:
+        return self._open()
+
+    def _commit(self):
+        """Confirmar el resto del turno (ej: carrito) si el contexto no tuvo nada que escribir"""
+        info = getattr(self.db, 'info', None)
+        if not isinstance(info, dict) or not info.get(PENDING_WRITES_KEY):
+            return
+        try:
+            self.db.commit()
+        except Exception:
+            self.db.rollback()
+            raise
+
+    def _rollback(self):
+        """Turno fallido: descartar el contexto y todo lo enviado con flush en la sesión"""
+        self.ctx.discard()  # type: ignore[union-attr]
+        self.db.rollback()
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if not self._nested:
+                if exc_type is None:
+                    self.ctx.flush()  # type: ignore[union-attr]
+                    self._commit()
+                else:
+                    self._rollback()
+        finally:
+            self._close()
+        return False
+
+    async def __aenter__(self) -> ConversationContext:
+        from app.services.write_behind_service import conversation_write_behind
+
+        ctx = self._open()
+        if not self._nested and conversation_write_behind.active:
+            snapshot = await conversation_write_behind.load(self.numero_whatsapp)
+            if snapshot is not None:
+                ctx.seed(snapshot)
+        return ctx
+
+    async def __aexit__(self, exc_type, exc, tb):
+        from app.services.write_behind_service import conversation_write_behind
+
+        try:
+            if not self._nested:
+                ctx = self.ctx
+                if exc_type is not None:
+                    self._rollback()
+                    return False
+                if ctx.dirty and conversation_write_behind.active:  # type: ignore[union-attr]
+                    if await conversation_write_behind.save(self.numero_whatsapp, ctx.snapshot()):  # type: ignore[union-attr]
+                        ctx.mark_clean()  # type: ignore[union-attr]
+                    else:
+                        # Redis no disponible: escribir directamente en la base de datos
+                        ctx.flush()  # type: ignore[union-attr]
+                else:
+                    ctx.flush()  # type: ignore[union-attr]
+                self._commit()
+        finally:
+            self._close()
+        return False
+
+
+def conversation_unit_of_work(db: Session, numero_whatsapp: str) -> ConversationUnitOfWork:
+    """Abrir un turno para el número (usar con `with` o `async with`)"""
+    return ConversationUnitOfWork(db, numero_whatsapp)
+
+
+# ----------------------------------------------------------------------
+# Eventos de SQLAlchemy: marcar la sesión cuando hay escrituras pendientes
+# de commit, para que el turno las confirme aunque el contexto no cambie
+# ----------------------------------------------------------------------
+@event.listens_for(Session, "after_flush")
+def _mark_flushed_writes(session, flush_context):
+    session.info[PENDING_WRITES_KEY] = True
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _mark_bulk_writes(orm_execute_state):
+    if orm_execute_state.is_update or orm_execute_state.is_delete or orm_execute_state.is_insert:
+        orm_execute_state.session.info[PENDING_WRITES_KEY] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _clear_pending_writes_on_commit(session):
+    if not session.in_nested_transaction():
+        session.info.pop(PENDING_WRITES_KEY, None)
+
+
+@event.listens_for(Session, "after_rollback")
+def _clear_pending_writes_on_rollback(session):
+    if not session.in_nested_transaction():
+        session.info.pop(PENDING_WRITES_KEY, None)
@@ -0,0 +1,85 @@
+"""
+Despachador de conversaciones: orden estricto por número, paralelismo entre números
+
+Cada número de WhatsApp tiene su propio lock (tabla de locks por clave).
+Los mensajes del mismo número se procesan uno tras otro y en orden de llegada
+(asyncio.Lock despierta a los que esperan en orden FIFO), mientras que
+números distintos se procesan en paralelo. Las entradas sin usuarios se
+eliminan de inmediato para que la tabla no crezca sin límite.
+"""
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import Dict, Any, AsyncIterator
+
+logger = logging.getLogger(__name__)
+
+
+class _ConversationLock:
+    """Lock de una conversación con el número de tareas que lo usan o esperan"""
+    __slots__ = ('lock', 'users')
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.users = 0
+
+
+class ConversationDispatcher:
+    """Serializa el procesamiento por numero_whatsapp sin bloquear otros números"""
+
+    def __init__(self):
+        self._locks: Dict[str, _ConversationLock] = {}
+
+        # Métricas
+        self.acquisitions = 0
+        self.contended = 0
+        self.evicted = 0
+        self.max_active = 0
+
+    @asynccontextmanager
+    async def serialize(self, numero_whatsapp: str) -> AsyncIterator[None]:
+        """
+        Context manager que garantiza exclusión mutua para un número.
+        Uso:
+            async with conversation_dispatcher.serialize(numero):
+                ...
+        """
+        entry = self._locks.get(numero_whatsapp)
+        if entry is None:
+            entry = _ConversationLock()
+            self._locks[numero_whatsapp] = entry
+            self.max_active = max(self.max_active, len(self._locks))
+
+        entry.users += 1
+        if entry.lock.locked():
+            self.contended += 1
+            logger.debug(f"⏳ Mensaje de {numero_whatsapp} esperando turno")
+
+        try:
+            async with entry.lock:
+                self.acquisitions += 1
+                yield
+        finally:
+            entry.users -= 1
+            if entry.users == 0 and self._locks.get(numero_whatsapp) is entry:
+                # Nadie más usa ni espera este lock: liberar la entrada
+                del self._locks[numero_whatsapp]
+                self.evicted += 1
+
+    def active_conversations(self) -> int:
+        """Número de conversaciones con mensajes en proceso o en espera"""
+        return len(self._locks)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Obtener métricas del despachador para monitoreo"""
+        return {
+            'active_conversations': len(self._locks),
+            'max_active_conversations': self.max_active,
+            'acquisitions': self.acquisitions,
+            'contended': self.contended,
+            'evicted': self.evicted
+        }
+
+
+# Instancia global del despachador
+conversation_dispatcher = ConversationDispatcher()
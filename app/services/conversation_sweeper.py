@@ -0,0 +1,176 @@
+"""
+Limpieza periódica de conversaciones y carritos abandonados
+
+Las conversaciones sin actividad durante CONVERSATION_STATE_TTL_HOURS se
+eliminan junto con su carrito, así un cliente que vuelve días después
+empieza desde cero. El borrado se hace por lotes de CONVERSATION_SWEEP_BATCH
+filas (cada lote es una transacción corta que usa el índice de
+`fecha_actualizacion`) para no mantener locks largos sobre la tabla.
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Dict, Any, List, Callable, Tuple
+from sqlalchemy.orm import Session
+from app.models.carrito_item import CarritoItem
+from app.models.conversation_state import ConversationState
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+class ConversationSweeper:
+    """Elimina por lotes las conversaciones y carritos inactivos"""
+
+    def __init__(
+        self,
+        ttl_hours: Optional[float] = None,
+        batch_size: Optional[int] = None,
+        session_factory: Optional[Callable[[], Session]] = None
+    ):
+        self.ttl = timedelta(hours=ttl_hours or settings.CONVERSATION_STATE_TTL_HOURS)
+        self.batch_size = batch_size or settings.CONVERSATION_SWEEP_BATCH
+        self._session_factory = session_factory
+
+        # Métricas
+        self.runs = 0
+        self.last_swept_states = 0
+        self.last_swept_cart_items = 0
+        self.total_swept_states = 0
+        self.total_swept_cart_items = 0
+        self.last_run_ms = 0.0
+        self.last_run_at: Optional[str] = None
+        self.errors = 0
+
+    def _open_session(self) -> Session:
+        if self._session_factory is not None:
+            return self._session_factory()
+        from database.connection import SessionLocal
+        return SessionLocal()
+
+    async def sweep(self) -> Dict[str, int]:
+        """Ejecutar una limpieza completa sin bloquear el event loop"""
+        cutoff = datetime.now(timezone.utc) - self.ttl
+        started_at = time.monotonic()
+        states = 0
+        cart_items = 0
+        numeros: List[str] = []
+
+        try:
+            # Un lote por hilo: entre lotes el loop atiende otros mensajes
+            while True:
+                batch_numeros, deleted_items = await asyncio.to_thread(self._sweep_states_batch, cutoff)
+                states += len(batch_numeros)
+                cart_items += deleted_items
+                numeros.extend(batch_numeros)
+                if len(batch_numeros) < self.batch_size:
+                    break
+
+            while True:
+                deleted_items = await asyncio.to_thread(self._sweep_orphan_carts_batch, cutoff)
+                cart_items += deleted_items
+                if deleted_items < self.batch_size:
+                    break
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"❌ Error limpiando conversaciones inactivas: {e}")
+
+        await self._forget_cached(numeros)
+
+        self.runs += 1
+        self.last_swept_states = states
+        self.last_swept_cart_items = cart_items
+        self.total_swept_states += states
+        self.total_swept_cart_items += cart_items
+        self.last_run_ms = round((time.monotonic() - started_at) * 1000, 2)
+        self.last_run_at = datetime.now(timezone.utc).isoformat()
+        logger.info(
+            f"🧹 Limpieza de conversaciones: {states} estados y {cart_items} líneas de carrito "
+            f"eliminadas en {self.last_run_ms}ms"
+        )
+        return {'states': states, 'cart_items': cart_items}
+
+    def _sweep_states_batch(self, cutoff: datetime) -> Tuple[List[str], int]:
+        """Eliminar un lote de conversaciones inactivas y sus carritos"""
+        db = self._open_session()
+        try:
+            rows = db.query(ConversationState.id, ConversationState.numero_whatsapp).filter(
+                ConversationState.fecha_actualizacion < cutoff
+            ).order_by(ConversationState.fecha_actualizacion).limit(self.batch_size).all()
+            if not rows:
+                return [], 0
+
+            ids = [row.id for row in rows]
+            numeros = [row.numero_whatsapp for row in rows]
+            deleted_items = db.query(CarritoItem).filter(
+                CarritoItem.numero_whatsapp.in_(numeros)
+            ).delete(synchronize_session=False)
+            db.query(ConversationState).filter(
+                ConversationState.id.in_(ids)
+            ).delete(synchronize_session=False)
+            db.commit()
+            return numeros, deleted_items
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _sweep_orphan_carts_batch(self, cutoff: datetime) -> int:
+        """Eliminar un lote de líneas de carrito viejas sin conversación asociada"""
+        db = self._open_session()
+        try:
+            con_conversacion = db.query(ConversationState.id).filter(
+                ConversationState.numero_whatsapp == CarritoItem.numero_whatsapp
+            ).exists()
+            ids = [
+                row.id for row in db.query(CarritoItem.id).filter(
+                    CarritoItem.fecha_creacion < cutoff,
+                    ~con_conversacion
+                ).limit(self.batch_size).all()
+            ]
+            if not ids:
+                return 0
+
+            deleted = db.query(CarritoItem).filter(
+                CarritoItem.id.in_(ids)
+            ).delete(synchronize_session=False)
+            db.commit()
+            return deleted
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    async def _forget_cached(self, numeros: List[str]):
+        """Evitar que los cachés devuelvan conversaciones ya eliminadas"""
+        if not numeros:
+            return
+        from app.services.cache_service import cache_service
+        from app.services.optimized_conversation_service import conversation_state_cache
+
+        for numero in numeros:
+            conversation_state_cache.delete(numero)
+            await cache_service.delete_conversation_state(numero)
+        await cache_service.discard_conversation_snapshots(numeros)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Obtener métricas de la limpieza para monitoreo"""
+        return {
+            'ttl_hours': self.ttl.total_seconds() / 3600,
+            'batch_size': self.batch_size,
+            'runs': self.runs,
+            'last_run_at': self.last_run_at,
+            'last_run_ms': self.last_run_ms,
+            'last_swept_states': self.last_swept_states,
+            'last_swept_cart_items': self.last_swept_cart_items,
+            'total_swept_states': self.total_swept_states,
+            'total_swept_cart_items': self.total_swept_cart_items,
+            'errors': self.errors
+        }
+
+
+# Instancia global de la limpieza de conversaciones
+conversation_sweeper = ConversationSweeper()
@@ -0,0 +1,113 @@
+"""
+Deduplicación de mensajes entrantes por MessageSid de Twilio
+
+Twilio reintenta el webhook cuando la respuesta tarda. Cada reintento trae el
+mismo MessageSid, así que basta con recordar los SIDs vistos durante un TTL
+para descartar los duplicados antes de ejecutar el bot.
+
+Niveles:
+1. Memoria local acotada (LRU por orden de inserción + TTL)
+2. Redis compartido entre workers (SET NX EX), si está disponible
+"""
+import logging
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Optional, Dict, Any
+from app.services.cache_service import cache_service
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+class MessageDeduplicator:
+    """Almacén acotado con TTL de MessageSids ya procesados"""
+
+    KEY_PREFIX = "dedupe:"
+
+    def __init__(self, max_entries: Optional[int] = None, ttl_seconds: Optional[int] = None):
+        self.max_entries = max_entries or settings.DEDUPE_MAX_ENTRIES
+        self.ttl_seconds = ttl_seconds or settings.DEDUPE_TTL_SECONDS
+        self._seen: "OrderedDict[str, float]" = OrderedDict()  # sid -> expira_en
+
+        # Métricas
+        self.checks = 0
+        self.duplicates = 0
+
+    async def is_duplicate(self, message_sid: Optional[str]) -> bool:
+        """
+        Registrar el SID y retornar True si ya se había visto.
+        Sin SID no se puede deduplicar y el mensaje se procesa.
+        """
+        if not message_sid:
+            return False
+
+        self.checks += 1
+
+        # Nivel 1: memoria local (sin viaje de red)
+        if self._seen_in_memory(message_sid):
+            self.duplicates += 1
+            logger.info(f"🔁 Mensaje duplicado descartado (memoria): {message_sid}")
+            return True
+
+        # Nivel 2: Redis, para detectar reintentos que llegan a otro worker
+        stored = await cache_service.set_if_absent(
+            f"{self.KEY_PREFIX}{message_sid}",
+            1,
+            ttl=timedelta(seconds=self.ttl_seconds)
+        )
+        self._remember(message_sid)
+
+        if stored is False:
+            self.duplicates += 1
+            logger.info(f"🔁 Mensaje duplicado descartado (Redis): {message_sid}")
+            return True
+
+        return False
+
+    async def release(self, message_sid: Optional[str]):
+        """Olvidar un SID para que el reintento de Twilio se procese (ej: tras un error)"""
+        if not message_sid:
+            return
+        self._seen.pop(message_sid, None)
+        await cache_service.delete_key(f"{self.KEY_PREFIX}{message_sid}")
+
+    def _seen_in_memory(self, message_sid: str) -> bool:
+        """Verificar si el SID está en memoria y no ha expirado"""
+        expires_at = self._seen.get(message_sid)
+        if expires_at is None:
+            return False
+        if expires_at < time.monotonic():
+            del self._seen[message_sid]
+            return False
+        return True
+
+    def _remember(self, message_sid: str):
+        """Guardar el SID en memoria respetando el TTL y el tamaño máximo"""
+        now = time.monotonic()
+        self._seen[message_sid] = now + self.ttl_seconds
+        self._seen.move_to_end(message_sid)
+
+        # Las entradas más antiguas están al principio: purgar expiradas y exceso
+        while self._seen:
+            oldest_sid, expires_at = next(iter(self._seen.items()))
+            if expires_at < now or len(self._seen) > self.max_entries:
+                del self._seen[oldest_sid]
+            else:
+                break
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Obtener métricas de deduplicación para monitoreo"""
+        return {
+            'checks': self.checks,
+            'duplicates': self.duplicates,
+            'hit_rate': round(self.duplicates / self.checks, 4) if self.checks else 0.0,
+            'memory_entries': len(self._seen),
+            'max_entries': self.max_entries,
+            'ttl_seconds': self.ttl_seconds,
+            'redis_backend': cache_service.redis is not None
+        }
+
+
+# Instancia global del deduplicador
+message_deduplicator = MessageDeduplicator()
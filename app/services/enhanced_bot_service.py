@@ -6,10 +6,15 @@ from sqlalchemy.orm import Session
 from app.models.cliente import Cliente
 from app.models.pizza import Pizza
 from app.models.pedido import Pedido, DetallePedido
-from app.models.conversation_state import ConversationState
 from app.services.pedido_service import PedidoService
 from app.services.ai_service import AIService
 from app.services.ambiguity_resolver import AmbiguityResolver
+from app.services.conversation_context import ConversationContext, conversation_unit_of_work
+from app.services.cart_repository import CartRepository, add_parsed_items, get_cart
+from app.services.menu_catalog import get_menu_catalog
+from app.services.message_extractor import ExtractedMessage, extract_message
+from app.services.order_parser import SIZE_WORDS, ParsedItem, missing_sizes_message, parse_order
+from app.services.pizza_name_index import strip_accents
 import re
 import logging
 import json
@@ -48,14 +53,20 @@ class EnhancedBotService:
             'menu', 'menú', 'carta', 'ayuda', 'help',
             'pedido', 'mis pedidos', 'estado'
         ]
-        
-        # Almacenar el último mensaje del bot para contexto
-        self.last_bot_messages = {}
     
     async def process_message(self, numero_whatsapp: str, mensaje: str) -> str:
         """
-        Procesador principal que decide entre IA y flujo tradicional
+        Procesador principal que decide entre IA y flujo tradicional.
+        Todo el turno comparte un contexto de conversación que se escribe una sola vez.
         """
+        async with conversation_unit_of_work(self.db, numero_whatsapp) as conversation:
+            response = await self._process_turn(numero_whatsapp, mensaje)
+            # Guardar el turno en el historial persistente (se escribe con el resto del turno)
+            conversation.record_turn(mensaje.strip(), response)
+            return response
+    
+    async def _process_turn(self, numero_whatsapp: str, mensaje: str) -> str:
+        """Procesar un turno dentro de la unidad de trabajo de la conversación"""
         
         # Limpiar mensaje
         mensaje = mensaje.strip()
@@ -77,6 +88,17 @@ class EnhancedBotService:
         if not cliente or cliente.nombre is None or cliente.direccion is None:
             return await self.handle_registration_flow(numero_whatsapp, mensaje, cliente)
         
+        # Pedidos por nombre que se pueden leer localmente no pasan por la IA
+        if estado_actual in (self.ESTADOS['INICIO'], self.ESTADOS['MENU'], self.ESTADOS['PEDIDO']):
+            extraido = extract_message(mensaje, get_menu_catalog(self.db))
+            if extraido.completo:
+                # Saludo + pedido + dirección en un solo mensaje: directo a confirmar
+                return self.handle_one_shot_order(numero_whatsapp, extraido, cliente)
+            if extraido.items:
+                respuesta_local = self.handle_local_order(numero_whatsapp, extraido.pedido, extraido.items)
+                if respuesta_local is not None:
+                    return respuesta_local
+        
         # Determinar si usar IA o flujo tradicional
         should_use_ai = await self.should_use_ai_processing(mensaje, estado_actual, contexto)
         
@@ -100,6 +122,11 @@ class EnhancedBotService:
         if mensaje_lower.isdigit() and estado_actual == self.ESTADOS['MENU']:
             return False
         
+        # La respuesta a "¿Qué tamaño quieres?" la resuelve el flujo tradicional
+        if estado_actual == 'seleccion_tamano_pizza' and (
+                mensaje_lower in ('1', '2', '3') or strip_accents(mensaje_lower) in SIZE_WORDS):
+            return False
+
         # Si es confirmación simple, usar flujo tradicional
         if mensaje_lower in ['si', 'sí', 'no', 'confirmar', 'cancelar']:
             return False
@@ -107,17 +134,12 @@ class EnhancedBotService:
         # Para preguntas complejas, modificaciones, o lenguaje natural, usar IA
         return True
     
-    def _store_last_bot_message(self, numero_whatsapp: str, message: str):
-        """Almacenar el último mensaje del bot para contexto"""
-        self.last_bot_messages[numero_whatsapp] = message
-    
     def _get_last_bot_message(self, numero_whatsapp: str) -> str:
-        """Obtener el último mensaje del bot"""
-        return self.last_bot_messages.get(numero_whatsapp, "")
+        """Obtener el último mensaje del bot (del historial persistente de la conversación)"""
+        return self._conversation(numero_whatsapp).last_bot_message()
     
     def _send_response_with_context(self, numero_whatsapp: str, response: str) -> str:
-        """Enviar respuesta y almacenar para contexto futuro"""
-        self._store_last_bot_message(numero_whatsapp, response)
+        """Enviar respuesta (el turno completo se guarda en el historial al cerrar el turno)"""
         return response
     
     async def _handle_ambiguous_message(self, 
@@ -131,7 +153,7 @@ class EnhancedBotService:
         last_bot_message = self._get_last_bot_message(numero_whatsapp)
         context = {
             'state': current_state,
-            'carrito': self.get_temporary_value(numero_whatsapp, 'carrito'),
+            'carrito': self.get_cart(numero_whatsapp).items(),
             'direccion': self.get_temporary_value(numero_whatsapp, 'direccion'),
             'cliente': cliente
         }
@@ -342,44 +364,119 @@ class EnhancedBotService:
         
         # Detectar solicitudes de pizza (patrones comunes)
         pizza_keywords = ['dame', 'quiero', 'pide', 'pedime', 'solicito']
-        pizza_names = ['pepperoni', 'margarita', 'margherita', 'hawaiana', 'carnivora', 'carnicera', 'vegetariana']
         
         # Verificar si es una solicitud de pizza
         is_pizza_request = any(keyword in mensaje_lower for keyword in pizza_keywords)
-        contains_pizza_name = any(name in mensaje_lower for name in pizza_names)
-        
-        if is_pizza_request and contains_pizza_name:
-            # Intentar encontrar la pizza solicitada
-            for name in pizza_names:
-                if name in mensaje_lower:
-                    # Buscar pizza en la base de datos
-                    pizza = self.db.query(Pizza).filter(
-                        Pizza.disponible == True,
-                        Pizza.nombre.ilike(f'%{name}%')
-                    ).first()
-                    
-                    if pizza:
-                        # Guardar pizza en contexto temporal
-                        self.set_temporary_value(numero_whatsapp, 'pizza_parcial', {
-                            'id': pizza.id,
-                            'nombre': pizza.nombre,
-                            'emoji': pizza.emoji or '🍕'
-                        })
-                        
-                        # Cambiar a estado de selección de tamaño
-                        self.set_conversation_state(numero_whatsapp, 'seleccion_tamano_pizza')
-                        
-                        return (f"¡Perfecto! Pizza {pizza.emoji or '🍕'} {pizza.nombre} 👍\n\n"
-                               f"¿Qué tamaño quieres?\n\n"
-                               f"💰 Precios:\n"
-                               f"• 1️⃣ Pequeña: ${pizza.precio_pequena:.2f}\n"
-                               f"• 2️⃣ Mediana: ${pizza.precio_mediana:.2f}\n"
-                               f"• 3️⃣ Grande: ${pizza.precio_grande:.2f}\n\n"
-                               f"Escribe el número o el nombre del tamaño:")
+        
+        if is_pizza_request:
+            # Buscar la pizza mencionada en el índice difuso del catálogo (tolera errores de tipeo)
+            match = get_menu_catalog(self.db).match(mensaje)
+            
+            if match:
+                pizza = match.pizza
+                logger.info(f"🍕 Pizza reconocida en el mensaje: {pizza.nombre} (confianza {match.score:.2f})")
+                
+                # Guardar pizza en contexto temporal
+                self.set_temporary_value(numero_whatsapp, 'pizza_parcial', {
+                    'id': pizza.id,
+                    'nombre': pizza.nombre,
+                    'emoji': pizza.emoji or '🍕'
+                })
+                
+                # Cambiar a estado de selección de tamaño
+                self.set_conversation_state(numero_whatsapp, 'seleccion_tamano_pizza')
+                
+                return (f"¡Perfecto! Pizza {pizza.emoji or '🍕'} {pizza.nombre} 👍\n\n"
+                       f"¿Qué tamaño quieres?\n\n"
+                       f"💰 Precios:\n"
+                       f"• 1️⃣ Pequeña: ${pizza.precio_pequena:.2f}\n"
+                       f"• 2️⃣ Mediana: ${pizza.precio_mediana:.2f}\n"
+                       f"• 3️⃣ Grande: ${pizza.precio_grande:.2f}\n\n"
+                       f"Escribe el número o el nombre del tamaño:")
             
         # Si no es una solicitud de pizza válida, usar fallback tradicional
         return await self.process_with_traditional_flow(numero_whatsapp, mensaje, cliente)
     
+    def handle_local_order(self, numero_whatsapp: str, mensaje: str,
+                           items: Optional[List[ParsedItem]] = None) -> Optional[str]:
+        """
+        Leer el pedido del mensaje sin IA ('dame 2 hawaianas medianas y grande de pepperoni')
+        y cargarlo al carrito. Retorna None si el mensaje no se puede leer localmente.
+        """
+        if items is None:
+            items = parse_order(mensaje, get_menu_catalog(self.db))
+        if not items:
+            return None
+        
+        # Las líneas con tamaño se agregan siempre, aunque falte el de otras
+        carrito = self.get_cart(numero_whatsapp)
+        completos, sin_tamano = add_parsed_items(carrito, items)
+        if completos:
+            logger.info(f"🛒 Pedido leído sin IA para {numero_whatsapp}: {completos}")
+        
+        if len(sin_tamano) > 1:
+            if completos:
+                self.set_conversation_state(numero_whatsapp, self.ESTADOS['PEDIDO'])
+            return missing_sizes_message(sin_tamano, completos)
+        
+        if sin_tamano:
+            # Falta el tamaño de una pizza: se pregunta como en una solicitud parcial
+            pizza = sin_tamano[0].pizza
+            self.set_temporary_value(numero_whatsapp, 'pizza_parcial', {
+                'id': pizza.id,
+                'nombre': pizza.nombre,
+                'emoji': pizza.emoji or '🍕',
+                'cantidad': sin_tamano[0].cantidad or 1
+            })
+            self.set_conversation_state(numero_whatsapp, 'seleccion_tamano_pizza')
+            agregado = "✅ Agregado al carrito. " if completos else ""
+            return (f"{agregado}¡Perfecto! Pizza {pizza.emoji or '🍕'} {pizza.nombre} 👍\n\n"
+                   f"¿Qué tamaño quieres?\n\n"
+                   f"💰 Precios:\n"
+                   f"• 1️⃣ Pequeña: ${pizza.precio_pequena:.2f}\n"
+                   f"• 2️⃣ Mediana: ${pizza.precio_mediana:.2f}\n"
+                   f"• 3️⃣ Grande: ${pizza.precio_grande:.2f}\n\n"
+                   f"Escribe el número o el nombre del tamaño:")
+        
+        self.set_conversation_state(numero_whatsapp, self.ESTADOS['PEDIDO'])
+        return self._cart_message(carrito.items(), "✅ Pizza agregada al carrito!")
+    
+    def handle_one_shot_order(self, numero_whatsapp: str, extraido: ExtractedMessage, cliente: Cliente) -> str:
+        """
+        Cargar el pedido y la dirección de un mensaje completo y pasar a confirmación.
+        Carrito, dirección y estado se guardan en la misma unidad de trabajo del turno.
+        """
+        carrito = self.get_cart(numero_whatsapp)
+        carrito.add_many([item.to_cart_line() for item in extraido.items])
+        self.set_temporary_value(numero_whatsapp, 'direccion', extraido.direccion)
+        self.set_conversation_state(numero_whatsapp, self.ESTADOS['CONFIRMACION'])
+        logger.info(f"🛒 Pedido completo en un mensaje para {numero_whatsapp}: {extraido}")
+        
+        resumen = self._order_summary_message(carrito.items(), extraido.direccion)
+        if extraido.saludo:
+            resumen = f"¡Hola {cliente.nombre}! 👋\n\n{resumen}"
+        return resumen
+    
+    def _cart_message(self, carrito: List[Dict], encabezado: str) -> str:
+        """Carrito actual con el total y las opciones para seguir"""
+        total = sum(item['precio'] * item.get('cantidad', 1) for item in carrito)
+        
+        mensaje_respuesta = f"{encabezado}\n\n"
+        mensaje_respuesta += "*Carrito actual:*\n"
+        for item in carrito:
+            emoji = item.get('pizza_emoji', '🍕')
+            cantidad = item.get('cantidad', 1)
+            precio_total = item['precio'] * cantidad
+            mensaje_respuesta += f"• {emoji} {item['pizza_nombre']} - {item['tamano'].title()}\n"
+            mensaje_respuesta += f"  ${item['precio']:.2f} x {cantidad} = ${precio_total:.2f}\n"
+        
+        mensaje_respuesta += f"\n*Total: ${total:.2f}*\n\n"
+        mensaje_respuesta += "¿Quieres agregar algo más?\n"
+        mensaje_respuesta += "• Escribe el nombre de otra pizza\n"
+        mensaje_respuesta += "• Escribe 'confirmar' para finalizar el pedido\n"
+        mensaje_respuesta += "• Escribe 'cancelar' para cancelar"
+        return mensaje_respuesta
+    
     #async def handle_reemplazar_pedido(self, numero_whatsapp: str, datos: Dict, cliente: Cliente):
         """
         Manejar reemplazo de pedido (funcionalidad existente)
@@ -397,10 +494,10 @@ class EnhancedBotService:
             return
         
         # Obtener pizzas disponibles
-        pizzas_disponibles = self.db.query(Pizza).filter(Pizza.disponible == True).all()
+        pizzas_disponibles = get_menu_catalog(self.db)
         
         # Obtener carrito actual
-        carrito = self.get_temporary_value(numero_whatsapp, 'carrito') or []
+        carrito = self.get_cart(numero_whatsapp)
         
         # Procesar cada pizza solicitada
         for pizza_data in pizzas_solicitadas:
@@ -409,25 +506,22 @@ class EnhancedBotService:
             cantidad = pizza_data.get('cantidad', 1)
             
             # Validar número de pizza
-            if numero_pizza > 0 and numero_pizza <= len(pizzas_disponibles):
-                pizza_seleccionada = pizzas_disponibles[numero_pizza - 1]
+            pizza_seleccionada = pizzas_disponibles.by_number(numero_pizza)
+            if pizza_seleccionada is not None:
                 
                 # Obtener precio según tamaño
                 precio = self.get_pizza_price(pizza_seleccionada, tamano)  # type: ignore
                 
-                # Agregar al carrito
-                for _ in range(cantidad):
-                    carrito.append({
-                        'pizza_id': pizza_seleccionada.id,  # type: ignore
-                        'pizza_nombre': pizza_seleccionada.nombre,  # type: ignore
-                        'pizza_emoji': pizza_seleccionada.emoji,  # type: ignore
-                        'tamano': tamano,
-                        'precio': precio,
-                        'cantidad': 1
-                    })
-        
-        # Guardar carrito actualizado
-        self.set_temporary_value(numero_whatsapp, 'carrito', carrito)
+                # Agregar al carrito (una sola escritura por línea)
+                carrito.add(
+                    pizza_id=pizza_seleccionada.id,  # type: ignore
+                    pizza_nombre=pizza_seleccionada.nombre,  # type: ignore
+                    pizza_emoji=pizza_seleccionada.emoji,  # type: ignore
+                    tamano=tamano,
+                    precio=precio,
+                    cantidad=cantidad
+                )
+        
         self.set_conversation_state(numero_whatsapp, self.ESTADOS['PEDIDO'])
     
     async def handle_limpiar_carrito(self, numero_whatsapp: str, datos: Dict, cliente: Cliente):
@@ -435,16 +529,13 @@ class EnhancedBotService:
         Limpiar completamente el carrito
         """
         # Limpiar carrito
-        self.set_temporary_value(numero_whatsapp, 'carrito', [])
+        self.get_cart(numero_whatsapp).clear()
         logger.info(f"Carrito limpiado para {numero_whatsapp}")
     
     async def handle_modificar_carrito(self, numero_whatsapp: str, datos: Dict, cliente: Cliente):
         """
         Modificar elementos específicos del carrito
         """
-        # Obtener carrito actual
-        carrito = self.get_temporary_value(numero_whatsapp, 'carrito') or []
-        
         # Implementar lógica de modificación específica
         # Por ahora, simplemente limpiar y agregar las nuevas pizzas
         await self.handle_limpiar_carrito(numero_whatsapp, datos, cliente)
@@ -538,7 +629,9 @@ class EnhancedBotService:
             'large': 'grande'
         }
         
-        if mensaje_lower not in tamanos:
+        # También plurales y sinónimos del léxico de pedidos ("grandes", "familiar", ...)
+        tamano_seleccionado = tamanos.get(mensaje_lower) or SIZE_WORDS.get(strip_accents(mensaje_lower))
+        if tamano_seleccionado is None:
             return ("❓ Por favor, selecciona un tamaño válido:\n\n"
                    "• 1️⃣ Pequeña\n• 2️⃣ Mediana\n• 3️⃣ Grande\n\n"
                    "Escribe el número o el nombre del tamaño:")
@@ -548,34 +641,32 @@ class EnhancedBotService:
         if not pizza_parcial:
             return await self.handle_menu(numero_whatsapp, cliente)
         
-        # Obtener pizza completa de la BD
-        pizza = self.db.query(Pizza).filter(Pizza.id == pizza_parcial['id']).first()
+        # Obtener pizza completa del catálogo
+        pizza = get_menu_catalog(self.db).get(pizza_parcial['id'])
         if not pizza:
             return await self.handle_menu(numero_whatsapp, cliente)
         
-        # Obtener tamaño seleccionado y precio
-        tamano_seleccionado = tamanos[mensaje_lower]
+        # Obtener precio del tamaño seleccionado
         precio = self.get_pizza_price(pizza, tamano_seleccionado)
         
         # Agregar al carrito
-        carrito = self.get_temporary_value(numero_whatsapp, 'carrito') or []
-        carrito.append({
-            'pizza_id': pizza.id,
-            'pizza_nombre': pizza.nombre,
-            'pizza_emoji': pizza.emoji or '🍕',
-            'tamano': tamano_seleccionado,
-            'precio': float(precio),
-            'cantidad': 1
-        })
-        
-        self.set_temporary_value(numero_whatsapp, 'carrito', carrito)
+        carrito = self.get_cart(numero_whatsapp)
+        carrito.add(
+            pizza_id=pizza.id,
+            pizza_nombre=pizza.nombre,
+            pizza_emoji=pizza.emoji or '🍕',
+            tamano=tamano_seleccionado,
+            precio=float(precio),
+            cantidad=pizza_parcial.get('cantidad', 1)
+        )
+        
         self.set_conversation_state(numero_whatsapp, self.ESTADOS['PEDIDO'])
         
         # Limpiar datos temporales
         self.set_temporary_value(numero_whatsapp, 'pizza_parcial', None)
         
         # Calcular total
-        total = sum(item['precio'] * item.get('cantidad', 1) for item in carrito)
+        total = carrito.total()
         
         return (f"✅ ¡Perfecto! Agregado al carrito:\n\n"
                f"{pizza.emoji or '🍕'} {pizza.nombre} - {tamano_seleccionado.title()}\n"
@@ -590,97 +681,50 @@ class EnhancedBotService:
     # Métodos heredados del BotService original...
     
     # Métodos auxiliares (reutilizados del BotService original)
+    def _conversation(self, numero_whatsapp: str) -> ConversationContext:
+        """Contexto del turno en curso (o transitorio si se llama fuera de un turno)"""
+        return ConversationContext.for_number(self.db, numero_whatsapp)
+    
     def get_cliente(self, numero_whatsapp: str) -> Cliente:
         """Obtener cliente por número de WhatsApp"""
-        return self.db.query(Cliente).filter(
-            Cliente.numero_whatsapp == numero_whatsapp
-        ).first()
+        return self._conversation(numero_whatsapp).cliente  # type: ignore
     
     def get_conversation_state(self, numero_whatsapp: str) -> str:
-        """Obtener estado de conversación persistente"""
-        state = self.db.query(ConversationState).filter(
-            ConversationState.numero_whatsapp == numero_whatsapp
-        ).first()
-        
-        if state:
-            return state.estado_actual  # type: ignore
-        else:
-            # Crear estado inicial
-            new_state = ConversationState(
-                numero_whatsapp=numero_whatsapp,
-                estado_actual=self.ESTADOS['INICIO']
-            )
-            self.db.add(new_state)
-            self.db.commit()
-            return self.ESTADOS['INICIO']
+        """Obtener estado de conversación persistente (se crea si no existe)"""
+        conversation = self._conversation(numero_whatsapp)
+        conversation.ensure_persisted()
+        return conversation.estado
     
     def set_conversation_state(self, numero_whatsapp: str, nuevo_estado: str):
         """Establecer nuevo estado de conversación"""
-        state = self.db.query(ConversationState).filter(
-            ConversationState.numero_whatsapp == numero_whatsapp
-        ).first()
-        
-        if state:
-            state.estado_actual = nuevo_estado  # type: ignore
-        else:
-            state = ConversationState(
-                numero_whatsapp=numero_whatsapp,
-                estado_actual=nuevo_estado
-            )
-            self.db.add(state)
-        
-        self.db.commit()
+        self._conversation(numero_whatsapp).set_estado(nuevo_estado)
     
     def get_conversation_context(self, numero_whatsapp: str) -> Dict:
         """Obtener contexto completo de la conversación"""
-        state = self.db.query(ConversationState).filter(
-            ConversationState.numero_whatsapp == numero_whatsapp
-        ).first()
-        
-        if state and state.datos_temporales:  # type: ignore
-            try:
-                return json.loads(state.datos_temporales)  # type: ignore
-            except json.JSONDecodeError:
-                return {}
-        
-        return {}
+        conversation = self._conversation(numero_whatsapp)
+        contexto = conversation.get_datos()
+        contexto['carrito'] = self.get_cart(numero_whatsapp).items()
+        contexto['historial'] = conversation.get_history()
+        return contexto
+    
+    def get_cart(self, numero_whatsapp: str) -> CartRepository:
+        """Obtener el carrito normalizado del número"""
+        return get_cart(self.db, numero_whatsapp)
     
     def get_temporary_value(self, numero_whatsapp: str, key: str):
         """Obtener valor temporal de la conversación"""
-        context = self.get_conversation_context(numero_whatsapp)
-        return context.get(key)
+        return self._conversation(numero_whatsapp).get_value(key)
     
     def set_temporary_value(self, numero_whatsapp: str, key: str, value):
         """Establecer valor temporal en la conversación"""
-        context = self.get_conversation_context(numero_whatsapp)
-        context[key] = value
-        
-        # Guardar en base de datos
-        state = self.db.query(ConversationState).filter(
-            ConversationState.numero_whatsapp == numero_whatsapp
-        ).first()
-        
-        if state:
-            state.datos_temporales = json.dumps(context)  # type: ignore
-        else:
-            state = ConversationState(
-                numero_whatsapp=numero_whatsapp,
-                datos_temporales=json.dumps(context)
-            )
-            self.db.add(state)
-        
-        self.db.commit()
+        self._conversation(numero_whatsapp).set_value(key, value)
     
     def clear_conversation_data(self, numero_whatsapp: str):
         """Limpiar datos de conversación"""
         try:
-            # Eliminar estado de conversación de la base de datos
-            self.db.query(ConversationState).filter(
-                ConversationState.numero_whatsapp == numero_whatsapp
-            ).delete()
-            
-            self.db.commit()
-            
+            CartRepository(self.db, numero_whatsapp).clear()
+            # Eliminar estado de conversación (al cerrar el turno)
+            self._conversation(numero_whatsapp).clear(self.ESTADOS['INICIO'], delete_row=True)
             logger.info(f"🧹 Conversación limpiada para {numero_whatsapp}")
             
         except Exception as e:
@@ -765,24 +809,9 @@ class EnhancedBotService:
                     await self.execute_ai_action(numero_whatsapp, 'agregar_pizza', response.get('datos_extraidos', {}), cliente)
                     
                     # Mostrar carrito actualizado
-                    carrito = self.get_temporary_value(numero_whatsapp, 'carrito') or []
-                    total = sum(item['precio'] * item.get('cantidad', 1) for item in carrito)
-                    
-                    mensaje_respuesta = "✅ Pizza agregada al carrito!\n\n"
-                    mensaje_respuesta += "*Carrito actual:*\n"
-                    for item in carrito:
-                        emoji = item.get('pizza_emoji', '🍕')
-                        cantidad = item.get('cantidad', 1)
-                        precio_total = item['precio'] * cantidad
-                        mensaje_respuesta += f"• {emoji} {item['pizza_nombre']} - {item['tamano'].title()}\n"
-                        mensaje_respuesta += f"  ${item['precio']:.2f} x {cantidad} = ${precio_total:.2f}\n"
-                    
-                    mensaje_respuesta += f"\n*Total: ${total:.2f}*\n\n"
-                    mensaje_respuesta += "¿Quieres agregar algo más?\n"
-                    mensaje_respuesta += "• Escribe el nombre de otra pizza\n"
-                    mensaje_respuesta += "• Escribe 'confirmar' para finalizar el pedido\n"
-                    mensaje_respuesta += "• Escribe 'cancelar' para cancelar"
-                    
+                    mensaje_respuesta = self._cart_message(
+                        self.get_cart(numero_whatsapp).items(), "✅ Pizza agregada al carrito!"
+                    )
                     return self._send_response_with_context(numero_whatsapp, mensaje_respuesta)
                 
                 # Si la IA sugiere modificar o reemplazar el carrito
@@ -792,7 +821,7 @@ class EnhancedBotService:
                         await self.execute_ai_action(numero_whatsapp, accion, response.get('datos_extraidos', {}), cliente)
                     
                     # Mostrar carrito actualizado
-                    carrito = self.get_temporary_value(numero_whatsapp, 'carrito') or []
+                    carrito = self.get_cart(numero_whatsapp).items()
                     
                     if not carrito:
                         return self._send_response_with_context(
@@ -833,7 +862,7 @@ class EnhancedBotService:
     
     def _get_helpful_fallback_message(self, numero_whatsapp: str) -> str:
         """Obtener mensaje de respaldo útil cuando no se entiende el mensaje del usuario"""
-        carrito = self.get_temporary_value(numero_whatsapp, 'carrito') or []
+        carrito = self.get_cart(numero_whatsapp).items()
         
         fallback_msg = "🤔 No estoy seguro de entender tu mensaje.\n\n"
         
@@ -908,10 +937,13 @@ class EnhancedBotService:
         self.set_temporary_value(numero_whatsapp, 'direccion', direccion_entrega)
         self.set_conversation_state(numero_whatsapp, self.ESTADOS['CONFIRMACION'])
         
-        # Obtener carrito
-        carrito = self.get_temporary_value(numero_whatsapp, 'carrito') or []
-        
-        # Calcular total
+        return self._send_response_with_context(
+            numero_whatsapp,
+            self._order_summary_message(self.get_cart(numero_whatsapp).items(), direccion_entrega)
+        )
+    
+    def _order_summary_message(self, carrito: List[Dict], direccion_entrega: str) -> str:
+        """Resumen del pedido con la dirección, para confirmar"""
         total = sum(item['precio'] * item.get('cantidad', 1) for item in carrito)
         
         # Generar resumen
@@ -929,8 +961,7 @@ class EnhancedBotService:
         mensaje_respuesta += "¿Confirmas tu pedido?\n"
         mensaje_respuesta += "• Escribe 'sí' para confirmar\n"
         mensaje_respuesta += "• Escribe 'no' para cancelar"
-        
-        return self._send_response_with_context(numero_whatsapp, mensaje_respuesta)
+        return mensaje_respuesta
     
     async def handle_confirmacion(self, numero_whatsapp: str, mensaje: str, cliente: Cliente) -> str:
         """Confirmar pedido - Versión mejorada con resolución de ambigüedades"""
@@ -966,7 +997,7 @@ class EnhancedBotService:
     
     async def _process_order_confirmation(self, numero_whatsapp: str, cliente: Cliente) -> str:
         """Procesar confirmación del pedido"""
-        carrito = self.get_temporary_value(numero_whatsapp, 'carrito') or []
+        carrito = self.get_cart(numero_whatsapp).items()
         direccion = self.get_temporary_value(numero_whatsapp, 'direccion') or ""
         
         if not carrito:
@@ -1008,7 +1039,7 @@ class EnhancedBotService:
     
     async def _ask_for_confirmation_clarification(self, numero_whatsapp: str, mensaje_original: str, cliente: Cliente) -> str:
         """Pedir clarificación cuando no se entiende la respuesta de confirmación"""
-        carrito = self.get_temporary_value(numero_whatsapp, 'carrito') or []
+        carrito = self.get_cart(numero_whatsapp).items()
         direccion = self.get_temporary_value(numero_whatsapp, 'direccion') or ""
         total = sum(item['precio'] * item.get('cantidad', 1) for item in carrito)
         
@@ -5,8 +5,9 @@ Clase base para todos los handlers del bot
 from abc import ABC, abstractmethod
 from sqlalchemy.orm import Session
 from typing import Optional, Dict, Any
+from app.services.conversation_context import ConversationContext
+from app.services.cart_repository import CartRepository, get_cart
 import logging
-import json
 
 logger = logging.getLogger(__name__)
 
@@ -32,73 +33,46 @@ class BaseHandler(ABC):
         }
     
     # Métodos de utilidad compartidos
+    def _conversation(self, numero_whatsapp: str) -> ConversationContext:
+        """Contexto del turno en curso (o transitorio si se llama fuera de un turno)"""
+        return ConversationContext.for_number(self.db, numero_whatsapp)
+
+    def get_cliente(self, numero_whatsapp: str):
+        """Obtener el cliente del número (una consulta por turno)"""
+        return self._conversation(numero_whatsapp).cliente
+
+    def get_cart(self, numero_whatsapp: str) -> CartRepository:
+        """Obtener el carrito normalizado del número"""
+        return get_cart(self.db, numero_whatsapp)
+
+    def get_conversation_state(self, numero_whatsapp: str) -> str:
+        """Obtener el estado actual de la conversación"""
+        return self._conversation(numero_whatsapp).estado
+
     def get_temporary_data(self, numero_whatsapp: str) -> dict:
         """Obtener datos temporales de la conversación"""
-        from app.models.conversation_state import ConversationState
-        
-        conv_state = self.db.query(ConversationState).filter(
-            ConversationState.numero_whatsapp == numero_whatsapp
-        ).first()
-        
-        if conv_state and conv_state.datos_temporales is not None:
-            try:
-                return json.loads(str(conv_state.datos_temporales))
-            except:
-                return {}
-        
-        return {}
+        return self._conversation(numero_whatsapp).get_datos()
 
     def get_temporary_value(self, numero_whatsapp: str, key: str):
         """Obtener un valor específico de los datos temporales"""
-        datos = self.get_temporary_data(numero_whatsapp)
-        return datos.get(key)
+        return self._conversation(numero_whatsapp).get_value(key)
 
     def set_temporary_value(self, numero_whatsapp: str, key: str, value):
         """Guardar un valor específico en los datos temporales"""
-        datos = self.get_temporary_data(numero_whatsapp)
-        datos[key] = value
-        self.set_temporary_data(numero_whatsapp, datos)
+        self._conversation(numero_whatsapp).set_value(key, value)
 
     def set_temporary_data(self, numero_whatsapp: str, datos: dict):
         """Guardar datos temporales de la conversación"""
-        from app.models.conversation_state import ConversationState
-        
-        conv_state = self.db.query(ConversationState).filter(
-            ConversationState.numero_whatsapp == numero_whatsapp
-        ).first()
-        
-        if not conv_state:
-            conv_state = ConversationState(numero_whatsapp=numero_whatsapp)
-            self.db.add(conv_state)
-        
-        setattr(conv_state, 'datos_temporales', json.dumps(datos))
-        self.db.commit()
+        self._conversation(numero_whatsapp).replace_datos(datos)
 
     def set_conversation_state(self, numero_whatsapp: str, estado: str):
         """Cambiar estado de la conversación"""
-        from app.models.conversation_state import ConversationState
-        
-        conv_state = self.db.query(ConversationState).filter(
-            ConversationState.numero_whatsapp == numero_whatsapp
-        ).first()
-        
-        if not conv_state:
-            conv_state = ConversationState(numero_whatsapp=numero_whatsapp)
-            self.db.add(conv_state)
-        
-        setattr(conv_state, 'estado_actual', estado)
-        self.db.commit()
+        self._conversation(numero_whatsapp).set_estado(estado)
         logger.info(f"💾 Estado guardado - Usuario: {numero_whatsapp}, Estado: {estado}")
 
     def clear_conversation_data(self, numero_whatsapp: str):
         """Limpiar datos de conversación"""
-        from app.models.conversation_state import ConversationState
-        
-        conv_state = self.db.query(ConversationState).filter(
-            ConversationState.numero_whatsapp == numero_whatsapp
-        ).first()
-        
-        if conv_state:
-            setattr(conv_state, 'estado_actual', self.ESTADOS['INICIO'])
-            setattr(conv_state, 'datos_temporales', None)
-            self.db.commit()
+        CartRepository(self.db, numero_whatsapp).clear()
+        conversation = self._conversation(numero_whatsapp)
+        if conversation.exists:
+            conversation.clear(self.ESTADOS['INICIO'])
@@ -34,11 +34,7 @@ class InfoHandler(BaseHandler):
         """
         Muestra información del usuario
         """
-        from app.models.cliente import Cliente
-        
-        usuario = self.db.query(Cliente).filter(
-            Cliente.numero_whatsapp == numero_whatsapp
-        ).first()
+        usuario = self.get_cliente(numero_whatsapp)
         
         if not usuario:
             return {
@@ -195,12 +191,9 @@ class InfoHandler(BaseHandler):
         """
         Maneja consultas de estado de pedido
         """
-        from app.models.cliente import Cliente
         from app.models.pedido import Pedido
         
-        usuario = self.db.query(Cliente).filter(
-            Cliente.numero_whatsapp == numero_whatsapp
-        ).first()
+        usuario = self.get_cliente(numero_whatsapp)
         
         if not usuario:
             return {
@@ -3,6 +3,8 @@ Handler para manejar el menú principal del bot
 """
 
 from .base_handler import BaseHandler
+from app.services.menu_catalog import get_menu_catalog
+from app.services.menu_renderer import MENU, ORIGINAL, menu_renderer
 from typing import Dict, Any, Optional
 import logging
 
@@ -20,11 +22,7 @@ class MenuHandler(BaseHandler):
         logger.info(f"🍕 Mostrando menú para: {numero_whatsapp}")
         
         # Verificar si el usuario está registrado
-        from app.models.cliente import Cliente
-        
-        usuario = self.db.query(Cliente).filter(
-            Cliente.numero_whatsapp == numero_whatsapp
-        ).first()
+        usuario = self.get_cliente(numero_whatsapp)
         
         if not usuario:
             return {
@@ -53,9 +51,7 @@ class MenuHandler(BaseHandler):
         """
         Muestra el menú de pizzas disponibles
         """
-        from app.models.pizza import Pizza
-        
-        pizzas = self.db.query(Pizza).filter(Pizza.disponible == True).all()
+        pizzas = get_menu_catalog(self.db)
         
         if not pizzas:
             return {
@@ -63,29 +59,16 @@ class MenuHandler(BaseHandler):
                 'response': "❌ No hay pizzas disponibles en este momento."
             }
         
-        menu_text = "🍕 *MENÚ DE PIZZAS* 🍕\n\n"
-        
-        for i, pizza in enumerate(pizzas, 1):
-            menu_text += f"{i}️⃣ *{pizza.nombre}* {pizza.emoji}\n"
-            menu_text += f"   📝 {pizza.descripcion}\n"
-            menu_text += f"   💰 Pequeña: ${pizza.precio_pequena:.2f}\n"
-            menu_text += f"   💰 Mediana: ${pizza.precio_mediana:.2f}\n"
-            menu_text += f"   💰 Grande: ${pizza.precio_grande:.2f}\n\n"
-        
-        menu_text += "Para hacer un pedido, escribe *2* o *pedido*"
-        
         return {
             'success': True,
-            'response': menu_text
+            'response': menu_renderer.render(pizzas, MENU)
         }
     
     def _show_pizza_menu_original_style(self) -> Dict[str, Any]:
         """
         Muestra el menú de pizzas en estilo original (compatible con bot_service original)
         """
-        from app.models.pizza import Pizza
-        
-        pizzas = self.db.query(Pizza).filter(Pizza.disponible == True).all()
+        pizzas = get_menu_catalog(self.db)
         
         if not pizzas:
             return {
@@ -93,24 +76,9 @@ class MenuHandler(BaseHandler):
                 'response': "❌ No hay pizzas disponibles en este momento."
             }
         
-        mensaje = "🍕 *MENÚ DE PIZZAS* 🍕\n\n"
-        
-        for i, pizza in enumerate(pizzas, 1):
-            mensaje += f"{i}. {pizza.emoji} *{pizza.nombre}*\n"
-            mensaje += f"   {pizza.descripcion}\n"
-            mensaje += f"   • Pequeña: ${pizza.precio_pequena:.2f}\n"
-            mensaje += f"   • Mediana: ${pizza.precio_mediana:.2f}\n"
-            mensaje += f"   • Grande: ${pizza.precio_grande:.2f}\n\n"
-        
-        mensaje += "📝 *CÓMO ORDENAR:*\n"
-        mensaje += "• Una pizza: '1 mediana' o '2 grande'\n"
-        mensaje += "• Múltiples pizzas: '1 grande, 2 mediana'\n"
-        mensaje += "• También: '1 grande, 3 pequeña, 2 mediana'\n\n"
-        mensaje += "¿Qué pizzas te gustaría ordenar? 🍕"
-        
         return {
             'success': True,
-            'response': mensaje,
+            'response': menu_renderer.render(pizzas, ORIGINAL),
             'set_state': 'MENU'  # Indicar que debe establecer estado MENU
         }
     
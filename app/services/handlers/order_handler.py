@@ -3,6 +3,10 @@ Handler para manejar el proceso de pedidos
 """
 
 from .base_handler import BaseHandler
+from app.services.menu_catalog import get_menu_catalog
+from app.services.menu_renderer import ORDER, menu_renderer
+from app.services.cart_repository import add_parsed_items
+from app.services.order_parser import missing_sizes_message, parse_order
 from typing import Dict, Any, Optional, List
 import logging
 import json
@@ -21,11 +25,7 @@ class OrderHandler(BaseHandler):
         logger.info(f"🛒 Procesando pedido para: {numero_whatsapp}")
         
         # Verificar si el usuario está registrado
-        from app.models.cliente import Cliente
-        
-        usuario = self.db.query(Cliente).filter(
-            Cliente.numero_whatsapp == numero_whatsapp
-        ).first()
+        usuario = self.get_cliente(numero_whatsapp)
         
         if not usuario:
             return {
@@ -57,7 +57,12 @@ class OrderHandler(BaseHandler):
         """
         Maneja la selección de pizza (compatible con formato original)
         """
-        # Primero intentar con el formato original "1 mediana, 2 grande"
+        # Pedidos por nombre en lenguaje natural ("2 hawaianas medianas y una pepperoni grande")
+        natural = self._handle_natural_language_selection(numero_whatsapp, mensaje)
+        if natural is not None:
+            return natural
+        
+        # Luego el formato original "1 mediana, 2 grande"
         if self._is_original_format_selection(mensaje):
             return self._handle_original_format_selection(numero_whatsapp, mensaje)
         
@@ -265,32 +270,14 @@ class OrderHandler(BaseHandler):
         """
         Busca una pizza por nombre o número
         """
-        from app.models.pizza import Pizza
-        
-        # Intentar buscar por número
-        try:
-            numero = int(input_text.strip())
-            pizzas = self.db.query(Pizza).filter(Pizza.disponible == True).all()
-            if 1 <= numero <= len(pizzas):
-                return pizzas[numero - 1]
-        except ValueError:
-            pass
-        
-        # Buscar por nombre (búsqueda parcial)
-        pizza = self.db.query(Pizza).filter(
-            Pizza.disponible == True,
-            Pizza.nombre.ilike(f'%{input_text}%')
-        ).first()
-        
-        return pizza
+        # Por número de menú o por nombre (búsqueda parcial), sin consultar la BD
+        return get_menu_catalog(self.db).find(input_text)
     
     def _show_pizza_menu_for_order(self) -> Dict[str, Any]:
         """
         Muestra el menú de pizzas para pedido
         """
-        from app.models.pizza import Pizza
-        
-        pizzas = self.db.query(Pizza).filter(Pizza.disponible == True).all()
+        pizzas = get_menu_catalog(self.db)
         
         if not pizzas:
             return {
@@ -298,20 +285,9 @@ class OrderHandler(BaseHandler):
                 'response': "❌ No hay pizzas disponibles en este momento."
             }
         
-        menu_text = "🍕 *MENÚ DE PIZZAS* 🍕\n\n"
-        
-        for i, pizza in enumerate(pizzas, 1):
-            menu_text += f"{i}️⃣ *{pizza.nombre}* {getattr(pizza, 'emoji', '🍕')}\n"
-            menu_text += f"   📝 {pizza.descripcion}\n"
-            menu_text += f"   💰 Pequeña: ${getattr(pizza, 'precio_pequena', 0):.2f}\n"
-            menu_text += f"   💰 Mediana: ${getattr(pizza, 'precio_mediana', 0):.2f}\n"
-            menu_text += f"   💰 Grande: ${getattr(pizza, 'precio_grande', 0):.2f}\n\n"
-        
-        menu_text += "Escribe el número o nombre de la pizza que deseas:"
-        
         return {
             'success': True,
-            'response': menu_text
+            'response': menu_renderer.render(pizzas, ORDER)
         }
     
     def _show_order_summary(self, numero_whatsapp: str) -> Dict[str, Any]:
@@ -493,11 +469,10 @@ class OrderHandler(BaseHandler):
             }
         
         # Obtener pizzas disponibles
-        from app.models.pizza import Pizza
-        pizzas = self.db.query(Pizza).filter(Pizza.disponible == True).all()
+        pizzas = get_menu_catalog(self.db)
         
         # Obtener carrito actual
-        carrito = self.get_temporary_value(numero_whatsapp, 'carrito') or []
+        carrito = self.get_cart(numero_whatsapp)
         
         pizzas_agregadas = []
         
@@ -515,14 +490,13 @@ class OrderHandler(BaseHandler):
                 tamano = 'grande'
             
             # Validar número de pizza
-            if numero_pizza < 1 or numero_pizza > len(pizzas):
+            pizza = pizzas.by_number(numero_pizza)
+            if pizza is None:
                 return {
                     'success': False,
                     'response': f"Por favor, selecciona un número entre 1 y {len(pizzas)}"
                 }
             
-            pizza = pizzas[numero_pizza - 1]
-            
             # Obtener precio según tamaño
             if tamano == 'pequeña':
                 precio = getattr(pizza, 'precio_pequena', 0)
@@ -531,39 +505,84 @@ class OrderHandler(BaseHandler):
             else:
                 precio = getattr(pizza, 'precio_grande', 0)
             
-            # Agregar al carrito
-            carrito.append({
-                'pizza_id': pizza.id,
-                'pizza_nombre': pizza.nombre,
-                'pizza_emoji': getattr(pizza, 'emoji', '🍕'),
-                'tamano': tamano,
-                'precio': float(precio),
-                'cantidad': 1
-            })
-            
             pizzas_agregadas.append({
+                'pizza_id': pizza.id,
                 'nombre': pizza.nombre,
                 'emoji': getattr(pizza, 'emoji', '🍕'),
                 'tamano': tamano,
                 'precio': float(precio)
             })
         
-        # Guardar carrito actualizado
-        self.set_temporary_value(numero_whatsapp, 'carrito', carrito)
+        # Agregar al carrito (solo si todas las pizzas del mensaje son válidas)
+        for pizza_agregada in pizzas_agregadas:
+            carrito.add(
+                pizza_id=pizza_agregada['pizza_id'],
+                pizza_nombre=pizza_agregada['nombre'],
+                pizza_emoji=pizza_agregada['emoji'],
+                tamano=pizza_agregada['tamano'],
+                precio=pizza_agregada['precio']
+            )
+        
+        return self._cart_updated_response(numero_whatsapp, carrito, pizzas_agregadas)
+    
+    def _handle_natural_language_selection(self, numero_whatsapp: str, mensaje: str) -> Optional[Dict[str, Any]]:
+        """
+        Maneja pedidos por nombre en lenguaje natural:
+        'dame 2 pizzas hawaianas medianas y grande de pepperoni'.
+        Retorna None si el mensaje no nombra pizzas del menú.
+        """
+        items = parse_order(mensaje, get_menu_catalog(self.db))
+        if not items:
+            return None
+        
+        # Una sola pizza sin tamaño sigue el flujo de selección de tamaño
+        if len(items) == 1 and not items[0].tamano:
+            return None
+        
+        # Las líneas con tamaño se agregan siempre, aunque falte el de otras
+        carrito = self.get_cart(numero_whatsapp)
+        agregados, sin_tamano = add_parsed_items(carrito, items)
+        if sin_tamano:
+            return {
+                'success': bool(agregados),
+                'response': missing_sizes_message(sin_tamano, agregados)
+            }
         
-        # Calcular total
-        total = sum(item['precio'] * item['cantidad'] for item in carrito)
+        lineas = [item.to_cart_line() for item in agregados]
+        pizzas_agregadas = [
+            {
+                'pizza_id': linea['pizza_id'],
+                'nombre': linea['pizza_nombre'],
+                'emoji': linea['pizza_emoji'],
+                'tamano': linea['tamano'],
+                'precio': linea['precio'],
+                'cantidad': linea['cantidad']
+            }
+            for linea in lineas
+        ]
+        return self._cart_updated_response(numero_whatsapp, carrito, pizzas_agregadas)
+    
+    def _cart_updated_response(self, numero_whatsapp: str, carrito, pizzas_agregadas: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Respuesta con lo agregado y el carrito actual; deja el pedido en curso
+        """
+        # Resumen del carrito con una sola consulta
+        items = carrito.items()
+        total = sum(item['precio'] * item['cantidad'] for item in items)
         
         # Generar mensaje de respuesta
         mensaje_respuesta = f"✅ Agregado al carrito:\n"
         for pizza_agregada in pizzas_agregadas:
-            mensaje_respuesta += f"{pizza_agregada['emoji']} {pizza_agregada['nombre']} - {pizza_agregada['tamano'].title()}\n"
+            cantidad = pizza_agregada.get('cantidad', 1)
+            prefijo = f"{cantidad} x " if cantidad > 1 else ""
+            mensaje_respuesta += f"{prefijo}{pizza_agregada['emoji']} {pizza_agregada['nombre']} - {pizza_agregada['tamano'].title()}\n"
             mensaje_respuesta += f"Precio: ${pizza_agregada['precio']:.2f}\n"
         
         mensaje_respuesta += f"\n*Carrito actual:*\n"
         
-        for item in carrito:
-            mensaje_respuesta += f"• {item['pizza_emoji']} {item['pizza_nombre']} - {item['tamano'].title()} - ${item['precio']:.2f}\n"
+        for item in items:
+            cantidad = f" x{item['cantidad']}" if item['cantidad'] > 1 else ""
+            mensaje_respuesta += f"• {item['pizza_emoji']} {item['pizza_nombre']} - {item['tamano'].title()} - ${item['precio']:.2f}{cantidad}\n"
         
         mensaje_respuesta += f"\n*Total: ${total:.2f}*\n\n"
         mensaje_respuesta += "¿Quieres agregar algo más?\n"
@@ -592,10 +611,7 @@ class OrderHandler(BaseHandler):
         
         if mensaje_limpio in ['confirmar', 'confirm', 'ok', 'si', 'yes']:
             # Proceder a solicitar dirección
-            from app.models.cliente import Cliente
-            cliente = self.db.query(Cliente).filter(
-                Cliente.numero_whatsapp == numero_whatsapp
-            ).first()
+            cliente = self.get_cliente(numero_whatsapp)
             
             if cliente and getattr(cliente, 'direccion', None):
                 direccion_cliente = getattr(cliente, 'direccion', '')
@@ -622,7 +638,10 @@ class OrderHandler(BaseHandler):
             }
         
         else:
-            # Intentar agregar otra pizza en formato original
+            # Intentar agregar otra pizza por nombre o en formato original
+            natural = self._handle_natural_language_selection(numero_whatsapp, mensaje)
+            if natural is not None:
+                return natural
             if self._is_original_format_selection(mensaje):
                 return self._handle_original_format_selection(numero_whatsapp, mensaje)
             else:
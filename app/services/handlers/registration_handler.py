@@ -20,15 +20,8 @@ class RegistrationHandler(BaseHandler):
         """
         logger.info(f"🔄 Iniciando flujo de registro para: {numero_whatsapp}")
         
-        from app.models.conversation_state import ConversationState
-        from app.models.cliente import Cliente
-        
         # Obtener estado actual
-        conv_state = self.db.query(ConversationState).filter(
-            ConversationState.numero_whatsapp == numero_whatsapp
-        ).first()
-        
-        estado_actual = getattr(conv_state, 'estado_actual', self.ESTADOS['INICIO']) if conv_state else self.ESTADOS['INICIO']
+        estado_actual = self.get_conversation_state(numero_whatsapp)
         
         # Manejar diferentes estados del registro
         if estado_actual == self.ESTADOS['INICIO']:
@@ -117,6 +110,7 @@ class RegistrationHandler(BaseHandler):
             )
             self.db.add(nuevo_usuario)
             self.db.commit()
+            self._conversation(numero_whatsapp).set_cliente(nuevo_usuario)
             
             # Limpiar datos temporales
             self.clear_conversation_data(numero_whatsapp)
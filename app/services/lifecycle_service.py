@@ -5,6 +5,13 @@ import logging
 import asyncio
 from contextlib import asynccontextmanager
 from app.services.cache_service import cache_service
+from app.services.conversation_sweeper import conversation_sweeper
+from app.services.message_queue_service import message_queue_service
+from app.services.optimized_conversation_service import conversation_state_cache
+from app.services.outbound_queue_service import outbound_message_queue
+from app.services.whatsapp_service import WhatsAppService
+from app.services.write_behind_service import conversation_write_behind
+from config.settings import settings
 
 logger = logging.getLogger(__name__)
 
@@ -13,7 +20,7 @@ class AppLifecycleManager:
     
     def __init__(self):
         self.cache_cleanup_task = None
-        self.cleanup_interval = 3600  # 1 hora en segundos
+        self.cleanup_interval = settings.CLEANUP_INTERVAL  # 1 hora por defecto
     
     async def startup(self):
         """Inicialización de servicios al arrancar la app"""
@@ -23,6 +30,17 @@ class AppLifecycleManager:
             # Conectar a Redis
             await cache_service.connect()
             
+            # Iniciar el volcado periódico de conversaciones (modo write-behind)
+            await conversation_write_behind.start()
+            
+            # Iniciar workers de la cola de mensajes entrantes
+            if settings.WEBHOOK_ASYNC_PROCESSING:
+                await message_queue_service.start()
+            
+            # Iniciar workers de la cola de mensajes salientes
+            if settings.OUTBOUND_QUEUE_ENABLED:
+                await outbound_message_queue.start()
+            
             # Iniciar tarea de limpieza periódica
             self.cache_cleanup_task = asyncio.create_task(self._periodic_cleanup())
             
@@ -45,6 +63,18 @@ class AppLifecycleManager:
                 except asyncio.CancelledError:
                     pass
             
+            # Procesar los mensajes pendientes y detener los workers
+            await message_queue_service.stop()
+            
+            # Enviar las respuestas pendientes (después de la cola entrante, que las produce)
+            await outbound_message_queue.stop()
+            
+            # Cerrar las conexiones HTTP del cliente Twilio compartido
+            await WhatsAppService.close_shared_client()
+            
+            # Escribir en la BD las conversaciones pendientes (antes de soltar Redis)
+            await conversation_write_behind.stop()
+            
             # Desconectar Redis
             await cache_service.disconnect()
             
@@ -60,8 +90,12 @@ class AppLifecycleManager:
                 await asyncio.sleep(self.cleanup_interval)
                 logger.debug("🧹 Ejecutando limpieza periódica de caché...")
                 
-                # Aquí se pueden agregar más tareas de limpieza
-                # Por ejemplo: limpiar sesiones expiradas, logs antiguos, etc.
+                # Eliminar conversaciones y carritos abandonados
+                await conversation_sweeper.sweep()
+                
+                # Liberar las entradas expiradas de los cachés en memoria
+                conversation_state_cache.purge_expired()
+                cache_service.local.purge_expired()
                 
             except asyncio.CancelledError:
                 break
@@ -0,0 +1,340 @@
+"""
+Catálogo de pizzas en memoria (snapshot inmutable y versionado)
+
+El menú se lee una sola vez de la base de datos y se comparte entre todos los
+consumidores (handlers, servicio de IA, routers) con índices por id, número
+de menú y nombre. La versión es un hash del contenido, así que cambia cuando
+cambian la disponibilidad o los precios, y es la misma en todos los workers.
+
+Cuándo se recarga:
+- Al hacer commit de una sesión que insertó, modificó o eliminó pizzas
+  (eventos de SQLAlchemy, incluidos UPDATE/DELETE masivos).
+- Cuando otro worker avisa por el canal de invalidaciones de Redis.
+- Al vencer MENU_CATALOG_TTL, para cambios hechos fuera de la app.
+"""
+import asyncio
+import hashlib
+import logging
+import threading
+import time
+import weakref
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from app.models.pizza import Pizza
+from app.services.cache_service import cache_service
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Clave que se publica en el canal de invalidaciones cuando cambia el menú
+MENU_CATALOG_KEY = "menu:catalog"
+
+# Marca en session.info de una sesión con cambios de pizzas sin confirmar
+_SESSION_FLAG = "menu_catalog_dirty"
+
+
+def normalize_name(nombre: str) -> str:
+    """Nombre en minúsculas y sin espacios sobrantes, para los índices"""
+    return " ".join(str(nombre or "").lower().split())
+
+
+class CatalogPizza:
+    """Pizza del catálogo: mismos atributos que el modelo, de solo lectura"""
+
+    __slots__ = (
+        'id', 'numero', 'nombre', 'descripcion', 'emoji',
+        'precio_pequena', 'precio_mediana', 'precio_grande', 'disponible'
+    )
+
+    def __init__(self, pizza: Any, numero: Optional[int]):
+        for field, value in (
+            ('id', pizza.id),
+            ('numero', numero),
+            ('nombre', pizza.nombre),
+            ('descripcion', pizza.descripcion),
+            ('emoji', pizza.emoji),
+            ('precio_pequena', pizza.precio_pequena),
+            ('precio_mediana', pizza.precio_mediana),
+            ('precio_grande', pizza.precio_grande),
+            ('disponible', bool(pizza.disponible))
+        ):
+            object.__setattr__(self, field, value)
+
+    def __setattr__(self, name: str, value: Any):
+        raise AttributeError("CatalogPizza es de solo lectura")
+
+    def __delattr__(self, name: str):
+        raise AttributeError("CatalogPizza es de solo lectura")
+
+    def __repr__(self):
+        return f"<CatalogPizza(numero={self.numero}, nombre='{self.nombre}')>"
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Representación para la API"""
+        return {
+            "id": self.id,
+            "nombre": self.nombre,
+            "descripcion": self.descripcion,
+            "precio_pequena": self.precio_pequena,
+            "precio_mediana": self.precio_mediana,
+            "precio_grande": self.precio_grande,
+            "emoji": self.emoji
+        }
+
+
+class MenuCatalog:
+    """Snapshot del menú con índices por id, número y nombre"""
+
+    __slots__ = ('pizzas', 'version', 'loaded_at', '_by_id', '_by_name', '_name_index')
+
+    def __init__(self, rows: List[Any]):
+        entries: List[CatalogPizza] = []
+        by_id: Dict[int, CatalogPizza] = {}
+        numero = 0
+        for row in rows:
+            if row.disponible:
+                numero += 1
+                entry = CatalogPizza(row, numero)
+                entries.append(entry)
+            else:
+                entry = CatalogPizza(row, None)
+            by_id[entry.id] = entry
+
+        # Solo las disponibles, en el orden del menú (numero - 1)
+        self.pizzas: Tuple[CatalogPizza, ...] = tuple(entries)
+        self._by_id = by_id
+        self._by_name: Dict[str, CatalogPizza] = {}
+        for entry in self.pizzas:
+            self._by_name.setdefault(normalize_name(entry.nombre), entry)
+        self.version = self._compute_version(by_id.values())
+        self.loaded_at = time.time()
+        self._name_index = None
+
+    @staticmethod
+    def _compute_version(entries: Any) -> str:
+        """Hash del contenido: cambia con la disponibilidad, los precios o el texto"""
+        digest = hashlib.sha1()
+        for entry in sorted(entries, key=lambda e: e.id):
+            digest.update(repr((
+                entry.id, entry.nombre, entry.descripcion, entry.emoji, entry.disponible,
+                entry.precio_pequena, entry.precio_mediana, entry.precio_grande
+            )).encode('utf-8'))
+        return digest.hexdigest()[:16]
+
+    def __len__(self) -> int:
+        return len(self.pizzas)
+
+    def __iter__(self) -> Iterator[CatalogPizza]:
+        return iter(self.pizzas)
+
+    def get(self, pizza_id: Any) -> Optional[CatalogPizza]:
+        """Pizza por id (incluye las no disponibles, como una consulta por id)"""
+        try:
+            return self._by_id.get(int(pizza_id))
+        except (TypeError, ValueError):
+            return None
+
+    def by_number(self, numero: Any) -> Optional[CatalogPizza]:
+        """Pizza disponible por número de menú (empieza en 1)"""
+        try:
+            numero = int(numero)
+        except (TypeError, ValueError):
+            return None
+        if 1 <= numero <= len(self.pizzas):
+            return self.pizzas[numero - 1]
+        return None
+
+    def by_name(self, nombre: str) -> Optional[CatalogPizza]:
+        """Pizza disponible con ese nombre exacto (sin distinguir mayúsculas)"""
+        return self._by_name.get(normalize_name(nombre))
+
+    def search(self, texto: str) -> Optional[CatalogPizza]:
+        """Primera pizza disponible cuyo nombre contiene el texto (como ILIKE '%texto%')"""
+        texto = str(texto or "").strip().lower()
+        if not texto:
+            return None
+        exact = self.by_name(texto)
+        if exact is not None:
+            return exact
+        for entry in self.pizzas:
+            if texto in entry.nombre.lower():
+                return entry
+        return None
+
+    @property
+    def name_index(self):
+        """Índice difuso de nombres (se construye la primera vez que se usa)"""
+        if self._name_index is None:
+            from app.services.pizza_name_index import PizzaNameIndex
+            self._name_index = PizzaNameIndex(self.pizzas)
+        return self._name_index
+
+    def match(self, texto: str, min_score: Optional[float] = None):
+        """
+        Pizza mencionada en el texto, tolerando errores de tipeo y acentos.
+        Retorna un NameMatch (pizza, confianza y texto que coincidió) o None.
+        """
+        if min_score is None:
+            min_score = settings.MENU_FUZZY_MIN_SCORE
+        return self.name_index.match(texto, min_score)
+
+    def find(self, identifier: str) -> Optional[CatalogPizza]:
+        """Pizza por número de menú, por nombre parcial o, si no, por nombre aproximado"""
+        identifier = str(identifier or "").strip()
+        if identifier.isdigit():
+            pizza = self.by_number(identifier)
+            if pizza is not None:
+                return pizza
+        pizza = self.search(identifier)
+        if pizza is not None:
+            return pizza
+        match = self.match(identifier)
+        return match.pizza if match else None
+
+
+class MenuCatalogProvider:
+    """Un catálogo por engine, recargado cuando cambian las pizzas"""
+
+    def __init__(self, ttl_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        # engine -> (catálogo, expira_en); cada engine de pruebas tiene su catálogo
+        self._catalogs: "weakref.WeakKeyDictionary[Any, Tuple[MenuCatalog, float]]" = weakref.WeakKeyDictionary()
+        self._generation = 0
+        self._lock = threading.Lock()
+
+        # Métricas
+        self.hits = 0
+        self.loads = 0
+        self.invalidations = 0
+
+    def get(self, db: Session) -> MenuCatalog:
+        """Catálogo vigente para el engine de la sesión (lo carga si hace falta)"""
+        engine = db.get_bind()
+        now = time.monotonic()
+        with self._lock:
+            cached = self._catalogs.get(engine)
+            if cached is not None and cached[1] > now:
+                self.hits += 1
+                return cached[0]
+            generation = self._generation
+
+        catalog = MenuCatalog(db.query(Pizza).order_by(Pizza.id).all())
+
+        with self._lock:
+            self.loads += 1
+            # No guardar lo leído si hubo una invalidación durante la carga o si
+            # la sesión tiene cambios de pizzas sin confirmar
+            if generation == self._generation and not db.info.get(_SESSION_FLAG):
+                self._catalogs[engine] = (catalog, now + self.ttl_seconds)
+        logger.debug(f"📋 Catálogo de pizzas cargado (versión {catalog.version}, {len(catalog)} disponibles)")
+        return catalog
+
+    def invalidate(self, engine: Any = None):
+        """Descartar el catálogo de un engine (o de todos)"""
+        with self._lock:
+            self._generation += 1
+            self.invalidations += 1
+            if engine is None:
+                self._catalogs.clear()
+            else:
+                self._catalogs.pop(engine, None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Obtener métricas del catálogo para monitoreo"""
+        with self._lock:
+            versions = [catalog.version for catalog, _ in self._catalogs.values()]
+            return {
+                'catalogs': len(versions),
+                'versions': versions,
+                'ttl_seconds': self.ttl_seconds,
+                'hits': self.hits,
+                'loads': self.loads,
+                'invalidations': self.invalidations
+            }
+
+
+# Instancia global del catálogo
+menu_catalog = MenuCatalogProvider(ttl_seconds=settings.MENU_CATALOG_TTL)
+
+# Tareas de publicación en curso (referencia fuerte hasta que terminen)
+_publish_tasks: set = set()
+
+
+def get_menu_catalog(db: Session) -> MenuCatalog:
+    """Catálogo de pizzas vigente para la sesión"""
+    return menu_catalog.get(db)
+
+
+def _publish_catalog_change():
+    """Avisar a los demás workers que el menú cambió"""
+    if not cache_service.enabled or cache_service.redis is None:
+        return
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        # Commit hecho desde un hilo del threadpool: usar el loop del listener
+        listener = cache_service._invalidation_task
+        if listener is None or listener.done():
+            logger.debug("📋 Sin event loop para avisar el cambio de menú; lo cubre el TTL")
+            return
+        asyncio.run_coroutine_threadsafe(cache_service.delete_many([MENU_CATALOG_KEY]), listener.get_loop())
+        return
+    task = loop.create_task(cache_service.delete_many([MENU_CATALOG_KEY]))
+    _publish_tasks.add(task)
+    task.add_done_callback(_publish_tasks.discard)
+
+
+def _on_cache_invalidation(keys):
+    """Recargar el catálogo cuando otro worker cambió el menú"""
+    if keys is None or MENU_CATALOG_KEY in keys:
+        menu_catalog.invalidate()
+
+
+cache_service.add_invalidation_listener(_on_cache_invalidation)
+
+
+# ----------------------------------------------------------------------
+# Eventos de SQLAlchemy: marcar la sesión al tocar pizzas e invalidar al
+# confirmar (o al deshacer, por si se leyó el catálogo con cambios a medias)
+# ----------------------------------------------------------------------
+@event.listens_for(Session, "after_flush")
+def _mark_pizza_changes(session, flush_context):
+    if any(isinstance(obj, Pizza) for obj in (*session.new, *session.dirty, *session.deleted)):
+        session.info[_SESSION_FLAG] = True
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _mark_bulk_pizza_changes(orm_execute_state):
+    if (orm_execute_state.is_update or orm_execute_state.is_delete or orm_execute_state.is_insert) \
+            and orm_execute_state.bind_mapper is not None \
+            and orm_execute_state.bind_mapper.class_ is Pizza:
+        orm_execute_state.session.info[_SESSION_FLAG] = True
+
+
+def _session_engine(session) -> Any:
+    """Engine de la sesión, o None (todos) si no tiene uno único"""
+    try:
+        return session.get_bind()
+    except Exception:
+        return None
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_on_commit(session):
+    # Liberar un SAVEPOINT no confirma nada todavía
+    if session.in_nested_transaction():
+        return
+    if session.info.pop(_SESSION_FLAG, False):
+        menu_catalog.invalidate(_session_engine(session))
+        logger.info("📋 Menú modificado: catálogo de pizzas invalidado")
+        _publish_catalog_change()
+
+
+@event.listens_for(Session, "after_rollback")
+def _invalidate_on_rollback(session):
+    # Un SAVEPOINT deshecho deja la marca para el commit o rollback de la transacción
+    flagged = session.info.get(_SESSION_FLAG) if session.in_nested_transaction() \
+        else session.info.pop(_SESSION_FLAG, False)
+    if flagged:
+        menu_catalog.invalidate(_session_engine(session))
@@ -0,0 +1,138 @@
+"""
+Textos del menú pre-renderizados por versión del catálogo
+
+Cada variante del menú (handler, estilo original, selección en el pedido y
+el endpoint HTTP) se arma una sola vez por versión del catálogo y después se
+sirve el texto guardado. El ETag de /pizzas/menu/text es un hash del cuerpo
+renderizado, así que cambia con el catálogo y también con las plantillas.
+"""
+import hashlib
+import json
+import logging
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+from app.services.menu_catalog import CatalogPizza, MenuCatalog
+from app.utils.bounded_cache import BoundedTTLCache
+
+logger = logging.getLogger(__name__)
+
+# Variantes del menú
+MENU = "menu"  # MenuHandler._show_pizza_menu
+ORIGINAL = "original"  # MenuHandler._show_pizza_menu_original_style
+ORDER = "order"  # OrderHandler._show_pizza_menu_for_order
+API = "api"  # GET /pizzas/menu/text
+
+# Versiones que se conservan (la vigente y las recientes, por si hay varios engines)
+MAX_VERSIONS = 8
+# La versión identifica el contenido, así que el texto no vence; el TTL solo libera memoria
+RENDER_TTL_SECONDS = 24 * 3600
+
+MENU_HEADER = "🍕 *MENÚ DE PIZZAS* 🍕\n\n"
+
+
+def _numbered_item(i: int, pizza: CatalogPizza) -> str:
+    return (
+        f"{i}️⃣ *{pizza.nombre}* {pizza.emoji}\n"
+        f"   📝 {pizza.descripcion}\n"
+        f"   💰 Pequeña: ${pizza.precio_pequena:.2f}\n"
+        f"   💰 Mediana: ${pizza.precio_mediana:.2f}\n"
+        f"   💰 Grande: ${pizza.precio_grande:.2f}\n\n"
+    )
+
+
+def _classic_item(i: int, pizza: CatalogPizza) -> str:
+    return (
+        f"{i}. {pizza.emoji} *{pizza.nombre}*\n"
+        f"   {pizza.descripcion}\n"
+        f"   • Pequeña: ${pizza.precio_pequena:.2f}\n"
+        f"   • Mediana: ${pizza.precio_mediana:.2f}\n"
+        f"   • Grande: ${pizza.precio_grande:.2f}\n\n"
+    )
+
+
+def _render(pizzas: Iterable[CatalogPizza], item: Callable[[int, CatalogPizza], str], footer: str) -> str:
+    return MENU_HEADER + "".join(item(i, pizza) for i, pizza in enumerate(pizzas, 1)) + footer
+
+
+# Variante -> (formato de cada pizza, pie del menú)
+TEMPLATES: Dict[str, Tuple[Callable[[int, CatalogPizza], str], str]] = {
+    MENU: (_numbered_item, "Para hacer un pedido, escribe *2* o *pedido*"),
+    ORIGINAL: (
+        _classic_item,
+        "📝 *CÓMO ORDENAR:*\n"
+        "• Una pizza: '1 mediana' o '2 grande'\n"
+        "• Múltiples pizzas: '1 grande, 2 mediana'\n"
+        "• También: '1 grande, 3 pequeña, 2 mediana'\n\n"
+        "¿Qué pizzas te gustaría ordenar? 🍕"
+    ),
+    ORDER: (_numbered_item, "Escribe el número o nombre de la pizza que deseas:"),
+    API: (
+        _classic_item,
+        "Para hacer un pedido, responde con el número de la pizza y el tamaño.\n"
+        "Ejemplo: '1 mediana' o '2 grande'"
+    ),
+}
+
+
+class RenderedMenu:
+    """Todas las variantes del menú para una versión del catálogo"""
+
+    __slots__ = ('version', 'texts', 'etag', 'api_body')
+
+    def __init__(self, catalog: MenuCatalog):
+        self.version = catalog.version
+        self.texts: Dict[str, str] = {
+            variant: _render(catalog, item, footer) for variant, (item, footer) in TEMPLATES.items()
+        }
+        # Cuerpo JSON ya codificado, igual al que generaría JSONResponse
+        self.api_body = json.dumps(
+            {"menu": self.texts[API]}, ensure_ascii=False, separators=(",", ":")
+        ).encode("utf-8")
+        self.etag = f'"{hashlib.sha1(self.api_body).hexdigest()[:16]}"'
+
+
+class MenuRenderer:
+    """Caché de menús renderizados por versión del catálogo"""
+
+    def __init__(self, max_versions: int = MAX_VERSIONS):
+        self._cache = BoundedTTLCache(max_versions, RENDER_TTL_SECONDS, name="menu_render")
+        self.renders = 0
+
+    def rendered(self, catalog: MenuCatalog) -> RenderedMenu:
+        """Variantes de la versión del catálogo (las arma la primera vez)"""
+        menu: Optional[RenderedMenu] = self._cache.get(catalog.version)
+        if menu is None:
+            menu = RenderedMenu(catalog)
+            self._cache.set(catalog.version, menu)
+            self.renders += 1
+            logger.debug(f"📋 Menú renderizado para la versión {catalog.version}")
+        return menu
+
+    def render(self, catalog: MenuCatalog, variant: str) -> str:
+        """Texto de una variante del menú"""
+        return self.rendered(catalog).texts[variant]
+
+    def clear(self):
+        self._cache.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Obtener métricas del renderizado para monitoreo"""
+        return {**self._cache.get_stats(), 'renders': self.renders}
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Indica si el encabezado If-None-Match incluye el ETag (comparación débil)"""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+# Instancia global del renderizador
+menu_renderer = MenuRenderer()
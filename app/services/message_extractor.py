@@ -0,0 +1,90 @@
+"""
+Extracción de un mensaje completo: saludo + pedido + dirección
+
+Cuando el cliente escribe todo de una vez ("Hola, me mandas una pizza hawaiana
+grande a esta direccion: Calle 5 #12-30"), el mensaje se divide en segmentos:
+el saludo del comienzo, el pedido y la dirección (desde el marcador de
+dirección hasta el final). El pedido se lee con order_parser, sin IA, y solo
+si el mensaje muestra intención de pedir y no es una pregunta.
+"""
+import re
+from typing import List, Optional
+from app.services.menu_catalog import MenuCatalog
+from app.services.order_parser import ParsedItem, is_question, parse_order
+
+# Saludos al comienzo del mensaje ("hola", "buenas tardes", "hola buenas", ...)
+_GREETING = re.compile(
+    r'^\s*(?:hola|holi|buenas(?:\s+(?:tardes|noches))?|buen(?:os)?\s+d[ií]as?|hello|hey|qu[eé]\s+tal)\b[\s,.!¡]*',
+    re.IGNORECASE
+)
+
+# "a esta dirección:", "mi dirección es", "domicilio:", ... (la dirección va después)
+_ADDRESS_LABEL = re.compile(
+    r'(?:\b(?:a|en|para|por)\s+(?:esta|la|mi)\s+)?\b(?:direcci[oó]n|domicilio)\b'
+    r'(?:\s+(?:es|de\s+entrega))?\s*[:\-]?\s*',
+    re.IGNORECASE
+)
+
+# "a la calle 5 ...", "en carrera 7 ..." (la calle forma parte de la dirección)
+_ADDRESS_STREET = re.compile(
+    r'\b(?:a|en|para)\s+(?:la\s+)?(?=(?:calle|carrera|cra|avenida|av|diagonal|transversal|pasaje)\b)',
+    re.IGNORECASE
+)
+
+# Cortesías al final de la dirección
+_TRAILING_COURTESY = re.compile(r'[\s,.;!]*(?:por\s+favor|porfa|gracias)[\s.!]*$', re.IGNORECASE)
+
+# Largo mínimo de una dirección, igual que en el estado de dirección
+MIN_ADDRESS_LENGTH = 10
+
+
+class ExtractedMessage:
+    """Segmentos del mensaje: saludo, texto del pedido, líneas leídas y dirección"""
+
+    __slots__ = ('saludo', 'pedido', 'items', 'direccion')
+
+    def __init__(self, saludo: bool, pedido: str, items: Optional[List[ParsedItem]], direccion: Optional[str]):
+        self.saludo = saludo
+        self.pedido = pedido
+        self.items = items
+        self.direccion = direccion
+
+    def __repr__(self):
+        return f"<ExtractedMessage(saludo={self.saludo}, items={self.items}, direccion={self.direccion!r})>"
+
+    @property
+    def completo(self) -> bool:
+        """Hay pedido con todos los tamaños y dirección: se puede pasar a confirmar"""
+        return bool(self.items) and self.direccion is not None and all(item.tamano for item in self.items)
+
+
+def _split_address(texto: str) -> tuple:
+    """(texto antes de la dirección, dirección o None)"""
+    candidates = [m for m in (_ADDRESS_LABEL.search(texto), _ADDRESS_STREET.search(texto)) if m]
+    if not candidates:
+        return texto, None
+    marker = min(candidates, key=lambda m: m.start())
+    direccion = _TRAILING_COURTESY.sub('', texto[marker.end():]).strip(" \t\n,.;:-")
+    if len(direccion) < MIN_ADDRESS_LENGTH:
+        return texto, None
+    return texto[:marker.start()], direccion
+
+
+def extract_message(mensaje: str, catalog: MenuCatalog) -> ExtractedMessage:
+    """Dividir el mensaje en saludo, pedido y dirección y leer el pedido"""
+    texto = str(mensaje or '').strip()
+
+    saludo = False
+    match = _GREETING.match(texto)
+    while match and match.end() > 0:
+        saludo = True
+        texto = texto[match.end():]
+        match = _GREETING.match(texto)
+
+    pedido, direccion = _split_address(texto)
+    pedido = pedido.strip(" \t\n,.;:-")
+    # Una pregunta con dirección ("¿cuánto cuesta ...? vivo en Calle 10") no es un pedido;
+    # parse_order revisa además la intención de pedir del segmento del pedido
+    pregunta = '?' in texto or '¿' in texto or is_question(pedido)
+    items = parse_order(pedido, catalog) if pedido and not pregunta else None
+    return ExtractedMessage(saludo, pedido, items, direccion)
@@ -0,0 +1,233 @@
+"""
+Cola de mensajes entrantes con pool de workers (acknowledge-then-process)
+
+El webhook valida la petición, encola el mensaje y responde 200 de inmediato.
+Los workers procesan cada mensaje en segundo plano (bot + envío de respuesta),
+cada uno con su propia sesión de base de datos.
+
+Opcionalmente, los fragmentos que un mismo número envía en ráfaga se agrupan
+en un solo turno antes de entrar a la cola (ver BurstCoalescer). Si la cola
+se llena mientras la ráfaga espera su ventana, el turno ya fue confirmado a
+Twilio y se procesa fuera del pool en lugar de perderse.
+"""
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Optional, List, Dict, Any, Callable, Awaitable, Set
+from app.services.burst_coalescer import BurstCoalescer
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Función que procesa un mensaje: (numero_whatsapp, mensaje) -> resultado
+MessageProcessor = Callable[[str, str], Awaitable[Any]]
+
+
+@dataclass
+class InboundMessage:
+    """Mensaje entrante pendiente de procesar"""
+    from_number: str
+    body: str
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+class MessageQueueService:
+    """Cola asyncio de mensajes entrantes procesada por un pool de workers"""
+
+    def __init__(
+        self,
+        num_workers: Optional[int] = None,
+        maxsize: Optional[int] = None,
+        coalesce_window_ms: Optional[int] = None,
+        coalesce_max_window_ms: Optional[int] = None
+    ):
+        self.num_workers = num_workers or settings.WEBHOOK_WORKERS
+        self.maxsize = maxsize if maxsize is not None else settings.WEBHOOK_QUEUE_MAXSIZE
+        self.queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._processor: Optional[MessageProcessor] = None
+        # Turnos agrupados que no cupieron en la cola y se procesan fuera del pool
+        self._overflow_tasks: Set[asyncio.Task] = set()
+        self.coalescer = BurstCoalescer(
+            window_ms=coalesce_window_ms if coalesce_window_ms is not None else settings.COALESCE_WINDOW_MS,
+            max_window_ms=coalesce_max_window_ms if coalesce_max_window_ms is not None else settings.COALESCE_MAX_WINDOW_MS,
+            sink=self._put_burst,
+            load_probe=self._load
+        )
+
+        # Métricas
+        self.enqueued = 0
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.overflow = 0
+        self.total_wait_time = 0.0
+        self.max_wait_time = 0.0
+        self.total_processing_time = 0.0
+
+    @property
+    def running(self) -> bool:
+        """Indica si hay workers activos consumiendo la cola"""
+        return bool(self._workers)
+
+    def register_processor(self, processor: MessageProcessor):
+        """Registrar la función que procesa cada mensaje"""
+        self._processor = processor
+
+    async def start(self):
+        """Crear la cola e iniciar el pool de workers"""
+        if self.running:
+            return
+        if self._processor is None:
+            raise RuntimeError("No hay procesador registrado para la cola de mensajes")
+
+        self.queue = asyncio.Queue(maxsize=self.maxsize)
+        self._workers = [
+            asyncio.create_task(self._worker(i), name=f"webhook-worker-{i}")
+            for i in range(self.num_workers)
+        ]
+        logger.info(f"📥 Cola de mensajes iniciada con {self.num_workers} workers (max {self.maxsize})")
+
+    async def stop(self, timeout: float = 10.0):
+        """Esperar a que se vacíe la cola (con timeout) y detener los workers"""
+        if not self.running:
+            return
+
+        # Las ráfagas pendientes se encolan ya, sin esperar su ventana
+        self.coalescer.flush_all()
+
+        if self.queue is not None:
+            try:
+                await asyncio.wait_for(
+                    asyncio.gather(self.queue.join(), *self._overflow_tasks),
+                    timeout=timeout
+                )
+            except asyncio.TimeoutError:
+                logger.warning(
+                    f"⚠️ Cola no vaciada tras {timeout}s; quedan {self.queue.qsize()} mensajes "
+                    f"y {len(self._overflow_tasks)} turnos fuera de la cola"
+                )
+
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        logger.info("🛑 Cola de mensajes detenida")
+
+    def enqueue(self, from_number: str, body: str) -> bool:
+        """
+        Encolar un mensaje sin bloquear.
+        Retorna False si la cola no está activa o está llena.
+        Con agrupación activa, el mensaje espera su ventana antes de encolarse.
+        """
+        if not self.running or self.queue is None:
+            return False
+
+        if self.coalescer.enabled:
+            # Rechazar ya si no hay espacio: tras la ventana no se puede pedir reintento a Twilio
+            if self.queue.full():
+                self.rejected += 1
+                logger.warning(f"⚠️ Cola de mensajes llena ({self.maxsize}); rechazando mensaje de {from_number}")
+                return False
+            self.coalescer.add(from_number, body)
+            return True
+
+        return self._put(from_number, body)
+
+    def _put(self, from_number: str, body: str) -> bool:
+        """Insertar un turno en la cola sin bloquear"""
+        if self.queue is None:
+            return False
+
+        try:
+            self.queue.put_nowait(InboundMessage(from_number=from_number, body=body))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            logger.warning(f"⚠️ Cola de mensajes llena ({self.maxsize}); rechazando mensaje de {from_number}")
+            return False
+
+        self.enqueued += 1
+        return True
+
+    def _put_burst(self, from_number: str, body: str) -> bool:
+        """
+        Destino de los turnos agrupados. Sus mensajes ya se confirmaron a Twilio,
+        así que si la cola se llenó durante la ventana el turno se procesa fuera
+        del pool (la ventana acota cuántos pueden llegar así).
+        """
+        if self.queue is None or self._processor is None:
+            return False
+        if not self.queue.full():
+            return self._put(from_number, body)
+
+        self.overflow += 1
+        logger.warning(
+            f"⚠️ Cola de mensajes llena ({self.maxsize}) al cerrar la ráfaga de {from_number}; "
+            f"se procesa fuera de la cola"
+        )
+        task = asyncio.create_task(
+            self._process_item(InboundMessage(from_number=from_number, body=body), worker_id=-1),
+            name=f"webhook-overflow-{from_number}"
+        )
+        self._overflow_tasks.add(task)
+        task.add_done_callback(self._overflow_tasks.discard)
+        return True
+
+    def _load(self) -> float:
+        """Mensajes en cola por worker, usado para ampliar la ventana de agrupación"""
+        if self.queue is None:
+            return 0.0
+        return self.queue.qsize() / max(self.num_workers, 1)
+
+    async def _worker(self, worker_id: int):
+        """Consumir mensajes de la cola indefinidamente"""
+        assert self.queue is not None
+        while True:
+            item: InboundMessage = await self.queue.get()
+            try:
+                await self._process_item(item, worker_id)
+            finally:
+                self.queue.task_done()
+
+    async def _process_item(self, item: InboundMessage, worker_id: int):
+        """Procesar un mensaje y registrar métricas"""
+        started_at = time.monotonic()
+        wait_time = started_at - item.enqueued_at
+        self.total_wait_time += wait_time
+        self.max_wait_time = max(self.max_wait_time, wait_time)
+
+        try:
+            await self._processor(item.from_number, item.body)  # type: ignore[misc]
+            self.processed += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.failed += 1
+            logger.error(f"❌ Worker {worker_id} falló procesando mensaje de {item.from_number}: {e}")
+        finally:
+            self.total_processing_time += time.monotonic() - started_at
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Obtener métricas de la cola para monitoreo"""
+        completed = self.processed + self.failed
+        return {
+            'enabled': settings.WEBHOOK_ASYNC_PROCESSING,
+            'running': self.running,
+            'workers': len(self._workers),
+            'queue_depth': self.queue.qsize() if self.queue is not None else 0,
+            'queue_maxsize': self.maxsize,
+            'enqueued': self.enqueued,
+            'processed': self.processed,
+            'failed': self.failed,
+            'rejected': self.rejected,
+            'overflow': self.overflow,
+            'avg_wait_ms': round(self.total_wait_time / completed * 1000, 2) if completed else 0.0,
+            'max_wait_ms': round(self.max_wait_time * 1000, 2),
+            'avg_processing_ms': round(self.total_processing_time / completed * 1000, 2) if completed else 0.0,
+            'coalescing': self.coalescer.get_stats()
+        }
+
+
+# Instancia global de la cola de mensajes
+message_queue_service = MessageQueueService()
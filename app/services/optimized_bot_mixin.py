@@ -2,7 +2,7 @@
 Mixin para integrar el servicio optimizado de conversaciones en bots existentes
 """
 import logging
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Iterable
 from sqlalchemy.orm import Session
 from app.services.optimized_conversation_service import OptimizedConversationService
 
@@ -33,6 +33,23 @@ class OptimizedBotMixin:
         """
         return await self._optimized_service.set_conversation_state(numero_whatsapp, nuevo_estado)
     
+    async def load_turn_optimized(self, numero_whatsapp: str, campos: Iterable[str] = ()) -> Dict[str, Any]:
+        """
+        Estado y datos cacheados del turno con una sola lectura a Redis
+        """
+        return await self._optimized_service.load_turn(numero_whatsapp, campos)
+    
+    async def save_turn_optimized(
+        self,
+        numero_whatsapp: str,
+        estado: Optional[str] = None,
+        datos: Optional[Dict[str, Any]] = None
+    ) -> bool:
+        """
+        Guardar estado y datos del turno con una sola escritura a Redis
+        """
+        return await self._optimized_service.save_turn(numero_whatsapp, estado, datos)
+    
     async def invalidate_conversation_state(self, numero_whatsapp: str):
         """
         Invalidar caché de conversación para un usuario
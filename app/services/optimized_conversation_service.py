@@ -1,56 +1,182 @@
 """
 Servicio optimizado para gestión de estados de conversación
 Combina caché en memoria con persistencia en base de datos
+
+El caché en memoria es único por proceso (acotado, LRU + TTL), así que
+las instancias creadas por petición comparten los aciertos. Cuando otro
+worker cambia un estado, el aviso de invalidación de cache_service lo
+descarta de la memoria.
+
+Un turno del bot lee de Redis con un solo MGET (`load_turn`: estado y los
+datos del turno que se pidan) y escribe con un solo pipeline (`save_turn`).
 """
+import asyncio
 import logging
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Iterable
 from datetime import datetime, timedelta
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import SQLAlchemyError
 from app.models.conversation_state import ConversationState
 from app.services.cache_service import cache_service
+from app.utils.bounded_cache import BoundedTTLCache
+from config.settings import settings
+from database.connection import own_session
 
 logger = logging.getLogger(__name__)
 
+# Caché en memoria de estados compartido por todo el proceso
+conversation_state_cache = BoundedTTLCache(
+    max_entries=settings.CONVERSATION_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.CONVERSATION_CACHE_TTL,
+    name="conversation_state"
+)
+
+
+def _on_cache_invalidation(keys):
+    """Descartar de la memoria los estados que otro worker modificó o eliminó"""
+    if keys is None:
+        conversation_state_cache.clear()
+        return
+    prefix = cache_service.CONVERSATION_STATE_PREFIX
+    for key in keys:
+        if key.startswith(prefix):
+            conversation_state_cache.delete(key[len(prefix):])
+
+
+cache_service.add_invalidation_listener(_on_cache_invalidation)
+
 class OptimizedConversationService:
     """Servicio optimizado para gestión de estados de conversación"""
     
+    # Prefijo de los datos cacheados por turno (turn:{numero}:{campo})
+    TURN_DATA_PREFIX = "turn:"
+    
     def __init__(self, db: Session):
         self.db = db
-        self._memory_cache = {}  # Caché en memoria como fallback
-        self._cache_ttl = timedelta(minutes=30)
+        self._memory_cache = conversation_state_cache  # Caché en memoria compartido
+        self._cache_ttl = timedelta(seconds=settings.CONVERSATION_CACHE_TTL)
+        # Escrituras a Redis acumuladas hasta el próximo pipeline
+        self._pending_writes: Dict[str, Any] = {}
+        self._pending_ttls: Dict[str, timedelta] = {}
+    
+    def _turn_key(self, numero_whatsapp: str, campo: str) -> str:
+        return f"{self.TURN_DATA_PREFIX}{numero_whatsapp}:{campo}"
+    
+    def _state_snapshot(self, numero_whatsapp: str, estado: str) -> Dict[str, Any]:
+        return {
+            'estado': estado,
+            'timestamp': datetime.now().isoformat(),
+            'numero_whatsapp': numero_whatsapp
+        }
+    
+    def _queue_state(self, numero_whatsapp: str, estado: str):
+        """Encolar el estado para la próxima escritura a Redis"""
+        key = cache_service.conversation_key(numero_whatsapp)
+        self._pending_writes[key] = self._state_snapshot(numero_whatsapp, estado)
+        self._pending_ttls[key] = self._cache_ttl
+    
+    async def _load_state(self, numero_whatsapp: str) -> Dict[str, Any]:
+        """
+        Cargar el estado desde la BD con una sesión propia: la carga se comparte
+        entre las peticiones concurrentes del número (get_or_load) y puede
+        terminar después de que la que la inició se cancele.
+        """
+        def load() -> str:
+            with own_session(self.db) as db:
+                return self._get_state_from_db(numero_whatsapp, db)
+        
+        estado = await asyncio.to_thread(load)
+        cache_service.metrics.record_lookup(cache_service.conversation_key(numero_whatsapp), 'database', True)
+        return self._state_snapshot(numero_whatsapp, estado)
+    
+    async def _write_pending(self):
+        """Enviar las escrituras encoladas en un solo pipeline"""
+        if not self._pending_writes:
+            return
+        values, ttls = self._pending_writes, self._pending_ttls
+        self._pending_writes, self._pending_ttls = {}, {}
+        try:
+            await cache_service.set_many(values, ttls=ttls)
+        except Exception as e:
+            logger.warning(f"⚠️ Error actualizando cachés: {e}")
+    
+    async def load_turn(self, numero_whatsapp: str, campos: Iterable[str] = ()) -> Dict[str, Any]:
+        """
+        Cargar el estado y los datos del turno con una sola lectura a Redis.
+        Retorna {'estado': ..., campo: valor}; los campos sin caché no aparecen.
+        Si el estado no está en caché, una sola carga por número lo lee de la BD
+        y lo guarda (en Redis, o en el L1 de cache_service si Redis no está).
+        """
+        turn_keys = {campo: self._turn_key(numero_whatsapp, campo) for campo in campos}
+        state_key = cache_service.conversation_key(numero_whatsapp)
+        
+        # Nivel 1: Caché en memoria (sin viaje de red)
+        estado = self._memory_cache.get(numero_whatsapp)
+        cache_service.metrics.record_lookup(state_key, 'memory', estado is not None)
+        if estado is not None:
+            logger.debug(f"🧠 Estado desde memoria: {numero_whatsapp}")
+        
+        keys = list(turn_keys.values()) + ([state_key] if estado is None else [])
+        cached = await cache_service.get_many(keys) if keys else {}
+        
+        if estado is None:
+            # Nivel 2: Caché Redis (en el mismo MGET que los datos del turno)
+            state_data = cached.get(state_key)
+            if isinstance(state_data, dict) and state_data.get('estado'):
+                logger.debug(f"🎯 Estado desde Redis: {numero_whatsapp}")
+                estado = state_data['estado']
+            else:
+                # Nivel 3: Base de datos (sin repetir el MGET que ya falló)
+                state_data = await cache_service.get_or_load(
+                    state_key,
+                    lambda: self._load_state(numero_whatsapp),
+                    ttl=self._cache_ttl,
+                    cached=cached
+                )
+                estado = state_data['estado']
+            self._memory_cache.set(numero_whatsapp, estado)
+        
+        turn: Dict[str, Any] = {'estado': estado}
+        for campo, key in turn_keys.items():
+            if key in cached:
+                turn[campo] = cached[key]
+        return turn
+    
+    async def save_turn(
+        self,
+        numero_whatsapp: str,
+        estado: Optional[str] = None,
+        datos: Optional[Dict[str, Any]] = None,
+        ttls: Optional[Dict[str, timedelta]] = None
+    ) -> bool:
+        """
+        Guardar el resultado del turno con una sola escritura a Redis:
+        el estado nuevo (primero en la BD) y los datos del turno, cada uno
+        con su TTL (`ttls` por campo; por defecto el TTL del estado).
+        """
+        if estado is not None:
+            if not self._update_state_in_db(numero_whatsapp, estado):
+                return False
+            self._memory_cache.set(numero_whatsapp, estado)
+            self._queue_state(numero_whatsapp, estado)
+        
+        for campo, valor in (datos or {}).items():
+            key = self._turn_key(numero_whatsapp, campo)
+            self._pending_writes[key] = valor
+            self._pending_ttls[key] = (ttls or {}).get(campo) or self._cache_ttl
+        
+        await self._write_pending()
+        return True
     
     async def get_conversation_state(self, numero_whatsapp: str) -> str:
         """
         Obtener estado de conversación con caché multi-nivel:
-        1. Caché Redis (si está disponible)
-        2. Caché en memoria
+        1. Caché en memoria del proceso (sin viaje de red)
+        2. Caché Redis (si está disponible)
         3. Base de datos
         """
         try:
-            # Nivel 1: Intentar caché Redis
-            cached_data = await cache_service.get_conversation_state(numero_whatsapp)
-            if cached_data and cached_data.get('estado'):
-                logger.debug(f"🎯 Estado desde Redis: {numero_whatsapp}")
-                return cached_data['estado']
-            
-            # Nivel 2: Caché en memoria
-            if numero_whatsapp in self._memory_cache:
-                cache_entry = self._memory_cache[numero_whatsapp]
-                if datetime.now() - cache_entry['timestamp'] < self._cache_ttl:
-                    logger.debug(f"🧠 Estado desde memoria: {numero_whatsapp}")
-                    return cache_entry['estado']
-                else:
-                    # Limpiar entrada expirada
-                    del self._memory_cache[numero_whatsapp]
-            
-            # Nivel 3: Base de datos
-            estado = self._get_state_from_db(numero_whatsapp)
-            
-            # Actualizar cachés con el resultado
-            await self._update_caches(numero_whatsapp, estado)
-            
-            return estado
+            return (await self.load_turn(numero_whatsapp))['estado']
             
         except Exception as e:
             logger.error(f"❌ Error obteniendo estado para {numero_whatsapp}: {e}")
@@ -61,29 +187,26 @@ class OptimizedConversationService:
         """
         Actualizar estado de conversación en todos los niveles:
         1. Base de datos (fuente de verdad)
-        2. Caché Redis
-        3. Caché en memoria
+        2. Caché en memoria
+        3. Caché Redis
         """
         try:
-            # Actualizar en base de datos primero
-            success = self._update_state_in_db(numero_whatsapp, nuevo_estado)
+            success = await self.save_turn(numero_whatsapp, nuevo_estado)
             
             if success:
-                # Actualizar cachés
-                await self._update_caches(numero_whatsapp, nuevo_estado)
                 logger.debug(f"✅ Estado actualizado para {numero_whatsapp}: {nuevo_estado}")
-                return True
             
-            return False
+            return success
             
         except Exception as e:
             logger.error(f"❌ Error actualizando estado para {numero_whatsapp}: {e}")
             return False
     
-    def _get_state_from_db(self, numero_whatsapp: str) -> str:
+    def _get_state_from_db(self, numero_whatsapp: str, db: Optional[Session] = None) -> str:
         """Obtener estado desde la base de datos con manejo de errores"""
+        db = db or self.db
         try:
-            state = self.db.query(ConversationState).filter(
+            state = db.query(ConversationState).filter(
                 ConversationState.numero_whatsapp == numero_whatsapp
             ).first()
             
@@ -98,13 +221,13 @@ class OptimizedConversationService:
                     estado_actual='SALUDO',
                     fecha_actualizacion=datetime.now()
                 )
-                self.db.add(new_state)
-                self.db.commit()
+                db.add(new_state)
+                db.commit()
                 return 'SALUDO'
                 
         except SQLAlchemyError as e:
             logger.error(f"❌ Error de BD obteniendo estado para {numero_whatsapp}: {e}")
-            self.db.rollback()
+            db.rollback()
             return 'SALUDO'
     
     def _update_state_in_db(self, numero_whatsapp: str, nuevo_estado: str) -> bool:
@@ -135,41 +258,17 @@ class OptimizedConversationService:
             self.db.rollback()
             return False
     
-    async def _update_caches(self, numero_whatsapp: str, estado: str):
-        """Actualizar todos los cachés con el nuevo estado"""
+    async def invalidate_user_state(self, numero_whatsapp: str, campos: Iterable[str] = ()):
+        """Invalidar estado de conversación (y los datos del turno indicados) en todos los cachés"""
         try:
-            # Preparar datos para caché
-            cache_data = {
-                'estado': estado,
-                'timestamp': datetime.now().isoformat(),
-                'numero_whatsapp': numero_whatsapp
-            }
-            
-            # Actualizar caché Redis
-            await cache_service.set_conversation_state(
-                numero_whatsapp, 
-                cache_data,
-                ttl=self._cache_ttl
+            # Limpiar caché Redis (estado y datos del turno en un solo DEL)
+            await cache_service.delete_many(
+                [cache_service.conversation_key(numero_whatsapp)]
+                + [self._turn_key(numero_whatsapp, campo) for campo in campos]
             )
             
-            # Actualizar caché en memoria
-            self._memory_cache[numero_whatsapp] = {
-                'estado': estado,
-                'timestamp': datetime.now()
-            }
-            
-        except Exception as e:
-            logger.warning(f"⚠️ Error actualizando cachés para {numero_whatsapp}: {e}")
-    
-    async def invalidate_user_state(self, numero_whatsapp: str):
-        """Invalidar estado de conversación en todos los cachés"""
-        try:
-            # Limpiar caché Redis
-            await cache_service.delete_conversation_state(numero_whatsapp)
-            
             # Limpiar caché en memoria
-            if numero_whatsapp in self._memory_cache:
-                del self._memory_cache[numero_whatsapp]
+            self._memory_cache.delete(numero_whatsapp)
             
             logger.debug(f"🧹 Estado invalidado para {numero_whatsapp}")
             
@@ -179,17 +278,10 @@ class OptimizedConversationService:
     def cleanup_memory_cache(self):
         """Limpiar entradas expiradas del caché en memoria"""
         try:
-            now = datetime.now()
-            expired_keys = [
-                key for key, value in self._memory_cache.items()
-                if now - value['timestamp'] > self._cache_ttl
-            ]
-            
-            for key in expired_keys:
-                del self._memory_cache[key]
+            expired = self._memory_cache.purge_expired()
             
-            if expired_keys:
-                logger.debug(f"🧹 Limpiadas {len(expired_keys)} entradas expiradas del caché")
+            if expired:
+                logger.debug(f"🧹 Limpiadas {expired} entradas expiradas del caché")
                 
         except Exception as e:
             logger.warning(f"⚠️ Error limpiando caché en memoria: {e}")
@@ -198,17 +290,19 @@ class OptimizedConversationService:
         """Obtener estadísticas de caché para monitoreo"""
         stats = {
             'memory_cache_size': len(self._memory_cache),
+            'memory_cache': self._memory_cache.get_stats(),
             'redis_enabled': cache_service.enabled,
-            'redis_connected': cache_service.redis is not None
+            'redis_connected': cache_service.redis_available,
+            'keyspaces': {
+                keyspace: metrics
+                for keyspace, metrics in cache_service.metrics.get_stats().items()
+                if keyspace in ('conversation', 'turn')
+            }
         }
         
-        try:
-            if cache_service.redis:
-                info = await cache_service.redis.info()
-                stats['redis_memory_used'] = info.get('used_memory_human', 'Unknown')
-                stats['redis_connected_clients'] = info.get('connected_clients', 0)
-        except Exception as e:
-            logger.warning(f"⚠️ Error obteniendo stats de Redis: {e}")
-            stats['redis_error'] = str(e)
+        info = await cache_service.info()
+        if info:
+            stats['redis_memory_used'] = info.get('used_memory_human', 'Unknown')
+            stats['redis_connected_clients'] = info.get('connected_clients', 0)
         
         return stats
@@ -0,0 +1,233 @@
+"""
+Lectura local de pedidos en lenguaje natural (sin IA)
+
+Saca ternas (cantidad, pizza, tamaño) de mensajes como
+"dame 2 pizzas hawaianas medianas y grande de pepperoni" usando el índice
+difuso de nombres del catálogo y un léxico de tamaños y números. Solo los
+mensajes que no se pueden leer así (o que piden cambiar el pedido) se dejan
+para la IA.
+
+Reglas de la gramática:
+- Solo se lee como pedido un mensaje con intención de pedir: un verbo ("quiero",
+  "dame", "mándame", ...) o una cantidad al comienzo ("2 hawaianas ..."). Las
+  preguntas ("¿cuánto cuesta la pepperoni?") van a la IA.
+- Los separadores ("y", ",", "mas", "tambien", ...) dividen el mensaje en partes.
+- La cantidad va antes de la pizza ("2 hawaianas"); si no hay otra pizza
+  después, también puede ir detrás ("pepperoni x2").
+- El tamaño va detrás ("hawaianas medianas") o delante con "de"
+  ("grande de pepperoni").
+- Una parte sin pizza ("... y una grande") repite la pizza anterior.
+"""
+import re
+from typing import Any, Dict, List, Optional, Tuple
+from app.services.menu_catalog import CatalogPizza, MenuCatalog
+from app.services.pizza_name_index import normalize_words, strip_accents
+from config.settings import settings
+
+# Tamaños (palabras ya sin acentos) -> tamaño del carrito
+SIZE_WORDS = {
+    'pequena': 'pequeña', 'pequenas': 'pequeña', 'pequeno': 'pequeña', 'pequenos': 'pequeña',
+    'chica': 'pequeña', 'chicas': 'pequeña', 'chico': 'pequeña', 'chicos': 'pequeña',
+    'personal': 'pequeña', 'personales': 'pequeña', 'small': 'pequeña',
+    'mediana': 'mediana', 'medianas': 'mediana', 'mediano': 'mediana', 'medianos': 'mediana',
+    'medium': 'mediana',
+    'grande': 'grande', 'grandes': 'grande', 'familiar': 'grande', 'familiares': 'grande',
+    'large': 'grande',
+}
+
+NUMBER_WORDS = {
+    'un': 1, 'una': 1, 'uno': 1, 'dos': 2, 'tres': 3, 'cuatro': 4, 'cinco': 5,
+    'seis': 6, 'siete': 7, 'ocho': 8, 'nueve': 9, 'diez': 10,
+}
+
+SEPARATORS = {'y', 'e', 'mas', 'tambien', 'ademas', 'otra', 'otras', 'otro', 'otros'}
+
+# Palabras que piden modificar el pedido o que cambian el sentido: se dejan para la IA
+MODIFIER_WORDS = {
+    'no', 'sin', 'quita', 'quitar', 'quitale', 'saca', 'sacar', 'elimina', 'eliminar', 'borra',
+    'cambia', 'cambiar', 'cambiame', 'reemplaza', 'reemplazar', 'solo', 'solamente', 'unicamente',
+    'cancela', 'cancelar', 'menos', 'mejor', 'vez', 'lugar', 'extra', 'mitad',
+}
+
+# Verbos que muestran intención de pedir (sin acentos)
+ORDER_VERBS = {
+    'quiero', 'queremos', 'quisiera', 'quisieramos', 'dame', 'deme', 'denme', 'das',
+    'manda', 'mandas', 'mande', 'mandame', 'mandenme', 'mandar', 'envia', 'envias', 'enviame',
+    'enviar', 'trae', 'traeme', 'traigan', 'traer', 'pido', 'pedir', 'ordeno', 'ordenar',
+    'agrega', 'agregame', 'agregar', 'anade', 'anademe', 'pon', 'ponme', 'necesito', 'llevo',
+    'regalame',
+}
+
+# Palabras de pregunta: "¿cuánto cuesta la pepperoni grande?" no es un pedido
+QUESTION_WORDS = {
+    'cuanto', 'cuanta', 'cuantos', 'cuantas', 'que', 'cual', 'cuales', 'tiene', 'tienen', 'tienes',
+    'saber', 'precio', 'precios', 'cuesta', 'cuestan', 'vale', 'valen',
+}
+
+# Tope de pizzas por línea, igual que en la selección de cantidad del flujo tradicional
+MAX_QUANTITY = 10
+
+_QUANTITY_PATTERN = re.compile(r'^x?(\d{1,2})x?$')
+
+
+class ParsedItem:
+    """Una línea del pedido leída del mensaje (tamaño None si no se indicó)"""
+
+    __slots__ = ('pizza', 'cantidad', 'tamano', 'score')
+
+    def __init__(self, pizza: CatalogPizza, cantidad: Optional[int], tamano: Optional[str], score: float):
+        self.pizza = pizza
+        self.cantidad = cantidad
+        self.tamano = tamano
+        self.score = score
+
+    def __repr__(self):
+        return f"<ParsedItem({self.cantidad or 1} x {self.pizza.nombre} {self.tamano or '?'})>"
+
+    def precio(self) -> float:
+        """Precio unitario según el tamaño"""
+        if self.tamano == 'pequeña':
+            return float(self.pizza.precio_pequena)
+        if self.tamano == 'mediana':
+            return float(self.pizza.precio_mediana)
+        return float(self.pizza.precio_grande)
+
+    def to_cart_line(self) -> Dict[str, Any]:
+        """Línea en el formato que recibe CartRepository"""
+        return {
+            'pizza_id': self.pizza.id,
+            'pizza_nombre': self.pizza.nombre,
+            'pizza_emoji': self.pizza.emoji or '🍕',
+            'tamano': self.tamano,
+            'precio': self.precio(),
+            'cantidad': self.cantidad or 1
+        }
+
+
+def missing_sizes_message(sin_tamano: List[ParsedItem], agregados: List[ParsedItem]) -> str:
+    """Pregunta por los tamaños que faltan, diciendo qué líneas del mensaje ya se agregaron"""
+    nombres = ", ".join(item.pizza.nombre for item in sin_tamano)
+    mensaje = ""
+    if agregados:
+        lineas = "\n".join(
+            f"• {item.cantidad or 1} x {item.pizza.emoji or '🍕'} {item.pizza.nombre} ({item.tamano})"
+            for item in agregados
+        )
+        mensaje = f"✅ Agregado al carrito:\n{lineas}\n\n"
+    return (f"{mensaje}📏 ¿De qué tamaño quieres: {nombres}?\n\n"
+            f"Ejemplo: '2 hawaianas medianas y una pepperoni grande'")
+
+
+def _quantity(token: str) -> Optional[int]:
+    if token in NUMBER_WORDS:
+        return NUMBER_WORDS[token]
+    match = _QUANTITY_PATTERN.match(token)
+    if match:
+        return int(match.group(1))
+    return None
+
+
+def is_question(mensaje: str) -> bool:
+    """Indica si el mensaje es una pregunta (signos de interrogación o palabras de pregunta)"""
+    texto = str(mensaje or '')
+    return '?' in texto or '¿' in texto or any(token in QUESTION_WORDS for token in _tokenize(texto))
+
+
+def _has_order_intent(mensaje: str, tokens: List[str]) -> bool:
+    """Un verbo de pedido, una cantidad al comienzo o un 'x2' explícito; nunca una pregunta"""
+    if '?' in mensaje or '¿' in mensaje or any(token in QUESTION_WORDS for token in tokens):
+        return False
+    return (
+        any(token in ORDER_VERBS for token in tokens)
+        or _quantity(tokens[0]) is not None
+        or any(token.startswith('x') and _quantity(token) is not None for token in tokens)
+    )
+
+
+def _tokenize(mensaje: str) -> List[str]:
+    """Palabras normalizadas; las comas y el signo + cuentan como separadores"""
+    texto = strip_accents(str(mensaje or '')).lower()
+    texto = re.sub(r'[,;+/]', ' y ', texto)
+    return normalize_words(texto)
+
+
+def parse_order(mensaje: str, catalog: MenuCatalog, min_score: Optional[float] = None) -> Optional[List[ParsedItem]]:
+    """
+    Líneas del pedido que se leen del mensaje, en orden.
+    Retorna None si el mensaje no muestra intención de pedir (o es una pregunta), si no
+    nombra pizzas del catálogo, si pide modificar el pedido o si tiene cantidades fuera
+    de rango; en esos casos decide la IA.
+    """
+    if min_score is None:
+        min_score = settings.MENU_FUZZY_MIN_SCORE
+    tokens = _tokenize(mensaje)
+    if not tokens or any(token in MODIFIER_WORDS for token in tokens):
+        return None
+    if not _has_order_intent(str(mensaje or ''), tokens):
+        return None
+
+    mentions = catalog.name_index.find_all(tokens, min_score)
+    if not mentions:
+        return None
+
+    # Elementos del mensaje: ('pizza', NameMatch) / ('qty', n) / ('size', t) / ('sep', None) / ('de', None)
+    elements: List[Tuple[str, object]] = []
+    mention_at = {start: (end, match) for start, end, match in mentions}
+    i = 0
+    while i < len(tokens):
+        if i in mention_at:
+            end, match = mention_at[i]
+            elements.append(('pizza', match))
+            i = end
+            continue
+        token = tokens[i]
+        quantity = _quantity(token)
+        if token in SIZE_WORDS:
+            elements.append(('size', SIZE_WORDS[token]))
+        elif quantity is not None:
+            if not 1 <= quantity <= MAX_QUANTITY:
+                return None
+            elements.append(('qty', quantity))
+        elif token in SEPARATORS:
+            elements.append(('sep', None))
+        elif token == 'de':
+            elements.append(('de', None))
+        i += 1
+
+    # Partes separadas por conjunciones o comas
+    parts: List[List[Tuple[str, object]]] = [[]]
+    for kind, value in elements:
+        if kind == 'sep':
+            parts.append([])
+        else:
+            parts[-1].append((kind, value))
+
+    items: List[ParsedItem] = []
+    for part in parts:
+        current: Optional[ParsedItem] = None
+        pending_qty: Optional[int] = None
+        pending_size: Optional[str] = None
+        for index, (kind, value) in enumerate(part):
+            later_pizza = any(k == 'pizza' for k, _ in part[index + 1:])
+            if kind == 'pizza':
+                current = ParsedItem(value.pizza, pending_qty, pending_size, value.score)
+                items.append(current)
+                pending_qty = pending_size = None
+            elif kind == 'qty':
+                if later_pizza or current is None or current.cantidad is not None:
+                    pending_qty = value
+                else:
+                    current.cantidad = value
+            elif kind == 'size':
+                followed_by_de = index + 1 < len(part) and part[index + 1][0] == 'de'
+                if current is not None and current.tamano is None and not followed_by_de:
+                    current.tamano = value
+                else:
+                    pending_size = value
+
+        # "... y una grande": sin pizza en esta parte, se repite la anterior
+        if current is None and (pending_qty or pending_size) and items:
+            previous = items[-1]
+            items.append(ParsedItem(previous.pizza, pending_qty, pending_size, previous.score))
+
+    return items or None
@@ -0,0 +1,305 @@
+"""
+Cola de mensajes salientes con ritmo controlado y reintentos
+
+Las respuestas del bot no se envían directamente a Twilio: se encolan y un
+pool pequeño de workers las envía respetando un token bucket por número
+emisor. Cada destinatario se asigna siempre al mismo worker (hash del número
+módulo la cantidad de workers), así que sus respuestas salen en orden aunque
+una de ellas se esté reintentando. Si Twilio responde 429 o 5xx (o falla la red) el envío se reintenta
+con backoff exponencial y jitter; un 429 además pausa el bucket para que el
+resto de envíos también baje el ritmo. Los mensajes que agotan los
+reintentos (o fallan de forma definitiva), y los que siguen pendientes al
+apagar, quedan en una lista dead-letter acotada para inspección.
+"""
+import asyncio
+import logging
+import random
+import time
+import zlib
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Optional, List, Dict, Any, Callable, Awaitable, Deque
+from aiohttp import ClientError
+from twilio.base.exceptions import TwilioRestException
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Función que envía un mensaje: (numero_destino, mensaje) -> message_sid
+MessageSender = Callable[[str, str], Awaitable[Any]]
+
+
+@dataclass
+class OutboundMessage:
+    """Mensaje saliente pendiente de enviar"""
+    to_number: str
+    body: str
+    attempts: int = 0
+    enqueued_at: float = field(default_factory=time.monotonic)
+    last_error: Optional[str] = None
+
+
+class TokenBucket:
+    """Token bucket asíncrono: `rate` envíos por segundo con ráfagas de hasta `capacity`"""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = max(capacity, 1)
+        self.tokens = float(self.capacity)
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def pause(self, seconds: float):
+        """Detener el consumo de tokens durante `seconds` (ej: tras un 429)"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    async def acquire(self):
+        """Esperar hasta que haya un token disponible y consumirlo"""
+        while True:
+            now = time.monotonic()
+            if now < self.paused_until:
+                await asyncio.sleep(self.paused_until - now)
+                continue
+
+            self._refill(now)
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class OutboundMessageQueue:
+    """Cola asyncio de respuestas salientes con pacing, backoff y dead-letter"""
+
+    # Códigos HTTP de Twilio que vale la pena reintentar
+    RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+    def __init__(
+        self,
+        num_workers: Optional[int] = None,
+        maxsize: Optional[int] = None,
+        rate_per_second: Optional[float] = None,
+        burst: Optional[int] = None,
+        max_retries: Optional[int] = None,
+        backoff_base: Optional[float] = None,
+        backoff_max: Optional[float] = None,
+        dead_letter_max: Optional[int] = None
+    ):
+        self.num_workers = num_workers or settings.OUTBOUND_WORKERS
+        self.maxsize = maxsize if maxsize is not None else settings.OUTBOUND_QUEUE_MAXSIZE
+        self.rate_per_second = rate_per_second or settings.OUTBOUND_RATE_PER_SECOND
+        self.burst = burst or settings.OUTBOUND_BURST
+        self.max_retries = max_retries if max_retries is not None else settings.OUTBOUND_MAX_RETRIES
+        self.backoff_base = backoff_base if backoff_base is not None else settings.OUTBOUND_BACKOFF_BASE_SECONDS
+        self.backoff_max = backoff_max if backoff_max is not None else settings.OUTBOUND_BACKOFF_MAX_SECONDS
+        self.dead_letters: Deque[OutboundMessage] = deque(
+            maxlen=dead_letter_max or settings.OUTBOUND_DEAD_LETTER_MAX
+        )
+
+        # Una cola por worker; cada número va siempre a la misma
+        self._queues: List[asyncio.Queue] = []
+        self._current: Dict[int, OutboundMessage] = {}  # worker -> mensaje que está enviando
+        self._workers: List[asyncio.Task] = []
+        self._sender: Optional[MessageSender] = None
+        self._buckets: Dict[str, TokenBucket] = {}
+
+        # Métricas
+        self.enqueued = 0
+        self.sent = 0
+        self.retries = 0
+        self.throttled = 0
+        self.dead_lettered = 0
+        self.rejected = 0
+        self.total_delivery_time = 0.0
+
+    @property
+    def running(self) -> bool:
+        """Indica si hay workers activos enviando mensajes"""
+        return bool(self._workers)
+
+    def register_sender(self, sender: MessageSender):
+        """Registrar la función que envía cada mensaje"""
+        self._sender = sender
+
+    def _shard(self, to_number: str) -> int:
+        """Worker asignado al número (estable entre reinicios)"""
+        return zlib.crc32(to_number.encode('utf-8')) % len(self._queues)
+
+    def _bucket(self, from_number: str) -> TokenBucket:
+        """Token bucket del número emisor (la app usa un único número de Twilio)"""
+        bucket = self._buckets.get(from_number)
+        if bucket is None:
+            bucket = TokenBucket(self.rate_per_second, self.burst)
+            self._buckets[from_number] = bucket
+        return bucket
+
+    async def start(self):
+        """Crear la cola e iniciar los workers de envío"""
+        if self.running:
+            return
+        if self._sender is None:
+            raise RuntimeError("No hay función de envío registrada para la cola saliente")
+
+        # El límite total se reparte entre las colas de los workers (0 = sin límite)
+        shard_maxsize = -(-self.maxsize // self.num_workers) if self.maxsize > 0 else 0
+        self._queues = [asyncio.Queue(maxsize=shard_maxsize) for _ in range(self.num_workers)]
+        self._workers = [
+            asyncio.create_task(self._worker(i), name=f"outbound-worker-{i}")
+            for i in range(self.num_workers)
+        ]
+        logger.info(
+            f"📤 Cola saliente iniciada con {self.num_workers} workers "
+            f"({self.rate_per_second}/s, ráfaga {self.burst})"
+        )
+
+    async def stop(self, timeout: float = 15.0):
+        """
+        Enviar lo pendiente (con timeout) y detener los workers.
+        Lo que no alcanzó a salir (en cola o reintentándose) queda en dead-letter.
+        """
+        if not self.running:
+            return
+
+        try:
+            await asyncio.wait_for(asyncio.gather(*(queue.join() for queue in self._queues)), timeout=timeout)
+        except asyncio.TimeoutError:
+            pending = 0
+            for queue in self._queues:
+                while not queue.empty():
+                    self._dead_letter(queue.get_nowait(), "apagado antes de enviar")
+                    queue.task_done()
+                    pending += 1
+            logger.warning(
+                f"⚠️ Cola saliente no vaciada tras {timeout}s: {pending} en cola y "
+                f"{len(self._current)} en envío pasan a dead-letter"
+            )
+
+        # Los workers registran en dead-letter el mensaje que estaban enviando o reintentando
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        logger.info("🛑 Cola saliente detenida")
+
+    def enqueue(self, to_number: str, body: str) -> bool:
+        """
+        Encolar un mensaje saliente sin bloquear.
+        Retorna False si la cola no está activa o está llena.
+        """
+        if not self.running:
+            return False
+
+        try:
+            self._queues[self._shard(to_number)].put_nowait(OutboundMessage(to_number=to_number, body=body))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            logger.warning(f"⚠️ Cola saliente llena ({self.maxsize}); mensaje a {to_number} no encolado")
+            return False
+
+        self.enqueued += 1
+        return True
+
+    async def _worker(self, worker_id: int):
+        """Consumir indefinidamente los mensajes de los números asignados a este worker"""
+        queue = self._queues[worker_id]
+        while True:
+            item: OutboundMessage = await queue.get()
+            self._current[worker_id] = item
+            try:
+                await self._deliver(item)
+            except asyncio.CancelledError:
+                self._dead_letter(item, "apagado durante el envío")
+                raise
+            except Exception as e:
+                self._dead_letter(item, str(e))
+                logger.error(f"❌ Worker saliente {worker_id} falló con mensaje a {item.to_number}: {e}")
+            finally:
+                self._current.pop(worker_id, None)
+                queue.task_done()
+
+    async def _deliver(self, item: OutboundMessage):
+        """Enviar un mensaje reintentando errores transitorios"""
+        bucket = self._bucket(settings.TWILIO_PHONE_NUMBER or "default")
+
+        while True:
+            await bucket.acquire()
+            item.attempts += 1
+            try:
+                await self._sender(item.to_number, item.body)  # type: ignore[misc]
+                self.sent += 1
+                self.total_delivery_time += time.monotonic() - item.enqueued_at
+                return
+            except Exception as e:
+                item.last_error = str(e)
+                if not self._is_retryable(e) or item.attempts > self.max_retries:
+                    self._dead_letter(item, item.last_error)
+                    return
+
+                delay = self._backoff_delay(item.attempts)
+                if isinstance(e, TwilioRestException) and e.status == 429:
+                    self.throttled += 1
+                    bucket.pause(delay)
+                self.retries += 1
+                logger.warning(
+                    f"🔁 Reintentando envío a {item.to_number} en {delay:.2f}s "
+                    f"(intento {item.attempts}/{self.max_retries}): {e}"
+                )
+                await asyncio.sleep(delay)
+
+    def _is_retryable(self, error: Exception) -> bool:
+        """Decidir si un error de envío es transitorio"""
+        if isinstance(error, TwilioRestException):
+            return error.status in self.RETRYABLE_STATUS
+        return isinstance(error, (ClientError, asyncio.TimeoutError, ConnectionError))
+
+    def _backoff_delay(self, attempt: int) -> float:
+        """Backoff exponencial con jitter completo, acotado por backoff_max"""
+        ceiling = min(self.backoff_max, self.backoff_base * (2 ** (attempt - 1)))
+        return random.uniform(0, ceiling)
+
+    def _dead_letter(self, item: OutboundMessage, reason: str):
+        """Registrar un mensaje que no se pudo entregar"""
+        item.last_error = reason
+        self.dead_letters.append(item)
+        self.dead_lettered += 1
+        logger.error(f"💀 Mensaje a {item.to_number} enviado a dead-letter tras {item.attempts} intentos: {reason}")
+
+    def get_dead_letters(self) -> List[Dict[str, Any]]:
+        """Listar los mensajes en dead-letter (más recientes al final)"""
+        return [
+            {
+                'to_number': item.to_number,
+                'body': item.body,
+                'attempts': item.attempts,
+                'last_error': item.last_error
+            }
+            for item in self.dead_letters
+        ]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Obtener métricas de la cola saliente para monitoreo"""
+        return {
+            'enabled': settings.OUTBOUND_QUEUE_ENABLED,
+            'running': self.running,
+            'workers': len(self._workers),
+            'queue_depth': sum(queue.qsize() for queue in self._queues),
+            'in_flight': len(self._current),
+            'queue_maxsize': self.maxsize,
+            'rate_per_second': self.rate_per_second,
+            'enqueued': self.enqueued,
+            'sent': self.sent,
+            'retries': self.retries,
+            'throttled': self.throttled,
+            'rejected': self.rejected,
+            'dead_lettered': self.dead_lettered,
+            'dead_letter_size': len(self.dead_letters),
+            'avg_delivery_ms': round(self.total_delivery_time / self.sent * 1000, 2) if self.sent else 0.0
+        }
+
+
+# Instancia global de la cola saliente
+outbound_message_queue = OutboundMessageQueue()
@@ -1,7 +1,8 @@
 from sqlalchemy.orm import Session
 from app.models.pedido import Pedido, DetallePedido
 from app.models.cliente import Cliente
-from app.models.pizza import Pizza
+from app.services.cache_service import cache_service
+from app.services.menu_catalog import get_menu_catalog
 from datetime import datetime
 from typing import List, Dict, Any
 from sqlalchemy.sql import func
@@ -51,6 +52,9 @@ class PedidoService:
         )
         self.db.commit()
         
+        # El resumen del cliente para la IA incluye sus últimos pedidos
+        await cache_service.delete_many([cache_service.client_profile_key(str(cliente.numero_whatsapp))])
+        
         return self.db.query(Pedido.id).filter(Pedido.id == pedido.id).scalar()
     
     async def obtener_pedido(self, pedido_id: int) -> Pedido:
@@ -88,9 +92,5 @@ class PedidoService:
     
     async def validar_pizza_disponible(self, pizza_id: int) -> bool:
         """Validar que una pizza esté disponible"""
-        pizza = self.db.query(Pizza).filter(
-            Pizza.id == pizza_id,
-            Pizza.disponible == True
-        ).first()
-        
-        return pizza is not None 
\ No newline at end of file
+        pizza = get_menu_catalog(self.db).get(pizza_id)
+        return pizza is not None and pizza.disponible 
\ No newline at end of file
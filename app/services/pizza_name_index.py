@@ -0,0 +1,160 @@
+"""
+Índice difuso de nombres de pizza (trigramas de caracteres)
+
+Se construye una vez por versión del catálogo. Los nombres y los mensajes se
+comparan sin acentos ni mayúsculas, palabra por palabra, con el coeficiente
+de Dice sobre trigramas; así "peperoni" encuentra Pepperoni y "hawuaiana"
+encuentra Hawaiana sin consultar la base de datos ni llamar a la IA.
+"""
+import re
+import unicodedata
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+from app.services.menu_catalog import CatalogPizza
+
+# Palabras de un nombre que no lo identifican por sí solas
+STOPWORDS = {
+    'pizza', 'pizzas', 'de', 'del', 'la', 'las', 'el', 'los', 'con', 'y', 'a', 'al', 'en',
+    'una', 'uno', 'un', 'dos', 'tres', 'cuatro', 'cinco', 'seis', 'siete', 'ocho', 'nueve', 'diez'
+}
+
+# Peso de una coincidencia con una sola palabra de un nombre de varias palabras
+PARTIAL_NAME_WEIGHT = 0.9
+# Similitud mínima de cada palabra para considerar la ventana del mensaje
+WORD_MIN_SIMILARITY = 0.5
+
+
+def strip_accents(texto: str) -> str:
+    """Texto sin tildes ni diéresis (la ñ queda como n)"""
+    decomposed = unicodedata.normalize('NFKD', texto)
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def normalize_words(texto: str) -> List[str]:
+    """Palabras en minúsculas, sin acentos ni signos de puntuación"""
+    return re.findall(r'[a-z0-9]+', strip_accents(str(texto or '')).lower())
+
+
+def trigrams(word: str) -> Set[str]:
+    """Trigramas de una palabra, con relleno para dar peso al comienzo y al final"""
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class NameMatch:
+    """Pizza encontrada, con la confianza (0 a 1) y el texto del mensaje que coincidió"""
+
+    __slots__ = ('pizza', 'score', 'text')
+
+    def __init__(self, pizza: CatalogPizza, score: float, text: str):
+        self.pizza = pizza
+        self.score = score
+        self.text = text
+
+    def __repr__(self):
+        return f"<NameMatch(pizza='{self.pizza.nombre}', score={self.score:.2f}, text='{self.text}')>"
+
+
+class PizzaNameIndex:
+    """Índice de trigramas sobre las palabras de los nombres de las pizzas"""
+
+    def __init__(self, pizzas: Iterable[CatalogPizza]):
+        # Claves: (palabras, peso, pizza); el nombre completo y sus palabras distintivas
+        self._keys: List[Tuple[Tuple[str, ...], float, CatalogPizza]] = []
+        self._vocabulary: Dict[str, Set[str]] = {}  # palabra -> trigramas
+        self._postings: Dict[str, Set[str]] = {}  # trigrama -> palabras que lo contienen
+
+        for pizza in pizzas:
+            words = tuple(normalize_words(pizza.nombre))
+            if not words:
+                continue
+            self._keys.append((words, 1.0, pizza))
+            distinctive = [w for w in words if w not in STOPWORDS and len(w) >= 4]
+            if len(words) > 1:
+                for word in distinctive:
+                    self._keys.append(((word,), PARTIAL_NAME_WEIGHT, pizza))
+            for word in words:
+                self._add_word(word)
+
+        # Claves agrupadas por su primera palabra, para revisar solo las que pueden coincidir
+        self._keys_by_first_word: Dict[str, List[Tuple[Tuple[str, ...], float, CatalogPizza]]] = {}
+        for key in self._keys:
+            self._keys_by_first_word.setdefault(key[0][0], []).append(key)
+
+    def _add_word(self, word: str):
+        if word in self._vocabulary:
+            return
+        grams = trigrams(word)
+        self._vocabulary[word] = grams
+        for gram in grams:
+            self._postings.setdefault(gram, set()).add(word)
+
+    def _similar_words(self, word: str) -> Dict[str, float]:
+        """Coeficiente de Dice de `word` contra cada palabra del vocabulario que comparte trigramas"""
+        if word in self._vocabulary:
+            return {word: 1.0}
+        grams = trigrams(word)
+        shared: Dict[str, int] = {}
+        for gram in grams:
+            for candidate in self._postings.get(gram, ()):
+                shared[candidate] = shared.get(candidate, 0) + 1
+        return {
+            candidate: 2 * count / (len(grams) + len(self._vocabulary[candidate]))
+            for candidate, count in shared.items()
+        }
+
+    def _candidates(self, tokens: List[str]) -> Iterator[Tuple[int, int, float, CatalogPizza]]:
+        """Ventanas del mensaje que coinciden con una clave: (inicio, palabras, confianza, pizza)"""
+        # Similitud de cada palabra del mensaje contra el vocabulario (una vez por palabra)
+        similar = {token: self._similar_words(token) for token in set(tokens)}
+
+        for start, token in enumerate(tokens):
+            for first_word, first_score in similar[token].items():
+                if first_score < WORD_MIN_SIMILARITY:
+                    continue
+                for words, weight, pizza in self._keys_by_first_word.get(first_word, ()):
+                    window = tokens[start:start + len(words)]
+                    if len(window) < len(words):
+                        continue
+                    scores = [first_score] + [
+                        similar[t].get(w, 0.0) for t, w in zip(window[1:], words[1:])
+                    ]
+                    if min(scores) < WORD_MIN_SIMILARITY:
+                        continue
+                    yield start, len(words), round(weight * sum(scores) / len(words), 4), pizza
+
+    def match(self, texto: str, min_score: float = 0.0) -> Optional[NameMatch]:
+        """
+        Mejor pizza mencionada en el texto (un nombre suelto o un mensaje completo).
+        Retorna None si ninguna alcanza `min_score`.
+        """
+        tokens = normalize_words(texto)
+        best: Optional[Tuple[float, int, int, int, CatalogPizza]] = None
+        for start, size, score, pizza in self._candidates(tokens):
+            # Empates: gana la primera pizza del menú
+            rank = (score, -(pizza.numero or 0), start, size, pizza)
+            if best is None or rank[:2] > best[:2]:
+                best = rank
+
+        if best is None or best[0] < min_score:
+            return None
+        score, _, start, size, pizza = best
+        return NameMatch(pizza, score, " ".join(tokens[start:start + size]))
+
+    def find_all(self, tokens: List[str], min_score: float = 0.0) -> List[Tuple[int, int, NameMatch]]:
+        """
+        Todas las pizzas mencionadas en las palabras del mensaje, sin superponerse:
+        lista de (inicio, fin, NameMatch) en el orden del mensaje.
+        """
+        candidates = sorted(
+            (c for c in self._candidates(tokens) if c[2] >= min_score),
+            key=lambda c: (-c[2], -c[1], c[0], c[3].numero or 0)
+        )
+        taken = [False] * len(tokens)
+        found: List[Tuple[int, int, NameMatch]] = []
+        for start, size, score, pizza in candidates:
+            if any(taken[start:start + size]):
+                continue
+            for i in range(start, start + size):
+                taken[i] = True
+            found.append((start, start + size, NameMatch(pizza, score, " ".join(tokens[start:start + size]))))
+        return sorted(found, key=lambda item: item[0])
@@ -0,0 +1,223 @@
+"""
+Armado de prompts de IA con presupuesto de tokens
+
+El prompt se arma por partes (prompt del sistema, carrito, resumen del
+cliente, contexto dinámico y los últimos turnos de la conversación). Cada
+parte tiene un valor; si no caben todas en AI_PROMPT_TOKEN_BUDGET se
+descartan primero las de menor valor, así el tamaño del prompt queda acotado
+aunque el historial de pedidos del cliente crezca.
+
+Los tokens se cuentan localmente con tiktoken si está instalado (es opcional:
+`pip install tiktoken`); si no, con una aproximación por caracteres.
+"""
+import logging
+import math
+import threading
+from dataclasses import dataclass, field
+from typing import Optional, Dict, Any, List, Callable
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Tokens extra que la API agrega por cada mensaje del chat
+TOKENS_PER_MESSAGE = 4
+
+
+class TokenCounter:
+    """Cuenta tokens con tiktoken o, si no está disponible, con una aproximación"""
+
+    def __init__(self, model: str = "gpt-4o"):
+        self.model = model
+        self._encode: Optional[Callable[[str], List[int]]] = None
+        # tiktoken descarga el archivo BPE la primera vez que se usa: se resuelve
+        # en el primer conteo y no al importar (la app arranca sin red)
+        self._resolved = False
+        self._lock = threading.Lock()
+        self.backend = "pending"
+
+    def _resolve(self):
+        """Cargar el tokenizador una sola vez (o quedarse con la aproximación)"""
+        with self._lock:
+            if self._resolved:
+                return
+            try:
+                import tiktoken
+                try:
+                    encoding = tiktoken.encoding_for_model(self.model)
+                except KeyError:
+                    encoding = tiktoken.get_encoding("o200k_base")
+                self._encode = encoding.encode
+                self.backend = "tiktoken"
+            except Exception as e:
+                # ImportError o sin acceso a los archivos del tokenizador
+                self.backend = "heuristic"
+                logger.info(f"🔢 tiktoken no disponible ({e}); contando tokens por aproximación")
+            self._resolved = True
+
+    def count(self, text: str) -> int:
+        """Tokens de un texto"""
+        if not text:
+            return 0
+        if not self._resolved:
+            self._resolve()
+        if self._encode is not None:
+            return len(self._encode(text))
+        # ~4 caracteres por token en promedio
+        return math.ceil(len(text) / 4)
+
+    def count_message(self, content: str) -> int:
+        """Tokens de un mensaje del chat, incluida la sobrecarga por mensaje"""
+        return self.count(content) + TOKENS_PER_MESSAGE
+
+
+@dataclass
+class PromptSection:
+    """Parte opcional del contexto; las de menor `priority` se descartan primero"""
+    name: str
+    text: str
+    priority: int
+
+
+@dataclass
+class AssembledPrompt:
+    """Mensajes listos para la API y cómo se gastó el presupuesto"""
+    messages: List[Dict[str, str]]
+    tokens: int
+    budget: int
+    included: List[str] = field(default_factory=list)
+    dropped: List[str] = field(default_factory=list)
+
+
+class PromptAssembler:
+    """Arma los mensajes del chat dentro de un presupuesto de tokens"""
+
+    # Valor de los turnos del historial: el más reciente vale más que el carrito
+    HISTORY_BASE_PRIORITY = 70
+    HISTORY_PRIORITY_STEP = 10
+
+    def __init__(
+        self,
+        budget_tokens: Optional[int] = None,
+        history_turns: Optional[int] = None,
+        counter: Optional[TokenCounter] = None
+    ):
+        self.budget_tokens = budget_tokens or settings.AI_PROMPT_TOKEN_BUDGET
+        self.history_turns = settings.AI_PROMPT_HISTORY_TURNS if history_turns is None else history_turns
+        self.counter = counter or TokenCounter()
+
+        # Métricas
+        self.calls = 0
+        self.total_tokens = 0
+        self.max_tokens = 0
+        self.last_tokens = 0
+        self.over_budget = 0
+        self.dropped_by_section: Dict[str, int] = {}
+        self.last_api_prompt_tokens: Optional[int] = None
+
+    def assemble(
+        self,
+        system_prompt: str,
+        user_message: str,
+        sections: List[PromptSection],
+        history: Optional[List[Dict[str, str]]] = None
+    ) -> AssembledPrompt:
+        """
+        Armar [sistema, turnos recientes..., contexto + mensaje del usuario].
+        El prompt del sistema y el mensaje actual siempre se incluyen.
+        """
+        user_prefix = "\n\nMensaje del usuario: "
+        used = (
+            self.counter.count_message(system_prompt)
+            + self.counter.count_message(user_prefix + user_message)
+            + self.counter.count("Contexto: ")
+        )
+
+        # Candidatos opcionales: secciones de contexto y turnos del historial
+        candidates: List[Dict[str, Any]] = [
+            {'kind': 'section', 'name': section.name, 'priority': section.priority,
+             'text': section.text, 'index': i}
+            for i, section in enumerate(sections) if section.text
+        ]
+        turns = (history or [])[-self.history_turns * 2:] if self.history_turns > 0 else []
+        for age, turn in enumerate(reversed(turns)):
+            candidates.append({
+                'kind': 'turn',
+                'name': 'historial',
+                'priority': self.HISTORY_BASE_PRIORITY - (age // 2) * self.HISTORY_PRIORITY_STEP,
+                'text': turn.get('text', ''),
+                'role': 'user' if turn.get('role') == 'user' else 'assistant',
+                'index': len(turns) - 1 - age
+            })
+
+        # Incluir de mayor a menor valor mientras alcance el presupuesto
+        included: List[Dict[str, Any]] = []
+        dropped: List[str] = []
+        for candidate in sorted(candidates, key=lambda c: -c['priority']):
+            if candidate['kind'] == 'turn':
+                cost = self.counter.count_message(candidate['text'])
+            else:
+                cost = self.counter.count(candidate['text'] + "\n\n")
+            if used + cost <= self.budget_tokens:
+                used += cost
+                included.append(candidate)
+            else:
+                dropped.append(candidate['name'])
+
+        context = "\n\n".join(
+            c['text'] for c in sorted(
+                (c for c in included if c['kind'] == 'section'), key=lambda c: c['index']
+            )
+        )
+        messages: List[Dict[str, str]] = [{"role": "system", "content": system_prompt}]
+        messages.extend(
+            {"role": c['role'], "content": c['text']}
+            for c in sorted((c for c in included if c['kind'] == 'turn'), key=lambda c: c['index'])
+        )
+        messages.append({"role": "user", "content": f"Contexto: {context}{user_prefix}{user_message}"})
+
+        self._record(used, dropped)
+        return AssembledPrompt(
+            messages=messages,
+            tokens=used,
+            budget=self.budget_tokens,
+            included=[c['name'] for c in included],
+            dropped=dropped
+        )
+
+    def _record(self, tokens: int, dropped: List[str]):
+        """Registrar las métricas de una llamada"""
+        self.calls += 1
+        self.total_tokens += tokens
+        self.last_tokens = tokens
+        self.max_tokens = max(self.max_tokens, tokens)
+        if tokens > self.budget_tokens:
+            # Solo el prompt del sistema y el mensaje ya superan el presupuesto
+            self.over_budget += 1
+            logger.warning(f"⚠️ Prompt de {tokens} tokens supera el presupuesto de {self.budget_tokens}")
+        for name in dropped:
+            self.dropped_by_section[name] = self.dropped_by_section.get(name, 0) + 1
+        logger.debug(f"🔢 Prompt de IA: {tokens}/{self.budget_tokens} tokens, descartado: {dropped or 'nada'}")
+
+    def record_usage(self, prompt_tokens: Optional[int]):
+        """Registrar los tokens de prompt que reportó la API en la última llamada"""
+        if isinstance(prompt_tokens, int):
+            self.last_api_prompt_tokens = prompt_tokens
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Obtener métricas de tokens de los prompts para monitoreo"""
+        return {
+            'tokenizer': self.counter.backend,
+            'budget_tokens': self.budget_tokens,
+            'history_turns': self.history_turns,
+            'calls': self.calls,
+            'last_prompt_tokens': self.last_tokens,
+            'max_prompt_tokens': self.max_tokens,
+            'avg_prompt_tokens': round(self.total_tokens / self.calls, 1) if self.calls else 0.0,
+            'last_api_prompt_tokens': self.last_api_prompt_tokens,
+            'over_budget': self.over_budget,
+            'dropped_by_section': dict(self.dropped_by_section)
+        }
+
+
+# Instancia global del armador de prompts
+prompt_assembler = PromptAssembler()
@@ -1,20 +1,129 @@
 from twilio.rest import Client
 from twilio.base.exceptions import TwilioRestException
+from twilio.http.async_http_client import AsyncTwilioHttpClient
 from twilio.request_validator import RequestValidator
+from aiohttp import ClientSession, TCPConnector
 from config.settings import settings
 from app.utils.logging_config import LoggerMixin
+import asyncio
 import re
-from typing import Optional, Dict
+import time
+from typing import Optional, Dict, Any
 
 class WhatsAppService(LoggerMixin):
+    # Cliente Twilio compartido por todo el proceso (HTTP asíncrono con keep-alive).
+    # Se crea al primer envío y se asocia al event loop que lo creó.
+    _shared_client: Optional[Client] = None
+    _shared_http_client: Optional[AsyncTwilioHttpClient] = None
+    _shared_loop: Optional[asyncio.AbstractEventLoop] = None
+    _send_semaphore: Optional[asyncio.Semaphore] = None
+    _semaphore_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    # Métricas de envío del proceso
+    _sends = 0
+    _send_failures = 0
+    _in_flight = 0
+    _max_in_flight = 0
+    _total_send_time = 0.0
+
     def __init__(self, twilio_client: Optional[Client] = None):
-        """Inicializar servicio de WhatsApp"""
-        if twilio_client is None:
-            self.client = Client(settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN)
-        else:
-            self.client = twilio_client
+        """
+        Inicializar servicio de WhatsApp.
+        Sin cliente explícito se usa el cliente asíncrono compartido, así que
+        crear una instancia por petición no abre conexiones nuevas.
+        """
+        self.client = twilio_client
         self.from_number = f"whatsapp:{settings.TWILIO_PHONE_NUMBER}"
         self.validator = RequestValidator(settings.TWILIO_AUTH_TOKEN)
+
+    @classmethod
+    def _ensure_shared_sender(cls):
+        """Crear (o recrear si cambió el event loop) el cliente compartido y el límite de concurrencia"""
+        loop = asyncio.get_running_loop()
+        if cls._shared_client is not None and cls._shared_loop is loop:
+            return
+
+        # El timeout no se configura en la sesión: Twilio pasa timeout=None en cada
+        # request y aiohttp lo toma como "sin límite". Se aplica en _create_message.
+        http_client = AsyncTwilioHttpClient(pool_connections=False)
+        http_client.session = ClientSession(
+            connector=TCPConnector(
+                limit=settings.TWILIO_HTTP_POOL_SIZE,
+                keepalive_timeout=settings.TWILIO_HTTP_KEEPALIVE_SECONDS
+            )
+        )
+
+        cls._shared_http_client = http_client
+        cls._shared_client = Client(
+            settings.TWILIO_ACCOUNT_SID,
+            settings.TWILIO_AUTH_TOKEN,
+            http_client=http_client
+        )
+        cls._shared_loop = loop
+
+    @classmethod
+    def _get_send_semaphore(cls) -> asyncio.Semaphore:
+        """Límite de envíos simultáneos a Twilio (uno por event loop)"""
+        loop = asyncio.get_running_loop()
+        if cls._send_semaphore is None or cls._semaphore_loop is not loop:
+            cls._send_semaphore = asyncio.Semaphore(settings.TWILIO_MAX_CONCURRENT_SENDS)
+            cls._semaphore_loop = loop
+        return cls._send_semaphore
+
+    @classmethod
+    async def close_shared_client(cls):
+        """Cerrar las conexiones HTTP del cliente compartido (al apagar la app)"""
+        http_client = cls._shared_http_client
+        cls._shared_client = None
+        cls._shared_http_client = None
+        cls._shared_loop = None
+        if http_client is not None:
+            await http_client.close()
+
+    async def _create_message(self, **kwargs) -> Any:
+        """
+        Crear un mensaje en Twilio sin bloquear el event loop.
+        El cliente compartido usa la API asíncrona; un cliente inyectado
+        (síncrono) se ejecuta en un hilo. Si Twilio no responde en
+        TWILIO_HTTP_TIMEOUT segundos se lanza asyncio.TimeoutError y se
+        libera el cupo de envíos simultáneos.
+        """
+        cls = type(self)
+        if self.client is None:
+            cls._ensure_shared_sender()
+
+        async with cls._get_send_semaphore():
+            cls._in_flight += 1
+            cls._max_in_flight = max(cls._max_in_flight, cls._in_flight)
+            started_at = time.monotonic()
+            try:
+                if self.client is None:
+                    request = cls._shared_client.messages.create_async(**kwargs)
+                else:
+                    request = asyncio.to_thread(self.client.messages.create, **kwargs)
+                result = await asyncio.wait_for(request, timeout=settings.TWILIO_HTTP_TIMEOUT)
+                cls._sends += 1
+                return result
+            except Exception:
+                cls._send_failures += 1
+                raise
+            finally:
+                cls._in_flight -= 1
+                cls._total_send_time += time.monotonic() - started_at
+
+    @classmethod
+    def get_sender_stats(cls) -> Dict[str, Any]:
+        """Obtener métricas de envío salientes para monitoreo"""
+        completed = cls._sends + cls._send_failures
+        return {
+            'shared_client_open': cls._shared_client is not None,
+            'max_concurrent_sends': settings.TWILIO_MAX_CONCURRENT_SENDS,
+            'sends': cls._sends,
+            'failures': cls._send_failures,
+            'in_flight': cls._in_flight,
+            'max_in_flight': cls._max_in_flight,
+            'avg_send_ms': round(cls._total_send_time / completed * 1000, 2) if completed else 0.0
+        }
     
     def validate_webhook(self, request_url: str, post_data: Dict, signature: str) -> bool:
         """Validar webhook de Twilio"""
@@ -67,7 +176,7 @@ class WhatsAppService(LoggerMixin):
         try:
             formatted_number = self._format_phone_number(to_number)
             
-            twilio_message = self.client.messages.create(
+            twilio_message = await self._create_message(
                 body=message,
                 from_=self.from_number,
                 to=formatted_number
@@ -120,7 +229,7 @@ class WhatsAppService(LoggerMixin):
         try:
             formatted_number = self._format_phone_number(to_number)
             
-            twilio_message = self.client.messages.create(
+            twilio_message = await self._create_message(
                 body=caption,
                 media_url=[image_url],
                 from_=self.from_number,
@@ -0,0 +1,268 @@
+"""
+Persistencia write-behind del estado de conversación
+
+Con CONVERSATION_WRITE_BEHIND activo, Redis es el almacén primario del
+estado y de `datos_temporales`: cada turno guarda un snapshot y marca la
+conversación como pendiente. Un flusher en segundo plano toma los
+pendientes cada CONVERSATION_WRITE_BEHIND_INTERVAL segundos (la ventana de
+durabilidad) y los escribe en la base de datos con un único upsert
+multi-fila por lote. Al apagar se vacía todo lo pendiente.
+
+Si Redis falla, el turno se escribe directamente en la base de datos
+(write-through). Los números escritos así se recuerdan para descartar sus
+snapshots obsoletos cuando Redis vuelva.
+"""
+import asyncio
+import json
+import logging
+import time
+from datetime import timedelta
+from typing import Optional, Dict, Any, List, Callable, Set
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from app.models.conversation_state import ConversationState
+from app.services.cache_service import cache_service
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+class ConversationWriteBehind:
+    """Guarda el estado de conversación en Redis y lo lleva a la BD por lotes"""
+
+    def __init__(
+        self,
+        enabled: Optional[bool] = None,
+        interval_seconds: Optional[float] = None,
+        batch_size: Optional[int] = None,
+        snapshot_ttl_seconds: Optional[int] = None,
+        session_factory: Optional[Callable[[], Session]] = None
+    ):
+        self.enabled = settings.CONVERSATION_WRITE_BEHIND if enabled is None else enabled
+        self.interval_seconds = interval_seconds or settings.CONVERSATION_WRITE_BEHIND_INTERVAL
+        self.batch_size = batch_size or settings.CONVERSATION_WRITE_BEHIND_BATCH
+        self.snapshot_ttl = timedelta(
+            seconds=snapshot_ttl_seconds or settings.CONVERSATION_WRITE_BEHIND_TTL
+        )
+        self._session_factory = session_factory
+        self._task: Optional[asyncio.Task] = None
+
+        # Números escritos en la BD mientras Redis no respondía
+        self._degraded = False
+        self._written_through: Set[str] = set()
+
+        # Métricas
+        self.snapshots_saved = 0
+        self.snapshots_loaded = 0
+        self.fallbacks = 0
+        self.flushes = 0
+        self.rows_upserted = 0
+        self.rows_deleted = 0
+        self.flush_errors = 0
+        self.last_flush_ms = 0.0
+        self.pending = 0
+
+    @property
+    def active(self) -> bool:
+        """El modo write-behind está activo si está habilitado y Redis está conectado"""
+        return self.enabled and cache_service.redis is not None and not self._degraded
+
+    # ------------------------------------------------------------------
+    # Lectura y escritura de snapshots
+    # ------------------------------------------------------------------
+    async def load(self, numero_whatsapp: str) -> Optional[Dict[str, Any]]:
+        """Snapshot vigente de la conversación (None si hay que leer la BD)"""
+        snapshot = await cache_service.get_conversation_snapshot(numero_whatsapp)
+        if snapshot is not None:
+            self.snapshots_loaded += 1
+        return snapshot
+
+    async def save(self, numero_whatsapp: str, snapshot: Dict[str, Any]) -> bool:
+        """
+        Guardar el snapshot y marcarlo como pendiente.
+        Retorna False si Redis falló y el llamador debe escribir en la BD.
+        """
+        saved = await cache_service.save_conversation_snapshot(numero_whatsapp, snapshot, self.snapshot_ttl)
+        if saved:
+            self.snapshots_saved += 1
+            return True
+
+        self.fallbacks += 1
+        self._degraded = True
+        self._written_through.add(numero_whatsapp)
+        logger.warning(f"⚠️ Redis no disponible; estado de {numero_whatsapp} escrito directamente en la BD")
+        return False
+
+    # ------------------------------------------------------------------
+    # Flusher
+    # ------------------------------------------------------------------
+    async def start(self):
+        """Iniciar el flusher en segundo plano"""
+        if not self.enabled or self._task is not None:
+            return
+        self._task = asyncio.create_task(self._run(), name="conversation-write-behind")
+        logger.info(
+            f"📝 Write-behind de conversaciones activo (cada {self.interval_seconds}s, lotes de {self.batch_size})"
+        )
+
+    async def stop(self):
+        """Detener el flusher y escribir todo lo pendiente"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        if self.enabled:
+            written = await self.flush_all()
+            logger.info(f"🛑 Write-behind detenido; {written} conversaciones escritas al apagar")
+
+    async def _run(self):
+        """Vaciar los pendientes cada intervalo"""
+        while True:
+            try:
+                await asyncio.sleep(self.interval_seconds)
+                await self._recover_if_needed()
+                await self.flush_all()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.flush_errors += 1
+                logger.error(f"❌ Error en el flusher write-behind: {e}")
+
+    async def _recover_if_needed(self):
+        """Al volver Redis, descartar snapshots que quedaron atrás de la BD"""
+        if not self._degraded or not await cache_service.ping():
+            return
+
+        stale = list(self._written_through)
+        if stale and not await cache_service.discard_conversation_snapshots(stale):
+            return
+
+        self._written_through.clear()
+        self._degraded = False
+        logger.info(f"✅ Redis recuperado; {len(stale)} snapshots obsoletos descartados")
+
+    async def flush_all(self) -> int:
+        """Escribir lotes hasta vaciar los pendientes; retorna las conversaciones escritas"""
+        total = 0
+        while True:
+            written = await self.flush_once()
+            total += written
+            if written < self.batch_size:
+                break
+        self.pending = await cache_service.count_dirty_conversations()
+        return total
+
+    async def flush_once(self) -> int:
+        """Escribir un lote de conversaciones pendientes en la base de datos"""
+        numeros = await cache_service.pop_dirty_conversations(self.batch_size)
+        if not numeros:
+            return 0
+
+        snapshots = await cache_service.get_conversation_snapshots(numeros)
+        started_at = time.monotonic()
+        try:
+            upserted, deleted = await asyncio.to_thread(self._write_batch, snapshots)
+        except Exception as e:
+            # Devolver los números a pendientes para el siguiente intento
+            self.flush_errors += 1
+            await cache_service.mark_conversations_dirty(numeros)
+            logger.error(f"❌ Error escribiendo lote write-behind ({len(numeros)} conversaciones): {e}")
+            return 0
+
+        self.flushes += 1
+        self.rows_upserted += upserted
+        self.rows_deleted += deleted
+        self.last_flush_ms = round((time.monotonic() - started_at) * 1000, 2)
+        logger.debug(f"📝 Lote write-behind: {upserted} upserts, {deleted} eliminadas en {self.last_flush_ms}ms")
+        return len(numeros)
+
+    def _open_session(self) -> Session:
+        if self._session_factory is not None:
+            return self._session_factory()
+        from database.connection import SessionLocal
+        return SessionLocal()
+
+    def _write_batch(self, snapshots: Dict[str, Dict[str, Any]]):
+        """Upsert multi-fila de las conversaciones vivas y borrado de las eliminadas"""
+        rows: List[Dict[str, Any]] = []
+        deleted: List[str] = []
+        for numero, snapshot in snapshots.items():
+            if snapshot.get('deleted'):
+                deleted.append(numero)
+                continue
+            datos = snapshot.get('datos') or {}
+            historial = snapshot.get('historial') or []
+            rows.append({
+                'numero_whatsapp': numero,
+                'estado_actual': snapshot.get('estado'),
+                'datos_temporales': json.dumps(datos) if datos else None,
+                'historial': json.dumps(historial, ensure_ascii=False, separators=(',', ':')) if historial else None
+            })
+
+        db = self._open_session()
+        try:
+            if rows:
+                db.execute(self._upsert_statement(db, rows))
+            if deleted:
+                db.query(ConversationState).filter(
+                    ConversationState.numero_whatsapp.in_(deleted)
+                ).delete(synchronize_session=False)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+        return len(rows), len(deleted)
+
+    @staticmethod
+    def _upsert_statement(db: Session, rows: List[Dict[str, Any]]):
+        """INSERT ... ON CONFLICT (numero_whatsapp) DO UPDATE para el dialecto de la sesión"""
+        dialect = db.get_bind().dialect.name
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        elif dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            raise RuntimeError(f"Upsert write-behind no soportado para el dialecto {dialect}")
+
+        stmt = insert(ConversationState).values(rows)
+        return stmt.on_conflict_do_update(
+            index_elements=[ConversationState.numero_whatsapp],
+            set_={
+                'estado_actual': stmt.excluded.estado_actual,
+                'datos_temporales': stmt.excluded.datos_temporales,
+                'historial': stmt.excluded.historial,
+                'fecha_actualizacion': func.now(),
+                # Mantener la versión para el compare-and-swap de los turnos directos
+                'version': ConversationState.__table__.c.version + 1
+            }
+        )
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Obtener métricas del modo write-behind para monitoreo"""
+        return {
+            'enabled': self.enabled,
+            'active': self.active,
+            'degraded': self._degraded,
+            'interval_seconds': self.interval_seconds,
+            'batch_size': self.batch_size,
+            'pending': self.pending,
+            'snapshots_saved': self.snapshots_saved,
+            'snapshots_loaded': self.snapshots_loaded,
+            'fallbacks': self.fallbacks,
+            'flushes': self.flushes,
+            'rows_upserted': self.rows_upserted,
+            'rows_deleted': self.rows_deleted,
+            'flush_errors': self.flush_errors,
+            'last_flush_ms': self.last_flush_ms
+        }
+
+
+# Instancia global del write-behind de conversaciones
+conversation_write_behind = ConversationWriteBehind()
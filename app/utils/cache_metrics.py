@@ -0,0 +1,141 @@
+"""
+Métricas de caché por keyspace (prefijo de la clave)
+
+Para cada keyspace (`conversation`, `user`, `turn`, `ai`, ...) se cuentan
+aciertos y fallos por nivel (memoria del servicio, L1, Redis), errores y un
+histograma de latencia de los comandos a Redis. Se exponen como dict para
+/webhook/performance y en formato de texto de Prometheus para /webhook/metrics.
+"""
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# Límites superiores de los buckets de latencia, en segundos
+LATENCY_BUCKETS: Tuple[float, ...] = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0
+)
+
+
+def keyspace_of(key: str) -> str:
+    """Keyspace de una clave: lo que va antes del primer ':'"""
+    prefix, separator, _ = str(key).partition(':')
+    return prefix if separator and prefix else 'other'
+
+
+class LatencyHistogram:
+    """Histograma acumulativo al estilo Prometheus"""
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds: float):
+        self.count += 1
+        self.sum += seconds
+        for i, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                self.counts[i] += 1
+                break
+
+    def cumulative(self) -> List[Tuple[str, int]]:
+        """Pares (le, cantidad acumulada), incluido +Inf"""
+        total = 0
+        result = []
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            result.append((repr(bound), total))
+        result.append(('+Inf', self.count))
+        return result
+
+
+class CacheMetrics:
+    """Contadores de aciertos, fallos, errores y latencia por keyspace"""
+
+    def __init__(self, namespace: str = "pizzabot"):
+        self.namespace = namespace
+        self._lookups: Dict[Tuple[str, str, str], int] = {}  # (keyspace, nivel, resultado) -> total
+        self._errors: Dict[Tuple[str, str], int] = {}  # (keyspace, operación) -> total
+        self._latency: Dict[Tuple[str, str], LatencyHistogram] = {}  # (keyspace, operación)
+
+    def record_lookup(self, key: str, tier: str, hit: bool):
+        """Registrar la búsqueda de una clave en un nivel del caché"""
+        label = (keyspace_of(key), tier, 'hit' if hit else 'miss')
+        self._lookups[label] = self._lookups.get(label, 0) + 1
+
+    def record_latency(self, keys: Iterable[str], operation: str, seconds: float):
+        """Registrar la duración de un comando para cada keyspace que tocó"""
+        for keyspace in {keyspace_of(key) for key in keys}:
+            histogram = self._latency.get((keyspace, operation))
+            if histogram is None:
+                histogram = self._latency[(keyspace, operation)] = LatencyHistogram()
+            histogram.observe(seconds)
+
+    def record_error(self, keys: Iterable[str], operation: str):
+        """Registrar un comando fallido para cada keyspace que tocó"""
+        for keyspace in {keyspace_of(key) for key in keys}:
+            label = (keyspace, operation)
+            self._errors[label] = self._errors.get(label, 0) + 1
+
+    def reset(self):
+        self._lookups.clear()
+        self._errors.clear()
+        self._latency.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Métricas agrupadas por keyspace para monitoreo"""
+        stats: Dict[str, Dict[str, Any]] = {}
+
+        def entry(keyspace: str) -> Dict[str, Any]:
+            return stats.setdefault(keyspace, {'tiers': {}, 'errors': {}, 'latency_ms': {}})
+
+        for (keyspace, tier, result), total in self._lookups.items():
+            tier_stats = entry(keyspace)['tiers'].setdefault(tier, {'hits': 0, 'misses': 0})
+            tier_stats['hits' if result == 'hit' else 'misses'] += total
+        for tier_stats in (t for s in stats.values() for t in s['tiers'].values()):
+            lookups = tier_stats['hits'] + tier_stats['misses']
+            tier_stats['hit_rate'] = round(tier_stats['hits'] / lookups, 4) if lookups else 0.0
+
+        for (keyspace, operation), total in self._errors.items():
+            entry(keyspace)['errors'][operation] = total
+
+        for (keyspace, operation), histogram in self._latency.items():
+            entry(keyspace)['latency_ms'][operation] = {
+                'count': histogram.count,
+                'avg': round(histogram.sum / histogram.count * 1000, 3) if histogram.count else 0.0
+            }
+        return stats
+
+    def render_prometheus(self, extra_gauges: Optional[Dict[str, float]] = None) -> str:
+        """Métricas en el formato de texto de Prometheus (versión 0.0.4)"""
+        ns = self.namespace
+        lines = [
+            f"# HELP {ns}_cache_lookups_total Búsquedas en caché por keyspace, nivel y resultado",
+            f"# TYPE {ns}_cache_lookups_total counter"
+        ]
+        for (keyspace, tier, result), total in sorted(self._lookups.items()):
+            lines.append(
+                f'{ns}_cache_lookups_total{{keyspace="{keyspace}",tier="{tier}",result="{result}"}} {total}'
+            )
+
+        lines += [
+            f"# HELP {ns}_cache_errors_total Comandos de caché fallidos por keyspace y operación",
+            f"# TYPE {ns}_cache_errors_total counter"
+        ]
+        for (keyspace, operation), total in sorted(self._errors.items()):
+            lines.append(f'{ns}_cache_errors_total{{keyspace="{keyspace}",operation="{operation}"}} {total}')
+
+        lines += [
+            f"# HELP {ns}_cache_latency_seconds Latencia de los comandos a Redis",
+            f"# TYPE {ns}_cache_latency_seconds histogram"
+        ]
+        for (keyspace, operation), histogram in sorted(self._latency.items()):
+            labels = f'keyspace="{keyspace}",operation="{operation}"'
+            for le, count in histogram.cumulative():
+                lines.append(f'{ns}_cache_latency_seconds_bucket{{{labels},le="{le}"}} {count}')
+            lines.append(f'{ns}_cache_latency_seconds_sum{{{labels}}} {histogram.sum:.6f}')
+            lines.append(f'{ns}_cache_latency_seconds_count{{{labels}}} {histogram.count}')
+
+        for name, value in (extra_gauges or {}).items():
+            lines += [f"# TYPE {ns}_{name} gauge", f"{ns}_{name} {value}"]
+
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,113 @@
+"""
+Circuit breaker para dependencias externas (ej: Redis)
+
+Después de `failure_threshold` fallos seguidos el circuito se abre y las
+llamadas se omiten durante `reset_timeout` segundos. Pasado ese tiempo se
+deja pasar una sola llamada de prueba: si funciona el circuito se cierra,
+si falla vuelve a abrirse.
+"""
+import threading
+import time
+from typing import Any, Dict, Optional
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """Estado cerrado / abierto / semiabierto con una llamada de prueba a la vez"""
+
+    def __init__(self, failure_threshold: int, reset_timeout: float, name: str = "circuit"):
+        if failure_threshold <= 0:
+            raise ValueError("failure_threshold debe ser mayor que cero")
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.name = name
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self._opened_at = 0.0
+        self._probe_started_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+        # Métricas
+        self.times_opened = 0
+        self.rejected_calls = 0
+        self.last_error: Optional[str] = None
+
+    def allow(self) -> bool:
+        """Indica si se puede intentar la llamada"""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+
+            now = time.monotonic()
+            if self.state == OPEN and now - self._opened_at >= self.reset_timeout:
+                self.state = HALF_OPEN
+                self._probe_started_at = None
+
+            if self.state == HALF_OPEN:
+                # Una sola prueba a la vez; si la prueba nunca informó su resultado
+                # (ej: tarea cancelada), se permite otra después del cool-down
+                if self._probe_started_at is None or now - self._probe_started_at >= self.reset_timeout:
+                    self._probe_started_at = now
+                    return True
+
+            self.rejected_calls += 1
+            return False
+
+    def record_success(self):
+        """Registrar una llamada exitosa (cierra el circuito)"""
+        with self._lock:
+            self.state = CLOSED
+            self.consecutive_failures = 0
+            self._probe_started_at = None
+
+    def record_failure(self, error: Optional[BaseException] = None) -> bool:
+        """Registrar un fallo; retorna True si con este fallo el circuito se abrió"""
+        with self._lock:
+            self.consecutive_failures += 1
+            if error is not None:
+                self.last_error = str(error)
+            if self.state == HALF_OPEN or (
+                self.state == CLOSED and self.consecutive_failures >= self.failure_threshold
+            ):
+                self.state = OPEN
+                self._opened_at = time.monotonic()
+                self._probe_started_at = None
+                self.times_opened += 1
+                return True
+            return False
+
+    def trip(self, error: Optional[BaseException] = None):
+        """Abrir el circuito de inmediato (ej: si falla la conexión inicial)"""
+        with self._lock:
+            if error is not None:
+                self.last_error = str(error)
+            if self.state != OPEN:
+                self.times_opened += 1
+            self.state = OPEN
+            self._opened_at = time.monotonic()
+            self._probe_started_at = None
+
+    def reset(self):
+        """Volver al estado cerrado (ej: al reconectar)"""
+        self.record_success()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Obtener el estado del circuito para monitoreo"""
+        with self._lock:
+            retry_in = 0.0
+            if self.state == OPEN:
+                retry_in = max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at))
+            return {
+                'name': self.name,
+                'state': self.state,
+                'consecutive_failures': self.consecutive_failures,
+                'failure_threshold': self.failure_threshold,
+                'reset_timeout': self.reset_timeout,
+                'retry_in_seconds': round(retry_in, 2),
+                'times_opened': self.times_opened,
+                'rejected_calls': self.rejected_calls,
+                'last_error': self.last_error
+            }
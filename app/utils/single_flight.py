@@ -0,0 +1,70 @@
+"""
+Single-flight: una sola carga en curso por clave
+
+Cuando un valor sale del caché, todas las peticiones concurrentes que lo
+piden esperan la misma carga en lugar de reconstruirlo cada una.
+"""
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """Agrupa las llamadas concurrentes con la misma clave en una sola ejecución"""
+
+    def __init__(self, name: str = "single_flight"):
+        self.name = name
+        self._inflight: Dict[Hashable, "asyncio.Task[Any]"] = {}
+
+        # Métricas
+        self.calls = 0
+        self.executions = 0
+        self.coalesced = 0
+        self.errors = 0
+
+    async def do(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Ejecutar `loader` para `key`, o esperar la ejecución que ya está en curso.
+        Si la carga falla, todos los que la esperaban reciben la misma excepción.
+        """
+        self.calls += 1
+        task = self._inflight.get(key)
+        if task is None or task.done():
+            task = asyncio.ensure_future(self._run(key, loader))
+            # Marcar la excepción como leída aunque todos los que esperaban se cancelen
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            self._inflight[key] = task
+            self.executions += 1
+        else:
+            self.coalesced += 1
+
+        # shield: si una de las peticiones se cancela, la carga sigue para las demás
+        return await asyncio.shield(task)
+
+    async def _run(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        try:
+            return await loader()
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            if self._inflight.get(key) is asyncio.current_task():
+                del self._inflight[key]
+
+    def in_flight(self, key: Hashable) -> bool:
+        """Indica si hay una carga en curso para la clave"""
+        task = self._inflight.get(key)
+        return task is not None and not task.done()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Obtener métricas de agrupación para monitoreo"""
+        return {
+            'name': self.name,
+            'calls': self.calls,
+            'executions': self.executions,
+            'coalesced': self.coalesced,
+            'errors': self.errors,
+            'in_flight': sum(1 for task in self._inflight.values() if not task.done())
+        }
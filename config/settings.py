@@ -11,14 +11,66 @@ class Settings:
     REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
     REDIS_ENABLED = os.getenv("REDIS_ENABLED", "True").lower() == "true"
     
+    # Conexión a Redis: pool acotado, timeouts cortos por llamada y circuit breaker
+    REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "20"))
+    REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", "0.5"))
+    REDIS_CONNECT_TIMEOUT = float(os.getenv("REDIS_CONNECT_TIMEOUT", "1.0"))
+    REDIS_BREAKER_FAILURE_THRESHOLD = int(os.getenv("REDIS_BREAKER_FAILURE_THRESHOLD", "5"))
+    REDIS_BREAKER_RESET_TIMEOUT = float(os.getenv("REDIS_BREAKER_RESET_TIMEOUT", "30"))
+    
+    # Caché L1 en memoria delante de Redis (invalidado entre workers por pub/sub)
+    CACHE_L1_MAX_ENTRIES = int(os.getenv("CACHE_L1_MAX_ENTRIES", "10000"))
+    CACHE_L1_TTL = int(os.getenv("CACHE_L1_TTL", "60"))
+    CACHE_INVALIDATION_CHANNEL = os.getenv("CACHE_INVALIDATION_CHANNEL", "cache:invalidate")
+    
+    # Catálogo de pizzas en memoria (se invalida al cambiar pizzas; el TTL cubre cambios hechos fuera de la app)
+    MENU_CATALOG_TTL = int(os.getenv("MENU_CATALOG_TTL", "300"))
+    # Confianza mínima (0 a 1) para aceptar un nombre de pizza aproximado ("peperoni" -> Pepperoni)
+    MENU_FUZZY_MIN_SCORE = float(os.getenv("MENU_FUZZY_MIN_SCORE", "0.55"))
+    
+    # Caché en memoria de estados de conversación (por proceso, LRU + TTL)
+    CONVERSATION_CACHE_TTL = int(os.getenv("CONVERSATION_CACHE_TTL", "1800"))
+    CONVERSATION_CACHE_MAX_ENTRIES = int(os.getenv("CONVERSATION_CACHE_MAX_ENTRIES", "50000"))
+    
+    # Write-behind: Redis como almacén primario del estado, volcado a la BD por lotes
+    CONVERSATION_WRITE_BEHIND = os.getenv("CONVERSATION_WRITE_BEHIND", "False").lower() == "true"
+    CONVERSATION_WRITE_BEHIND_INTERVAL = float(os.getenv("CONVERSATION_WRITE_BEHIND_INTERVAL", "5"))
+    CONVERSATION_WRITE_BEHIND_BATCH = int(os.getenv("CONVERSATION_WRITE_BEHIND_BATCH", "500"))
+    CONVERSATION_WRITE_BEHIND_TTL = int(os.getenv("CONVERSATION_WRITE_BEHIND_TTL", "86400"))
+    
+    # Concurrencia optimista del estado de conversación (columna version)
+    CONVERSATION_CAS_MAX_RETRIES = int(os.getenv("CONVERSATION_CAS_MAX_RETRIES", "3"))
+    
+    # Historial de turnos por conversación (usuario y bot)
+    CONVERSATION_HISTORY_TURNS = int(os.getenv("CONVERSATION_HISTORY_TURNS", "6"))
+    CONVERSATION_HISTORY_MAX_CHARS = int(os.getenv("CONVERSATION_HISTORY_MAX_CHARS", "500"))
+    
+    # Limpieza periódica de conversaciones y carritos abandonados
+    CLEANUP_INTERVAL = int(os.getenv("CLEANUP_INTERVAL", "3600"))
+    CONVERSATION_STATE_TTL_HOURS = float(os.getenv("CONVERSATION_STATE_TTL_HOURS", "24"))
+    CONVERSATION_SWEEP_BATCH = int(os.getenv("CONVERSATION_SWEEP_BATCH", "2000"))
+    
     # Twilio
     TWILIO_ACCOUNT_SID = os.getenv("TWILIO_ACCOUNT_SID")
     TWILIO_AUTH_TOKEN = os.getenv("TWILIO_AUTH_TOKEN")
     TWILIO_PHONE_NUMBER = os.getenv("TWILIO_PHONE_NUMBER")
+    # Cliente HTTP compartido para envíos salientes
+    TWILIO_HTTP_TIMEOUT = float(os.getenv("TWILIO_HTTP_TIMEOUT", "10"))
+    TWILIO_HTTP_POOL_SIZE = int(os.getenv("TWILIO_HTTP_POOL_SIZE", "20"))
+    TWILIO_HTTP_KEEPALIVE_SECONDS = float(os.getenv("TWILIO_HTTP_KEEPALIVE_SECONDS", "30"))
+    TWILIO_MAX_CONCURRENT_SENDS = int(os.getenv("TWILIO_MAX_CONCURRENT_SENDS", "10"))
     
     # OpenAI
     OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
     
+    # Presupuesto de tokens del prompt de IA (se descarta primero el contexto de menor valor)
+    AI_PROMPT_TOKEN_BUDGET = int(os.getenv("AI_PROMPT_TOKEN_BUDGET", "4000"))
+    AI_PROMPT_HISTORY_TURNS = int(os.getenv("AI_PROMPT_HISTORY_TURNS", "4"))
+    # Segundos que se reutiliza el prompt del sistema (menú y estadísticas) antes de reconstruirlo
+    AI_SYSTEM_PROMPT_TTL = int(os.getenv("AI_SYSTEM_PROMPT_TTL", "300"))
+    # Segundos que se reutiliza el resumen del cliente (se invalida al crear un pedido)
+    AI_CLIENT_PROFILE_TTL = int(os.getenv("AI_CLIENT_PROFILE_TTL", "300"))
+    
     # App
     SECRET_KEY = os.getenv("SECRET_KEY", "tu_clave_secreta_aqui")
     DEBUG = os.getenv("DEBUG", "True").lower() == "true"
@@ -32,4 +84,28 @@ class Settings:
     # Sentry (opcional para monitoreo en producción)
     SENTRY_DSN = os.getenv("SENTRY_DSN")
 
+    # Procesamiento asíncrono del webhook (responder 200 y procesar en segundo plano)
+    WEBHOOK_ASYNC_PROCESSING = os.getenv("WEBHOOK_ASYNC_PROCESSING", "False").lower() == "true"
+    WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "4"))
+    WEBHOOK_QUEUE_MAXSIZE = int(os.getenv("WEBHOOK_QUEUE_MAXSIZE", "1000"))
+
+    # Agrupación de ráfagas por número (0 = desactivada; requiere WEBHOOK_ASYNC_PROCESSING)
+    COALESCE_WINDOW_MS = int(os.getenv("COALESCE_WINDOW_MS", "0"))
+    COALESCE_MAX_WINDOW_MS = int(os.getenv("COALESCE_MAX_WINDOW_MS", "2500"))
+    
+    # Cola de mensajes salientes (pacing + reintentos ante 429/5xx)
+    OUTBOUND_QUEUE_ENABLED = os.getenv("OUTBOUND_QUEUE_ENABLED", "False").lower() == "true"
+    OUTBOUND_WORKERS = int(os.getenv("OUTBOUND_WORKERS", "2"))
+    OUTBOUND_QUEUE_MAXSIZE = int(os.getenv("OUTBOUND_QUEUE_MAXSIZE", "1000"))
+    OUTBOUND_RATE_PER_SECOND = float(os.getenv("OUTBOUND_RATE_PER_SECOND", "10"))
+    OUTBOUND_BURST = int(os.getenv("OUTBOUND_BURST", "20"))
+    OUTBOUND_MAX_RETRIES = int(os.getenv("OUTBOUND_MAX_RETRIES", "5"))
+    OUTBOUND_BACKOFF_BASE_SECONDS = float(os.getenv("OUTBOUND_BACKOFF_BASE_SECONDS", "1"))
+    OUTBOUND_BACKOFF_MAX_SECONDS = float(os.getenv("OUTBOUND_BACKOFF_MAX_SECONDS", "30"))
+    OUTBOUND_DEAD_LETTER_MAX = int(os.getenv("OUTBOUND_DEAD_LETTER_MAX", "500"))
+    
+    # Deduplicación de reintentos de Twilio (por MessageSid)
+    DEDUPE_TTL_SECONDS = int(os.getenv("DEDUPE_TTL_SECONDS", "3600"))
+    DEDUPE_MAX_ENTRIES = int(os.getenv("DEDUPE_MAX_ENTRIES", "10000"))
+
 settings = Settings()
\ No newline at end of file
@@ -1,5 +1,6 @@
+from contextlib import contextmanager
 from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.orm import Session, sessionmaker, declarative_base
 from sqlalchemy.pool import QueuePool
 from config.settings import settings
 import logging
@@ -34,4 +35,14 @@ def get_db():
     try:
         yield db
     finally:
-        db.close() 
\ No newline at end of file
+        db.close() 
+
+# Sesión propia sobre el mismo motor que `db`, para cargas compartidas entre
+# peticiones (single-flight) que no deben usar la sesión de la petición
+@contextmanager
+def own_session(db: Session):
+    session = SessionLocal(bind=db.get_bind())
+    try:
+        yield session
+    finally:
+        session.close()
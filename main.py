@@ -6,6 +6,7 @@ from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
 from app.routers import webhook, pizzas, pedidos, admin
 from app.utils.logging_config import setup_logging, setup_sentry, get_logger, LoggingMiddleware
+from app.services.lifecycle_service import lifespan
 from config.settings import settings
 
 # Configurar logging estructurado
@@ -20,7 +21,8 @@ app = FastAPI(
     title="Pizza Bot API",
     description="API para chatbot de pedidos de pizza por WhatsApp",
     version="1.0.0",
-    debug=settings.DEBUG
+    debug=settings.DEBUG,
+    lifespan=lifespan
 )
 
 # Configurar rate limiting
@@ -1,4 +1,5 @@
 """Configuración de pruebas"""
+import asyncio
 import pytest
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
@@ -158,6 +159,123 @@ def sample_pedido(db, sample_cliente, sample_pizza):
     
     return pedido
 
+class FakePipeline:
+    """Pipeline que encola llamadas y las ejecuta en orden"""
+
+    def __init__(self, redis):
+        self.redis = redis
+        self.calls = []
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self.calls.append((name, args, kwargs))
+            return self
+        return queue
+
+    async def execute(self):
+        # Los comandos del pipeline no cuentan como viajes aparte
+        commands = list(self.redis.commands)
+        results = [await getattr(self.redis, name)(*args, **kwargs) for name, args, kwargs in self.calls]
+        self.redis.commands = commands
+        return results
+
+
+class FakePubSub:
+    """Suscripción en memoria a canales de FakeRedis"""
+
+    def __init__(self, redis):
+        self.redis = redis
+        self.queue = asyncio.Queue()
+
+    async def subscribe(self, channel):
+        self.redis.subscribers.setdefault(channel, []).append(self.queue)
+
+    async def get_message(self, ignore_subscribe_messages=False, timeout=0.0):
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def aclose(self):
+        for queues in self.redis.subscribers.values():
+            if self.queue in queues:
+                queues.remove(self.queue)
+
+
+class FakeRedis:
+    """Subconjunto de comandos de Redis usados por CacheService"""
+
+    def __init__(self):
+        self.data = {}
+        self.ttls = {}
+        self.commands = []
+        self.subscribers = {}
+
+    async def get(self, key):
+        self.commands.append('get')
+        value = self.data.get(key)
+        return value if isinstance(value, str) else None
+
+    async def mget(self, keys):
+        self.commands.append('mget')
+        return [self.data.get(key) if isinstance(self.data.get(key), str) else None for key in keys]
+
+    async def setex(self, key, ttl, value):
+        self.commands.append('setex')
+        self.data[key] = value
+        self.ttls[key] = ttl
+
+    async def hget(self, key, field):
+        self.commands.append('hget')
+        return self.data.get(key, {}).get(field)
+
+    async def hmget(self, key, fields):
+        self.commands.append('hmget')
+        hash_ = self.data.get(key, {})
+        return [hash_.get(field) for field in fields]
+
+    async def hset(self, key, mapping):
+        self.commands.append('hset')
+        self.data.setdefault(key, {}).update(mapping)
+        return len(mapping)
+
+    async def hdel(self, key, *fields):
+        self.commands.append('hdel')
+        hash_ = self.data.get(key, {})
+        return sum(1 for field in fields if hash_.pop(field, None) is not None)
+
+    async def expire(self, key, ttl):
+        self.commands.append('expire')
+        self.ttls[key] = ttl
+        return key in self.data
+
+    async def delete(self, *keys):
+        self.commands.append('delete')
+        return sum(1 for key in keys if self.data.pop(key, None) is not None)
+
+    async def keys(self, pattern):
+        raise AssertionError("KEYS bloquea Redis y no debe usarse")
+
+    async def publish(self, channel, message):
+        self.commands.append('publish')
+        queues = self.subscribers.get(channel, [])
+        for queue in queues:
+            queue.put_nowait({'type': 'message', 'channel': channel, 'data': message})
+        return len(queues)
+
+    def pubsub(self):
+        return FakePubSub(self)
+
+    def pipeline(self, transaction=True):
+        self.commands.append('pipeline')
+        return FakePipeline(self)
+
+
+@pytest.fixture
+def fake_redis():
+    """Redis falso en memoria (registra un comando por viaje de red)"""
+    return FakeRedis()
+
 @pytest.fixture
 def mock_twilio_client():
     """Mock para cliente de Twilio"""
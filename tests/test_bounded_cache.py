@@ -0,0 +1,73 @@
+"""Pruebas para el caché en memoria acotado (LRU + TTL)"""
+import time
+import pytest
+from unittest.mock import patch, AsyncMock
+from app.utils.bounded_cache import BoundedTTLCache
+from app.services.optimized_conversation_service import OptimizedConversationService
+
+
+@pytest.mark.unit
+def test_lru_eviction_respects_cap():
+    """Test that the least recently used entry is evicted when the cap is reached"""
+    cache = BoundedTTLCache(max_entries=2, ttl_seconds=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # "a" pasa a ser la más reciente
+    cache.set("c", 3)
+
+    assert len(cache) == 2
+    assert "b" not in cache
+    assert cache.get("a") == 1
+    assert cache.get_stats()['evictions'] == 1
+
+
+@pytest.mark.unit
+def test_entries_expire_after_ttl():
+    """Test that expired entries count as misses and are dropped"""
+    cache = BoundedTTLCache(max_entries=10, ttl_seconds=0.01)
+    cache.set("a", 1)
+    time.sleep(0.02)
+
+    assert cache.get("a") is None
+    stats = cache.get_stats()
+    assert stats['misses'] == 1
+    assert stats['expirations'] == 1
+    assert stats['size'] == 0
+
+
+@pytest.mark.unit
+def test_hit_rate_is_reported():
+    """Test that hits and misses are counted"""
+    cache = BoundedTTLCache(max_entries=10, ttl_seconds=60)
+    cache.set("a", 1)
+    cache.get("a")
+    cache.get("a")
+    cache.get("b")
+
+    stats = cache.get_stats()
+    assert stats['hits'] == 2
+    assert stats['misses'] == 1
+    assert stats['hit_rate'] == round(2 / 3, 4)
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_conversation_state_cache_is_shared_across_instances(db):
+    """Test that a per-request service instance reuses states cached by another one"""
+    cache = BoundedTTLCache(max_entries=10, ttl_seconds=60)
+
+    with patch('app.services.optimized_conversation_service.cache_service') as mock_cache, \
+         patch('app.services.optimized_conversation_service.conversation_state_cache', cache):
+        mock_cache.get_many = AsyncMock(return_value={})
+        mock_cache.set_many = AsyncMock(return_value=True)
+
+        first = OptimizedConversationService(db)
+        assert await first.set_conversation_state("+14155238886", "pedido")
+
+        second = OptimizedConversationService(db)
+        with patch.object(second, '_get_state_from_db') as mock_db:
+            assert await second.get_conversation_state("+14155238886") == "pedido"
+            mock_db.assert_not_called()
+
+        mock_cache.get_many.assert_not_called()
+        assert cache.get_stats()['hits'] == 1
@@ -0,0 +1,67 @@
+"""Pruebas para las métricas de caché por keyspace"""
+import pytest
+from app.services.cache_service import CacheService
+from app.utils.cache_metrics import CacheMetrics, keyspace_of
+
+NUMERO = "+14155238886"
+
+
+@pytest.mark.unit
+def test_keyspace_is_the_key_prefix():
+    """Test that keys are grouped by the text before the first colon"""
+    assert keyspace_of(f"conversation:{NUMERO}") == "conversation"
+    assert keyspace_of(f"turn:{NUMERO}:cliente") == "turn"
+    assert keyspace_of("sin_prefijo") == "other"
+
+
+@pytest.mark.unit
+def test_stats_and_prometheus_output():
+    """Test that lookups, errors and latency are reported per keyspace"""
+    metrics = CacheMetrics()
+    metrics.record_lookup("user:1", "redis", True)
+    metrics.record_lookup("user:2", "redis", False)
+    metrics.record_error(["user:1"], "write")
+    metrics.record_latency(["user:1", "user:2"], "read", 0.002)
+
+    stats = metrics.get_stats()['user']
+    assert stats['tiers']['redis'] == {'hits': 1, 'misses': 1, 'hit_rate': 0.5}
+    assert stats['errors'] == {'write': 1}
+    assert stats['latency_ms']['read'] == {'count': 1, 'avg': 2.0}
+
+    text = metrics.render_prometheus({'redis_circuit_open': 0})
+    assert 'pizzabot_cache_lookups_total{keyspace="user",tier="redis",result="hit"} 1' in text
+    assert 'pizzabot_cache_errors_total{keyspace="user",operation="write"} 1' in text
+    assert 'pizzabot_cache_latency_seconds_bucket{keyspace="user",operation="read",le="0.001"} 0' in text
+    assert 'pizzabot_cache_latency_seconds_bucket{keyspace="user",operation="read",le="0.0025"} 1' in text
+    assert 'pizzabot_cache_latency_seconds_count{keyspace="user",operation="read"} 1' in text
+    assert 'pizzabot_redis_circuit_open 0' in text
+
+
+@pytest.mark.unit
+async def test_cache_service_records_each_tier(fake_redis):
+    """Test that CacheService counts L1 and Redis hits and misses separately"""
+    cache = CacheService()
+    cache.enabled = True
+    cache.redis = fake_redis
+
+    await cache.set_conversation_state(NUMERO, {'estado': 'MENU'})
+    cache.local.clear()
+    await cache.get_conversation_state(NUMERO)
+    await cache.get_conversation_state(NUMERO)
+    await cache.get_conversation_state("+10000000000")
+
+    tiers = cache.get_stats()['keyspaces']['conversation']['tiers']
+    assert tiers['l1'] == {'hits': 1, 'misses': 2, 'hit_rate': 0.3333}
+    assert tiers['redis'] == {'hits': 1, 'misses': 1, 'hit_rate': 0.5}
+    assert set(cache.get_stats()['keyspaces']['conversation']['latency_ms']) == {'read', 'write'}
+
+
+@pytest.mark.unit
+def test_metrics_endpoint_serves_prometheus_text(client):
+    """Test that /webhook/metrics returns Prometheus text format"""
+    response = client.get("/webhook/metrics")
+
+    assert response.status_code == 200
+    assert response.headers['content-type'].startswith('text/plain')
+    assert '# TYPE pizzabot_cache_lookups_total counter' in response.text
+    assert 'pizzabot_redis_circuit_open' in response.text
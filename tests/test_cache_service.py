@@ -0,0 +1,266 @@
+"""Pruebas para CacheService sobre un Redis falso en memoria"""
+import asyncio
+import json
+import pytest
+from datetime import timedelta
+from unittest.mock import patch
+from app.services.cache_service import CacheService
+from app.services.optimized_conversation_service import OptimizedConversationService
+from app.utils.bounded_cache import BoundedTTLCache
+
+NUMERO = "+14155238886"
+
+
+@pytest.fixture
+def cache(fake_redis):
+    """CacheService habilitado sobre un Redis falso"""
+    service = CacheService()
+    service.enabled = True
+    service.redis = fake_redis
+    return service
+
+
+@pytest.mark.unit
+async def test_user_data_is_stored_in_a_single_hash(cache):
+    """Test that all fields of a user live in one hash with a per-user TTL"""
+    await cache.set_user_data(NUMERO, 'nombre', 'Ana')
+    await cache.set_user_data_many(NUMERO, {'direccion': 'Calle 1', 'pedidos': [1, 2]}, timedelta(minutes=5))
+
+    assert list(cache.redis.data) == [f"user:{NUMERO}"]
+    assert cache.redis.ttls[f"user:{NUMERO}"] == 300
+    assert await cache.get_user_data(NUMERO, 'nombre') == 'Ana'
+    assert await cache.get_user_data_many(NUMERO, ['nombre', 'pedidos', 'falta']) == {
+        'nombre': 'Ana',
+        'pedidos': [1, 2]
+    }
+
+
+@pytest.mark.unit
+async def test_batched_get_uses_one_round_trip(cache):
+    """Test that reading several fields issues a single HMGET"""
+    await cache.set_user_data_many(NUMERO, {'a': 1, 'b': 2, 'c': 3})
+    cache.redis.commands.clear()
+
+    assert await cache.get_user_data_many(NUMERO, ['a', 'b', 'c']) == {'a': 1, 'b': 2, 'c': 3}
+    assert cache.redis.commands == ['hmget']
+
+
+@pytest.mark.unit
+async def test_delete_user_data_removes_only_given_fields(cache):
+    """Test that deleting a field keeps the rest of the user's data"""
+    await cache.set_user_data_many(NUMERO, {'a': 1, 'b': 2})
+    await cache.delete_user_data(NUMERO, 'a')
+
+    assert await cache.get_user_data_many(NUMERO, ['a', 'b']) == {'b': 2}
+
+
+@pytest.mark.unit
+async def test_invalidate_user_cache_deletes_known_keys_without_keys(cache):
+    """Test that invalidation removes user data and conversation state without scanning"""
+    await cache.set_conversation_state(NUMERO, {'estado': 'INICIO'})
+    await cache.set_user_data(NUMERO, 'nombre', 'Ana')
+    await cache.set_user_data('+10000000000', 'nombre', 'Otro')
+
+    await cache.invalidate_user_cache(NUMERO)
+
+    assert await cache.get_conversation_state(NUMERO) is None
+    assert await cache.get_user_data(NUMERO, 'nombre') is None
+    assert await cache.get_user_data('+10000000000', 'nombre') == 'Otro'
+
+
+@pytest.mark.unit
+async def test_user_data_is_noop_when_disabled():
+    """Test that user data helpers do nothing without Redis"""
+    service = CacheService()
+    service.enabled = False
+
+    await service.set_user_data_many(NUMERO, {'a': 1})
+    assert await service.get_user_data_many(NUMERO, ['a']) == {}
+    await service.invalidate_user_cache(NUMERO)
+
+
+@pytest.mark.unit
+async def test_get_many_and_set_many_use_one_round_trip_each(cache):
+    """Test that multi-key reads and writes issue one MGET and one pipeline with per-key TTLs"""
+    assert await cache.set_many(
+        {'a': {'x': 1}, 'b': [1, 2], 'c': 'texto'},
+        ttl=timedelta(minutes=1),
+        ttls={'b': timedelta(seconds=10)}
+    )
+    assert cache.redis.commands == ['pipeline']
+    assert cache.redis.ttls == {'a': 60, 'b': 10, 'c': 60}
+
+    cache.local.clear()
+    cache.redis.commands.clear()
+    assert await cache.get_many(['a', 'b', 'falta']) == {'a': {'x': 1}, 'b': [1, 2]}
+    assert cache.redis.commands == ['mget']
+
+
+@pytest.fixture
+def turn_service(db, cache):
+    """OptimizedConversationService sobre el Redis falso y un caché en memoria vacío"""
+    with patch('app.services.optimized_conversation_service.cache_service', cache), \
+         patch('app.services.optimized_conversation_service.conversation_state_cache',
+               BoundedTTLCache(max_entries=10, ttl_seconds=60)):
+        yield OptimizedConversationService(db)
+
+
+@pytest.mark.unit
+async def test_turn_makes_one_redis_read_and_one_write(turn_service, cache):
+    """Test that a full turn reads state and turn data in one MGET and writes them in one pipeline"""
+    await cache.set_many({
+        f"turn:{NUMERO}:cliente": {'nombre': 'Ana'},
+        cache.conversation_key(NUMERO): {'estado': 'SALUDO'}
+    })
+    cache.local.clear()
+    cache.redis.commands.clear()
+
+    turn = await turn_service.load_turn(NUMERO, ['cliente', 'ultimos_mensajes'])
+    assert turn == {'estado': 'SALUDO', 'cliente': {'nombre': 'Ana'}}
+
+    assert await turn_service.save_turn(
+        NUMERO, 'PEDIDO',
+        datos={'ultimos_mensajes': ['hola']},
+        ttls={'ultimos_mensajes': timedelta(minutes=5)}
+    )
+    assert cache.redis.commands == ['mget', 'pipeline']
+    assert cache.redis.ttls[f"turn:{NUMERO}:ultimos_mensajes"] == 300
+
+    # El turno siguiente se sirve completo desde memoria
+    cache.redis.commands.clear()
+    turn = await turn_service.load_turn(NUMERO, ['ultimos_mensajes'])
+    assert turn == {'estado': 'PEDIDO', 'ultimos_mensajes': ['hola']}
+    assert cache.redis.commands == []
+
+
+@pytest.mark.unit
+async def test_state_from_database_is_cached_without_a_second_read(turn_service, cache):
+    """Test that a state loaded from the database is written to Redis without repeating the MGET"""
+    assert (await turn_service.load_turn(NUMERO))['estado'] == 'SALUDO'
+    assert cache.redis.commands == ['mget', 'pipeline']
+
+    cache.local.clear()
+    assert (await cache.get_conversation_state(NUMERO))['estado'] == 'SALUDO'
+
+
+def make_worker(fake_redis):
+    """CacheService de un worker conectado al Redis falso compartido"""
+    service = CacheService()
+    service.enabled = True
+    service.redis = fake_redis
+    return service
+
+
+async def wait_for(condition, timeout=1.0):
+    """Esperar a que el listener de invalidaciones procese los avisos"""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while not condition() and loop.time() < deadline:
+        await asyncio.sleep(0.01)
+    return condition()
+
+
+@pytest.mark.unit
+async def test_hot_reads_are_served_from_l1(cache):
+    """Test that repeated reads of the same key do not reach Redis"""
+    await cache.set_conversation_state(NUMERO, {'estado': 'MENU'})
+    cache.redis.commands.clear()
+
+    for _ in range(3):
+        assert (await cache.get_conversation_state(NUMERO))['estado'] == 'MENU'
+    assert cache.redis.commands == []
+    assert cache.get_stats()['l1']['hits'] == 3
+
+
+@pytest.mark.unit
+async def test_writes_invalidate_l1_of_other_workers(fake_redis):
+    """Test that a write on one worker evicts the stale value from another worker's L1"""
+    writer, reader = make_worker(fake_redis), make_worker(fake_redis)
+    reader.start_invalidation_listener()
+    try:
+        assert await wait_for(lambda: fake_redis.subscribers.get(reader.invalidation_channel))
+
+        await writer.set_many({'clave': 1})
+        assert await wait_for(lambda: reader.invalidations_received == 1)
+        assert await reader.get_many(['clave']) == {'clave': 1}
+        assert 'clave' in reader.local
+
+        await writer.set_many({'clave': 2})
+        assert await wait_for(lambda: reader.invalidations_received == 2)
+        assert await reader.get_many(['clave']) == {'clave': 2}
+
+        await writer.delete_many(['clave'])
+        assert await wait_for(lambda: reader.invalidations_received == 3)
+        assert await reader.get_many(['clave']) == {}
+    finally:
+        await reader.stop_invalidation_listener()
+
+
+@pytest.mark.unit
+async def test_remote_invalidation_reaches_conversation_memory_cache(fake_redis):
+    """Test that another worker's state change evicts the in-memory conversation state"""
+    worker = make_worker(fake_redis)
+    memory = BoundedTTLCache(max_entries=10, ttl_seconds=60)
+    memory.set(NUMERO, 'MENU')
+
+    with patch('app.services.optimized_conversation_service.conversation_state_cache', memory):
+        from app.services.optimized_conversation_service import _on_cache_invalidation
+        worker.add_invalidation_listener(_on_cache_invalidation)
+        worker.handle_invalidation(json.dumps({
+            'origin': 'otro-worker',
+            'keys': [worker.conversation_key(NUMERO)]
+        }))
+
+    assert NUMERO not in memory
+
+
+@pytest.mark.unit
+async def test_own_invalidations_are_ignored(cache):
+    """Test that a worker keeps its L1 when it receives its own invalidation"""
+    await cache.set_many({'clave': 1})
+    cache.handle_invalidation(json.dumps({'origin': cache.instance_id, 'keys': ['clave']}))
+
+    assert 'clave' in cache.local
+    assert cache.invalidations_received == 0
+
+
+@pytest.mark.unit
+async def test_open_circuit_skips_redis_until_cooldown(cache):
+    """Test that after repeated failures Redis is skipped, then probed again after the cool-down"""
+    async def broken_mget(keys):
+        cache.redis.commands.append('mget')
+        raise ConnectionError("Redis caído")
+
+    working_mget = cache.redis.mget
+    cache.redis.mget = broken_mget
+    cache.breaker.reset_timeout = 60
+    for _ in range(cache.breaker.failure_threshold):
+        assert await cache.get_many(['clave']) == {}
+
+    assert cache.get_stats()['circuit_breaker']['state'] == 'open'
+    cache.redis.commands.clear()
+    assert await cache.get_many(['clave']) == {}
+    assert await cache.set_many({'clave': 1}) is False
+    assert cache.redis.commands == []
+
+    # Pasado el cool-down, una llamada de prueba cierra el circuito
+    cache.redis.mget = working_mget
+    cache.breaker._opened_at -= 60
+    assert await cache.get_many(['clave']) == {}
+    assert cache.get_stats()['circuit_breaker']['state'] == 'closed'
+    assert await cache.set_many({'clave': 1})
+
+
+@pytest.mark.unit
+async def test_connect_without_redis_opens_circuit():
+    """Test that an unreachable Redis leaves the service running with the circuit open"""
+    service = CacheService()
+    service.enabled = True
+    with patch('app.services.cache_service.settings.REDIS_URL', 'redis://127.0.0.1:1/0'):
+        await service.connect()
+    try:
+        assert service.breaker.state == 'open'
+        assert not service.redis_available
+        assert await service.get_conversation_state(NUMERO) is None
+    finally:
+        await service.disconnect()
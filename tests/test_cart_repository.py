@@ -0,0 +1,177 @@
+"""Pruebas para el carrito normalizado (tabla carrito_items)"""
+import pytest
+from sqlalchemy import event
+from app.models.carrito_item import CarritoItem
+from app.models.cliente import Cliente
+from app.services.cart_repository import CartRepository, get_cart
+from app.services.conversation_context import ConversationContext, conversation_unit_of_work
+from app.services.handlers import OrderHandler
+
+NUMERO = "+14155238886"
+
+
+def add_margherita(cart, pizza, tamano='mediana', cantidad=1):
+    cart.add(
+        pizza_id=pizza.id,
+        pizza_nombre=pizza.nombre,
+        pizza_emoji=pizza.emoji,
+        tamano=tamano,
+        precio=pizza.precio_mediana if tamano == 'mediana' else pizza.precio_grande,
+        cantidad=cantidad
+    )
+
+
+def count_commits(db):
+    """Lista que acumula los commits de la sesión (sin contar SAVEPOINTs)"""
+    commits = []
+    event.listen(db, "after_commit", lambda session: None if session.in_nested_transaction() else commits.append(1))
+    return commits
+
+
+@pytest.mark.unit
+def test_add_merges_same_line(db, sample_pizza):
+    """Test that adding the same pizza and size increments one row instead of adding rows"""
+    cart = CartRepository(db, NUMERO)
+    add_margherita(cart, sample_pizza)
+    add_margherita(cart, sample_pizza, cantidad=2)
+    add_margherita(cart, sample_pizza, tamano='grande')
+
+    assert db.query(CarritoItem).count() == 2
+    items = cart.items()
+    assert [(item['tamano'], item['cantidad']) for item in items] == [('mediana', 3), ('grande', 1)]
+    assert cart.total() == pytest.approx(15.0 * 3 + 18.0)
+
+
+@pytest.mark.unit
+def test_set_quantity_and_remove(db, sample_pizza):
+    """Test that quantities can be changed and lines removed"""
+    cart = CartRepository(db, NUMERO)
+    add_margherita(cart, sample_pizza)
+    add_margherita(cart, sample_pizza, tamano='grande')
+
+    assert cart.set_quantity(sample_pizza.id, 'mediana', 4) is True
+    assert cart.set_quantity(sample_pizza.id, 'pequeña', 2) is False
+    assert cart.remove(sample_pizza.id, 'grande') == 1
+    assert cart.items()[0]['cantidad'] == 4
+
+    assert cart.set_quantity(sample_pizza.id, 'mediana', 0) is True
+    assert cart.is_empty()
+    assert cart.total() == 0.0
+
+
+@pytest.mark.unit
+def test_carts_are_isolated_per_number(db, sample_pizza):
+    """Test that clearing one cart leaves other numbers untouched"""
+    add_margherita(CartRepository(db, NUMERO), sample_pizza)
+    other = CartRepository(db, "+5491100000000")
+    add_margherita(other, sample_pizza)
+
+    assert CartRepository(db, NUMERO).clear() == 1
+    assert len(other.items()) == 1
+
+
+@pytest.mark.unit
+def test_legacy_json_cart_is_migrated(db, sample_pizza):
+    """Test that a cart stored in datos_temporales moves to carrito_items on first access"""
+    legacy_item = {
+        'pizza_id': sample_pizza.id,
+        'pizza_nombre': sample_pizza.nombre,
+        'pizza_emoji': '🍕',
+        'tamano': 'mediana',
+        'precio': 15.0,
+        'cantidad': 1
+    }
+    ConversationContext.for_number(db, NUMERO).set_value('carrito', [legacy_item, legacy_item])
+
+    cart = get_cart(db, NUMERO)
+
+    assert [(item['pizza_id'], item['cantidad']) for item in cart.items()] == [(sample_pizza.id, 2)]
+    assert ConversationContext.for_number(db, NUMERO).get_value('carrito') is None
+    # Un segundo acceso no vuelve a migrar
+    assert get_cart(db, NUMERO).items()[0]['cantidad'] == 2
+
+
+@pytest.mark.unit
+def test_handler_selection_writes_cart_rows(db, sample_pizza):
+    """Test that the order handler adds to carrito_items and keeps the cart out of the JSON blob"""
+    handler = OrderHandler(db)
+
+    with conversation_unit_of_work(db, NUMERO):
+        result = handler._handle_original_format_selection(NUMERO, "1 mediana, 1 mediana")
+
+    assert result['success'] is True
+    assert "x2" in result['response']
+    assert CartRepository(db, NUMERO).items()[0]['cantidad'] == 2
+    assert ConversationContext.for_number(db, NUMERO).get_value('carrito') is None
+
+    handler.clear_conversation_data(NUMERO)
+    assert CartRepository(db, NUMERO).is_empty()
+
+
+@pytest.mark.unit
+def test_cart_writes_are_committed_with_the_turn(db, sample_pizza):
+    """Test that cart changes in a turn are only flushed and commit once with the conversation state"""
+    commits = count_commits(db)
+
+    with conversation_unit_of_work(db, NUMERO) as ctx:
+        add_margherita(CartRepository(db, NUMERO), sample_pizza)
+        ctx.set_estado('pedido')
+        assert commits == []
+
+    assert commits == [1]
+    assert CartRepository(db, NUMERO).items()[0]['cantidad'] == 1
+
+
+@pytest.mark.unit
+def test_failed_turn_discards_cart_writes(db, sample_pizza):
+    """Test that a turn failing after a cart write leaves neither the cart nor the state changed"""
+    with pytest.raises(RuntimeError):
+        with conversation_unit_of_work(db, NUMERO) as ctx:
+            add_margherita(CartRepository(db, NUMERO), sample_pizza)
+            ctx.set_estado('pedido')
+            raise RuntimeError("falla del turno")
+
+    assert CartRepository(db, NUMERO).is_empty()
+    assert ConversationContext.for_number(db, NUMERO).estado == 'inicio'
+
+
+@pytest.mark.unit
+def test_concurrent_line_conflict_keeps_other_pending_work(db, sample_pizza, monkeypatch):
+    """Test that a duplicate-line conflict only rolls back its savepoint and merges into the existing line"""
+    cart = CartRepository(db, NUMERO)
+    add_margherita(cart, sample_pizza)
+
+    with conversation_unit_of_work(db, NUMERO):
+        db.add(Cliente(numero_whatsapp="+5491100000000", nombre="Otro"))
+        db.flush()
+
+        # Simular que la línea la creó otro mensaje: el UPDATE no la ve y el INSERT choca
+        real_line = CartRepository._line
+        calls = []
+
+        def line_missed_once(self, pizza_id, tamano):
+            calls.append(1)
+            query = real_line(self, pizza_id, tamano)
+            return query.filter(CarritoItem.id < 0) if len(calls) == 1 else query
+
+        monkeypatch.setattr(CartRepository, '_line', line_missed_once)
+        add_margherita(cart, sample_pizza, cantidad=2)
+
+    assert [(item['tamano'], item['cantidad']) for item in cart.items()] == [('mediana', 3)]
+    assert db.query(Cliente).filter_by(numero_whatsapp="+5491100000000").one().nombre == "Otro"
+
+
+@pytest.mark.unit
+def test_legacy_cart_migration_is_staged_until_end_of_turn(db, sample_pizza):
+    """Test that migrating the JSON cart inside a turn does not commit mid-turn"""
+    ConversationContext.for_number(db, NUMERO).set_value('carrito', [{
+        'pizza_id': sample_pizza.id, 'pizza_nombre': sample_pizza.nombre, 'tamano': 'mediana', 'precio': 15.0
+    }])
+    commits = count_commits(db)
+
+    with conversation_unit_of_work(db, NUMERO):
+        assert len(get_cart(db, NUMERO).items()) == 1
+        assert commits == []
+
+    assert commits == [1]
+    assert ConversationContext.for_number(db, NUMERO).get_value('carrito') is None
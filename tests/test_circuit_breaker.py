@@ -0,0 +1,53 @@
+"""Pruebas para el circuit breaker"""
+import pytest
+from app.utils.circuit_breaker import CircuitBreaker, CLOSED, OPEN, HALF_OPEN
+
+
+@pytest.mark.unit
+def test_breaker_opens_after_consecutive_failures():
+    """Test that the circuit opens only after the failure threshold is reached"""
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=60)
+
+    assert not breaker.record_failure(RuntimeError("uno"))
+    breaker.record_success()
+    assert not breaker.record_failure()
+    assert not breaker.record_failure()
+    assert breaker.record_failure(RuntimeError("tres"))
+
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+    stats = breaker.get_stats()
+    assert stats['rejected_calls'] == 1
+    assert stats['times_opened'] == 1
+    assert stats['last_error'] == "tres"
+
+
+@pytest.mark.unit
+def test_breaker_allows_a_single_probe_after_cooldown():
+    """Test that after the cool-down only one probe is let through"""
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    breaker.reset_timeout = 60
+
+    breaker._opened_at -= 60
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allow()
+
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    assert breaker.allow()
+
+
+@pytest.mark.unit
+def test_failed_probe_reopens_the_circuit():
+    """Test that a failing probe opens the circuit again with a fresh cool-down"""
+    breaker = CircuitBreaker(failure_threshold=5, reset_timeout=60)
+    breaker.trip()
+    breaker._opened_at -= 60
+
+    assert breaker.allow()
+    assert breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+    assert breaker.get_stats()['times_opened'] == 2
@@ -0,0 +1,182 @@
+"""Pruebas para el contexto de conversación (unidad de trabajo por turno)"""
+import json
+import pytest
+from unittest.mock import patch
+from sqlalchemy import event
+from app.models.conversation_state import ConversationState
+from app.services.conversation_context import ConversationContext, conversation_unit_of_work
+from app.services.enhanced_bot_service import EnhancedBotService
+from app.services.handlers import OrderHandler
+
+NUMERO = "+14155238886"
+
+
+def make_bot(db):
+    """Crear el bot sin cliente de OpenAI"""
+    with patch('app.services.enhanced_bot_service.AIService'):
+        return EnhancedBotService(db)
+
+
+def count_commits(db):
+    """Contar los commits hechos por la sesión"""
+    counter = {'commits': 0}
+
+    @event.listens_for(db, "after_commit")
+    def _after_commit(session):
+        # Liberar un SAVEPOINT no es un commit
+        if not session.in_nested_transaction():
+            counter['commits'] += 1
+
+    return counter
+
+
+@pytest.mark.unit
+def test_turn_writes_once(db):
+    """Test that several state and temp changes in a turn produce a single commit"""
+    counter = count_commits(db)
+
+    with conversation_unit_of_work(db, NUMERO) as ctx:
+        ctx.set_estado('pedido')
+        ctx.set_value('carrito', [{'pizza_id': 1, 'cantidad': 1}])
+        ctx.set_value('direccion', 'Calle 123')
+        ctx.set_estado('direccion')
+        assert counter['commits'] == 0
+
+    assert counter['commits'] == 1
+    row = db.query(ConversationState).filter_by(numero_whatsapp=NUMERO).one()
+    assert row.estado_actual == 'direccion'
+    assert json.loads(row.datos_temporales)['direccion'] == 'Calle 123'
+
+
+@pytest.mark.unit
+def test_bot_and_handlers_share_the_turn_context(db, sample_cliente):
+    """Test that bot helpers and handlers read each other's pending changes without queries"""
+    bot = make_bot(db)
+    handler = OrderHandler(db)
+    counter = count_commits(db)
+
+    with conversation_unit_of_work(db, NUMERO) as ctx:
+        assert bot.get_cliente(NUMERO).id == sample_cliente.id
+        bot.set_temporary_value(NUMERO, 'carrito', [{'pizza_id': 1}])
+        handler.set_conversation_state(NUMERO, 'pedido')
+
+        assert handler.get_temporary_value(NUMERO, 'carrito') == [{'pizza_id': 1}]
+        assert bot.get_conversation_state(NUMERO) == 'pedido'
+        assert handler.get_cliente(NUMERO) is sample_cliente
+        assert ctx.queries == 2  # un ConversationState y un Cliente
+
+    assert counter['commits'] == 1
+
+
+@pytest.mark.unit
+def test_returned_values_are_copies(db):
+    """Test that mutating a returned value does not change the context"""
+    with conversation_unit_of_work(db, NUMERO) as ctx:
+        ctx.set_value('carrito', [])
+        carrito = ctx.get_value('carrito')
+        carrito.append({'pizza_id': 1})
+        assert ctx.get_value('carrito') == []
+
+
+@pytest.mark.unit
+def test_failed_turn_discards_changes(db):
+    """Test that an exception inside the turn does not write partial state"""
+    with pytest.raises(RuntimeError):
+        with conversation_unit_of_work(db, NUMERO) as ctx:
+            ctx.set_estado('confirmacion')
+            raise RuntimeError("boom")
+
+    assert db.query(ConversationState).filter_by(numero_whatsapp=NUMERO).first() is None
+
+
+@pytest.mark.unit
+def test_clear_with_delete_removes_row(db):
+    """Test that clearing with delete_row removes the persisted conversation"""
+    bot = make_bot(db)
+    bot.set_conversation_state(NUMERO, 'pedido')
+
+    with conversation_unit_of_work(db, NUMERO):
+        bot.clear_conversation_data(NUMERO)
+
+    assert db.query(ConversationState).filter_by(numero_whatsapp=NUMERO).first() is None
+
+
+@pytest.mark.unit
+def test_outside_turn_writes_through(db):
+    """Test that helpers called outside a turn keep writing immediately"""
+    handler = OrderHandler(db)
+    handler.set_temporary_value(NUMERO, 'direccion', 'Calle 123')
+
+    assert ConversationContext.current(db, NUMERO) is None
+    row = db.query(ConversationState).filter_by(numero_whatsapp=NUMERO).one()
+    assert json.loads(row.datos_temporales) == {'direccion': 'Calle 123'}
+
+
+@pytest.mark.unit
+def test_concurrent_writes_merge_on_version_conflict(tmp_path):
+    """Test that a stale write is retried on the fresh row instead of overwriting it"""
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from database.connection import Base
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'cas.db'}")
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine)
+    first, second = Session(), Session()
+    conflicts_before = ConversationContext.conflicts
+    try:
+        with conversation_unit_of_work(first, NUMERO) as ctx:
+            ctx.set_value('direccion', 'Calle 123')
+
+        with conversation_unit_of_work(first, NUMERO) as ctx_a:
+            ctx_a.get_datos()  # A lee la versión 1
+
+            with conversation_unit_of_work(second, NUMERO) as ctx_b:
+                ctx_b.set_value('nombre', 'Ana')  # B escribe la versión 2
+
+            ctx_a.set_value('carrito', [{'pizza_id': 1, 'cantidad': 2}])
+
+        row = Session().query(ConversationState).filter_by(numero_whatsapp=NUMERO).one()
+        datos = json.loads(row.datos_temporales)
+        assert datos == {
+            'direccion': 'Calle 123',
+            'nombre': 'Ana',
+            'carrito': [{'pizza_id': 1, 'cantidad': 2}]
+        }
+        assert row.version == 3
+        assert ConversationContext.conflicts == conflicts_before + 1
+    finally:
+        first.close()
+        second.close()
+        engine.dispose()
+
+
+@pytest.mark.unit
+def test_history_is_a_bounded_ring_buffer(db):
+    """Test that turn history keeps only the most recent entries and truncates long messages"""
+    from app.services.conversation_context import HISTORY_MAX_ENTRIES, HISTORY_MAX_CHARS
+
+    for i in range(HISTORY_MAX_ENTRIES):
+        with conversation_unit_of_work(db, NUMERO) as ctx:
+            ctx.record_turn(f"mensaje {i}", f"respuesta {i}")
+    with conversation_unit_of_work(db, NUMERO) as ctx:
+        ctx.record_turn("x" * (HISTORY_MAX_CHARS + 50), None)
+
+    with conversation_unit_of_work(db, NUMERO) as ctx:
+        history = ctx.get_history()
+        assert len(history) == HISTORY_MAX_ENTRIES
+        assert history[-1] == {'role': 'user', 'text': "x" * HISTORY_MAX_CHARS}
+        assert ctx.last_bot_message() == f"respuesta {HISTORY_MAX_ENTRIES - 1}"
+        assert ctx.get_history(limit=1) == [history[-1]]
+
+
+@pytest.mark.unit
+async def test_last_bot_message_survives_new_bot_instances(db):
+    """Test that the previous bot reply is visible to a new service instance on the next turn"""
+    response = await make_bot(db).process_message(NUMERO, "hola")
+
+    bot = make_bot(db)
+    with conversation_unit_of_work(db, NUMERO):
+        assert bot._get_last_bot_message(NUMERO) == response
+        historial = bot.get_conversation_context(NUMERO)['historial']
+        assert historial == [{'role': 'user', 'text': 'hola'}, {'role': 'bot', 'text': response}]
@@ -0,0 +1,82 @@
+"""Pruebas para el despachador de conversaciones por número"""
+import asyncio
+import pytest
+from app.services.conversation_dispatcher import ConversationDispatcher
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_same_number_runs_in_order():
+    """Test that messages for the same number never overlap and keep arrival order"""
+    dispatcher = ConversationDispatcher()
+    events = []
+
+    async def handle(numero, mensaje, delay):
+        async with dispatcher.serialize(numero):
+            events.append(('start', mensaje))
+            await asyncio.sleep(delay)
+            events.append(('end', mensaje))
+
+    await asyncio.gather(
+        handle("+14155238886", "uno", 0.03),
+        handle("+14155238886", "dos", 0.0),
+        handle("+14155238886", "tres", 0.01),
+    )
+
+    assert events == [
+        ('start', 'uno'), ('end', 'uno'),
+        ('start', 'dos'), ('end', 'dos'),
+        ('start', 'tres'), ('end', 'tres'),
+    ]
+    assert dispatcher.get_stats()['contended'] == 2
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_different_numbers_run_in_parallel():
+    """Test that different numbers are processed concurrently"""
+    dispatcher = ConversationDispatcher()
+    inside = set()
+    overlap = []
+
+    async def handle(numero):
+        async with dispatcher.serialize(numero):
+            inside.add(numero)
+            await asyncio.sleep(0.01)
+            overlap.append(len(inside))
+            inside.discard(numero)
+
+    await asyncio.gather(handle("+14155238886"), handle("+14155238887"))
+
+    assert max(overlap) == 2
+    assert dispatcher.get_stats()['contended'] == 0
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_idle_locks_are_evicted():
+    """Test that the lock table does not keep idle numbers"""
+    dispatcher = ConversationDispatcher()
+
+    for i in range(5):
+        async with dispatcher.serialize(f"+1415523888{i}"):
+            assert dispatcher.active_conversations() == 1
+
+    stats = dispatcher.get_stats()
+    assert dispatcher.active_conversations() == 0
+    assert stats['evicted'] == 5
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_lock_released_on_error():
+    """Test that an exception inside the block releases the number"""
+    dispatcher = ConversationDispatcher()
+
+    with pytest.raises(ValueError):
+        async with dispatcher.serialize("+14155238886"):
+            raise ValueError("boom")
+
+    assert dispatcher.active_conversations() == 0
+    async with dispatcher.serialize("+14155238886"):
+        pass
@@ -0,0 +1,56 @@
+"""Pruebas para la limpieza de conversaciones y carritos abandonados"""
+import pytest
+from datetime import datetime, timedelta
+from sqlalchemy.orm import sessionmaker
+from app.models.carrito_item import CarritoItem
+from app.models.conversation_state import ConversationState
+from app.services.conversation_sweeper import ConversationSweeper
+
+
+def add_conversation(db, numero, age_hours, pizza):
+    """Crear una conversación con una línea de carrito y antigüedad dada"""
+    updated_at = datetime.utcnow() - timedelta(hours=age_hours)
+    db.add(ConversationState(numero_whatsapp=numero, estado_actual='pedido', fecha_actualizacion=updated_at))
+    db.add(CarritoItem(
+        numero_whatsapp=numero, pizza_id=pizza.id, pizza_nombre=pizza.nombre,
+        tamano='mediana', precio=15.0, cantidad=1, fecha_creacion=updated_at
+    ))
+    db.commit()
+
+
+@pytest.fixture
+def sweeper(db):
+    return ConversationSweeper(ttl_hours=24, batch_size=2, session_factory=sessionmaker(bind=db.get_bind()))
+
+
+@pytest.mark.unit
+async def test_sweep_removes_only_stale_conversations(db, sweeper, sample_pizza):
+    """Test that stale conversations and their carts are deleted in batches and fresh ones kept"""
+    for i in range(5):
+        add_conversation(db, f"+1000000000{i}", age_hours=48, pizza=sample_pizza)
+    add_conversation(db, "+19999999999", age_hours=1, pizza=sample_pizza)
+
+    result = await sweeper.sweep()
+
+    assert result == {'states': 5, 'cart_items': 5}
+    db.expire_all()
+    assert [row.numero_whatsapp for row in db.query(ConversationState).all()] == ["+19999999999"]
+    assert db.query(CarritoItem).count() == 1
+    stats = sweeper.get_stats()
+    assert stats['runs'] == 1
+    assert stats['last_swept_states'] == 5
+
+
+@pytest.mark.unit
+async def test_sweep_removes_orphan_carts(db, sweeper, sample_pizza):
+    """Test that old cart lines without a conversation are deleted"""
+    db.add(CarritoItem(
+        numero_whatsapp="+10000000001", pizza_id=sample_pizza.id, pizza_nombre=sample_pizza.nombre,
+        tamano='grande', precio=18.0, cantidad=1, fecha_creacion=datetime.utcnow() - timedelta(days=3)
+    ))
+    db.commit()
+
+    result = await sweeper.sweep()
+
+    assert result == {'states': 0, 'cart_items': 1}
+    assert db.query(CarritoItem).count() == 0
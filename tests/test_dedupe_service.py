@@ -0,0 +1,99 @@
+"""Pruebas para la deduplicación de mensajes por MessageSid"""
+import pytest
+from unittest.mock import patch, AsyncMock, Mock
+from app.services.dedupe_service import MessageDeduplicator
+from tests.conftest import TEST_URLS, VALID_PHONE_NUMBERS, HTTP_STATUS
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_second_delivery_is_duplicate():
+    """Test that the same MessageSid is only processed once"""
+    dedupe = MessageDeduplicator(max_entries=10, ttl_seconds=60)
+
+    assert await dedupe.is_duplicate("SM123") is False
+    assert await dedupe.is_duplicate("SM123") is True
+    assert await dedupe.is_duplicate("SM456") is False
+
+    stats = dedupe.get_stats()
+    assert stats['checks'] == 3
+    assert stats['duplicates'] == 1
+    assert stats['hit_rate'] == round(1 / 3, 4)
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_missing_sid_is_never_duplicate():
+    """Test that messages without MessageSid are always processed"""
+    dedupe = MessageDeduplicator(max_entries=10, ttl_seconds=60)
+
+    assert await dedupe.is_duplicate(None) is False
+    assert await dedupe.is_duplicate("") is False
+    assert dedupe.get_stats()['checks'] == 0
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_memory_store_is_bounded():
+    """Test that the in-memory store evicts the oldest SIDs"""
+    dedupe = MessageDeduplicator(max_entries=3, ttl_seconds=60)
+
+    for i in range(5):
+        await dedupe.is_duplicate(f"SM{i}")
+
+    assert dedupe.get_stats()['memory_entries'] == 3
+    # SM0 fue expulsado, así que vuelve a considerarse nuevo
+    assert await dedupe.is_duplicate("SM0") is False
+    assert await dedupe.is_duplicate("SM4") is True
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_release_allows_retry():
+    """Test that a released SID can be processed again"""
+    dedupe = MessageDeduplicator(max_entries=10, ttl_seconds=60)
+
+    await dedupe.is_duplicate("SM123")
+    await dedupe.release("SM123")
+    assert await dedupe.is_duplicate("SM123") is False
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_redis_backend_detects_duplicates_from_other_workers():
+    """Test that Redis SET NX is used to detect duplicates across workers"""
+    dedupe = MessageDeduplicator(max_entries=10, ttl_seconds=60)
+
+    with patch('app.services.dedupe_service.cache_service') as mock_cache:
+        mock_cache.set_if_absent = AsyncMock(return_value=False)
+        assert await dedupe.is_duplicate("SM999") is True
+        mock_cache.set_if_absent.assert_awaited_once()
+
+
+@pytest.mark.integration
+def test_webhook_drops_duplicate_message_sid(client):
+    """Test that a Twilio retry does not run the bot twice"""
+    with patch('app.routers.webhook.WhatsAppService') as mock_whatsapp, \
+         patch('app.routers.webhook.EnhancedBotService') as mock_bot, \
+         patch('app.routers.webhook.message_deduplicator', MessageDeduplicator(10, 60)):
+        mock_bot_instance = Mock()
+        mock_bot_instance.process_message = AsyncMock(return_value="Test response")
+        mock_bot.return_value = mock_bot_instance
+
+        mock_whatsapp_instance = Mock()
+        mock_whatsapp_instance.send_message = AsyncMock(return_value="test_message_sid")
+        mock_whatsapp.return_value = mock_whatsapp_instance
+
+        data = {
+            "From": VALID_PHONE_NUMBERS['customer'],
+            "Body": "hola",
+            "MessageSid": "SM_retry_test"
+        }
+        first = client.post(TEST_URLS['webhook'] + "/form", data=data)
+        second = client.post(TEST_URLS['webhook'] + "/form", data=data)
+
+        assert first.status_code == HTTP_STATUS['success']
+        assert first.json()["status"] == "success"
+        assert second.status_code == HTTP_STATUS['success']
+        assert second.json()["status"] == "duplicate"
+        assert mock_bot_instance.process_message.await_count == 1
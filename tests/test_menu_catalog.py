@@ -0,0 +1,145 @@
+"""Pruebas del catálogo de pizzas en memoria"""
+import json
+import pytest
+from sqlalchemy import event, update
+from app.models.pizza import Pizza
+from app.services.cache_service import CacheService
+from app.services.handlers.order_handler import OrderHandler
+from app.services.menu_catalog import MENU_CATALOG_KEY, get_menu_catalog, menu_catalog
+import app.services.menu_catalog as menu_catalog_module
+
+
+def add_pizzas(db, *nombres, disponible=True):
+    """Agregar pizzas con precios de ejemplo"""
+    for nombre in nombres:
+        db.add(Pizza(
+            nombre=nombre, descripcion=f"Pizza {nombre}", emoji="🍕", disponible=disponible,
+            precio_pequena=10.0, precio_mediana=15.0, precio_grande=20.0
+        ))
+    db.commit()
+
+
+def count_selects(db):
+    """Lista que acumula los SELECT ejecutados sobre el engine de la sesión"""
+    statements = []
+
+    @event.listens_for(db.get_bind(), "before_cursor_execute")
+    def record(conn, cursor, statement, *args):
+        if statement.lstrip().upper().startswith("SELECT"):
+            statements.append(statement)
+
+    return statements
+
+
+@pytest.mark.unit
+def test_catalog_indexes_available_pizzas(db):
+    """Test that the snapshot indexes available pizzas by id, menu number and name"""
+    add_pizzas(db, "Margherita", "Pepperoni")
+    add_pizzas(db, "Agotada", disponible=False)
+    add_pizzas(db, "Hawaiana")
+
+    catalog = get_menu_catalog(db)
+
+    assert [p.nombre for p in catalog] == ["Margherita", "Pepperoni", "Hawaiana"]
+    assert catalog.by_number(3).nombre == "Hawaiana"
+    assert catalog.by_number(4) is None
+    assert catalog.by_name("  PEPPERONI ").numero == 2
+    assert catalog.search("hawai").nombre == "Hawaiana"
+    assert catalog.find("1").nombre == "Margherita"
+    assert catalog.find("agotada") is None
+    # Por id también se encuentran las no disponibles, como con una consulta por id
+    assert catalog.get(3).disponible is False
+
+
+@pytest.mark.unit
+def test_catalog_entries_are_read_only(db):
+    """Test that catalog entries cannot be modified or given new attributes"""
+    add_pizzas(db, "Margherita")
+    pizza = get_menu_catalog(db).by_number(1)
+
+    with pytest.raises(AttributeError):
+        pizza.precio_grande = 1.0
+    with pytest.raises(AttributeError):
+        pizza.extra = True
+
+
+@pytest.mark.unit
+def test_repeated_lookups_do_not_query_the_database(db):
+    """Test that handlers read the shared snapshot instead of querying pizzas each time"""
+    add_pizzas(db, "Margherita", "Pepperoni")
+    handler = OrderHandler(db)
+    get_menu_catalog(db)
+    statements = count_selects(db)
+
+    for _ in range(3):
+        assert handler._find_pizza_by_input("2").nombre == "Pepperoni"
+        assert handler._find_pizza_by_input("marg").nombre == "Margherita"
+        assert handler._show_pizza_menu_for_order()['success']
+
+    assert statements == []
+
+
+@pytest.mark.unit
+def test_version_changes_when_price_or_availability_changes(db):
+    """Test that committing a price or availability change reloads the catalog with a new version"""
+    add_pizzas(db, "Margherita", "Pepperoni")
+    first = get_menu_catalog(db)
+
+    pizza = db.query(Pizza).filter(Pizza.nombre == "Pepperoni").one()
+    pizza.precio_grande = 22.0
+    db.commit()
+    second = get_menu_catalog(db)
+    assert second.version != first.version
+    assert second.by_number(2).precio_grande == 22.0
+
+    db.execute(update(Pizza).where(Pizza.nombre == "Margherita").values(disponible=False))
+    db.commit()
+    third = get_menu_catalog(db)
+    assert third.version != second.version
+    assert [p.nombre for p in third] == ["Pepperoni"]
+
+
+@pytest.mark.unit
+def test_uncommitted_changes_are_not_cached(db):
+    """Test that a catalog read during uncommitted pizza changes is dropped on rollback"""
+    add_pizzas(db, "Margherita")
+    original = get_menu_catalog(db).version
+
+    db.query(Pizza).one().precio_grande = 99.0
+    db.flush()
+    # El catálogo vigente no cambia hasta el commit
+    assert get_menu_catalog(db).version == original
+
+    # Si se recarga a mitad de la transacción, lo leído no queda guardado
+    menu_catalog.invalidate()
+    assert get_menu_catalog(db).by_number(1).precio_grande == 99.0
+    db.rollback()
+
+    assert get_menu_catalog(db).version == original
+
+
+@pytest.mark.unit
+def test_version_is_stable_without_changes(db):
+    """Test that reloading an unchanged menu yields the same version"""
+    add_pizzas(db, "Margherita", "Pepperoni")
+    version = get_menu_catalog(db).version
+
+    menu_catalog.invalidate()
+    assert get_menu_catalog(db).version == version
+
+
+@pytest.mark.unit
+async def test_remote_menu_change_invalidates_catalog(db, fake_redis):
+    """Test that a menu change announced by another worker drops the local catalog"""
+    add_pizzas(db, "Margherita")
+    get_menu_catalog(db)
+    loads = menu_catalog.loads
+
+    worker = CacheService()
+    worker.enabled = True
+    worker.redis = fake_redis
+    worker.add_invalidation_listener(menu_catalog_module._on_cache_invalidation)
+    worker.handle_invalidation(json.dumps({'origin': 'otro-worker', 'keys': [MENU_CATALOG_KEY]}))
+
+    get_menu_catalog(db)
+    assert menu_catalog.loads == loads + 1
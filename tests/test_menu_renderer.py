@@ -0,0 +1,80 @@
+"""Pruebas del menú pre-renderizado por versión del catálogo"""
+import pytest
+from unittest.mock import patch
+from app.models.pizza import Pizza
+from app.services.handlers.menu_handler import MenuHandler
+from app.services.handlers.order_handler import OrderHandler
+from app.services.menu_catalog import get_menu_catalog
+from app.services.menu_renderer import MenuRenderer, etag_matches
+
+
+@pytest.fixture
+def renderer():
+    """Renderizador vacío en lugar del global"""
+    renderer = MenuRenderer()
+    with patch('app.services.handlers.menu_handler.menu_renderer', renderer), \
+         patch('app.services.handlers.order_handler.menu_renderer', renderer), \
+         patch('app.routers.pizzas.menu_renderer', renderer):
+        yield renderer
+
+
+@pytest.mark.unit
+def test_handler_menus_are_rendered_once_per_version(db, sample_pizza, renderer):
+    """Test that every menu variant is built once and then served from the cache"""
+    menu_handler, order_handler = MenuHandler(db), OrderHandler(db)
+
+    for _ in range(3):
+        menu = menu_handler._show_pizza_menu()['response']
+        original = menu_handler._show_pizza_menu_original_style()['response']
+        order = order_handler._show_pizza_menu_for_order()['response']
+
+    assert renderer.renders == 1
+    assert menu.startswith("🍕 *MENÚ DE PIZZAS* 🍕\n\n1️⃣ *Margherita* 🍕\n")
+    assert "   💰 Grande: $18.00\n\n" in menu
+    assert menu.endswith("Para hacer un pedido, escribe *2* o *pedido*")
+    assert "1. 🍕 *Margherita*\n   Salsa de tomate" in original
+    assert order.endswith("Escribe el número o nombre de la pizza que deseas:")
+
+
+@pytest.mark.unit
+def test_price_change_renders_new_version(db, sample_pizza, renderer):
+    """Test that a committed price change produces a freshly rendered menu"""
+    handler = MenuHandler(db)
+    assert "$18.00" in handler._show_pizza_menu()['response']
+
+    sample_pizza.precio_grande = 21.5
+    db.commit()
+
+    assert "$21.50" in handler._show_pizza_menu()['response']
+    assert renderer.renders == 2
+
+
+@pytest.mark.unit
+def test_menu_text_endpoint_supports_etag(client, db, sample_pizza, renderer):
+    """Test that the menu endpoint answers 304 while the catalog version is unchanged"""
+    first = client.get("/pizzas/menu/text")
+    etag = first.headers["etag"]
+    assert first.status_code == 200
+    assert "Margherita" in first.json()["menu"]
+
+    cached = client.get("/pizzas/menu/text", headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.content == b""
+    assert cached.headers["etag"] == etag
+
+    db.query(Pizza).filter(Pizza.id == sample_pizza.id).update({Pizza.disponible: False})
+    db.commit()
+
+    changed = client.get("/pizzas/menu/text", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["etag"] != etag
+    assert "Margherita" not in changed.json()["menu"]
+
+
+@pytest.mark.unit
+def test_etag_matching_accepts_lists_and_weak_tags():
+    """Test that If-None-Match lists, weak validators and '*' match"""
+    assert etag_matches('"a", W/"b"', '"b"')
+    assert etag_matches('*', '"b"')
+    assert not etag_matches('"a"', '"b"')
+    assert not etag_matches(None, '"b"')
@@ -0,0 +1,109 @@
+"""Pruebas de la extracción de saludo, pedido y dirección en un solo mensaje"""
+import pytest
+from unittest.mock import AsyncMock, patch
+from app.models.pizza import Pizza
+from app.services.cart_repository import CartRepository
+from app.services.enhanced_bot_service import EnhancedBotService
+from app.services.menu_catalog import get_menu_catalog
+from app.services.message_extractor import extract_message
+
+
+@pytest.fixture
+def catalog(db):
+    """Menú de ejemplo con dos pizzas"""
+    for nombre in ("Pepperoni", "Hawaiana"):
+        db.add(Pizza(
+            nombre=nombre, descripcion=nombre, emoji="🍕", disponible=True,
+            precio_pequena=10.0, precio_mediana=15.0, precio_grande=20.0
+        ))
+    db.commit()
+    return get_menu_catalog(db)
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("mensaje, saludo, pedido, direccion", [
+    ("Hola, me mandas una pizza hawuaiana grande a esta direccion: Calle 5 #12-30, Centro",
+     True, [(1, "Hawaiana", "grande")], "Calle 5 #12-30, Centro"),
+    ("buenas tardes 2 pepperonis medianas a la calle 80 #10-20 apto 301 gracias",
+     True, [(2, "Pepperoni", "mediana")], "calle 80 #10-20 apto 301"),
+    ("una hawaiana chica, mi dirección es Av. Siempre Viva 742",
+     False, [(1, "Hawaiana", "pequeña")], "Av. Siempre Viva 742"),
+    ("hola quiero una pepperoni grande", True, [(1, "Pepperoni", "grande")], None),
+    ("una hawaiana a la direccion: casa", False, [(1, "Hawaiana", None)], None),
+])
+def test_message_is_split_into_greeting_order_and_address(catalog, mensaje, saludo, pedido, direccion):
+    """Test that greeting, order items and address are extracted from one message"""
+    extraido = extract_message(mensaje, catalog)
+
+    assert extraido.saludo is saludo
+    assert [(i.cantidad or 1, i.pizza.nombre, i.tamano) for i in extraido.items] == pedido
+    assert extraido.direccion == direccion
+
+
+@pytest.mark.unit
+def test_message_is_complete_only_with_sizes_and_address(catalog):
+    """Test that only a fully specified order with an address skips the intermediate states"""
+    assert extract_message("quiero una hawaiana grande, direccion: Calle 5 #12-30", catalog).completo
+    assert not extract_message("quiero una hawaiana, direccion: Calle 5 #12-30", catalog).completo
+    assert not extract_message("quiero una hawaiana grande", catalog).completo
+    assert not extract_message("hola, direccion: Calle 5 #12-30", catalog).completo
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("mensaje", [
+    "hola, ¿cuánto cuesta la pepperoni grande? vivo en Calle 10 #5",
+    "hola, vivo en la calle 10 #5-20, ¿tienen hawaiana grande?",
+    "hawaiana grande a la direccion: Calle 5 #12-30",
+])
+def test_question_or_no_order_intent_with_address_is_not_an_order(catalog, mensaje):
+    """Test that questions or pizza names without order intent are not read as orders even with an address"""
+    extraido = extract_message(mensaje, catalog)
+
+    assert not extraido.items
+    assert not extraido.completo
+
+
+@pytest.fixture
+def bot(db, catalog):
+    """EnhancedBotService con la IA simulada"""
+    with patch('app.services.enhanced_bot_service.AIService'):
+        service = EnhancedBotService(db)
+    service.process_with_ai = AsyncMock(return_value="respuesta de la IA")
+    return service
+
+
+@pytest.mark.unit
+async def test_one_shot_message_goes_straight_to_confirmation(db, bot, sample_cliente):
+    """Test that a greeting with order and address fills cart and address and asks to confirm"""
+    numero = sample_cliente.numero_whatsapp
+    response = await bot.process_message(
+        numero, "Hola, me mandas una pizza hawuaiana grande a esta direccion: Calle 5 #12-30, Centro"
+    )
+
+    bot.process_with_ai.assert_not_awaited()
+    assert response.startswith(f"¡Hola {sample_cliente.nombre}!")
+    assert "RESUMEN DEL PEDIDO" in response and "Calle 5 #12-30, Centro" in response
+    assert [(i['pizza_nombre'], i['tamano']) for i in CartRepository(db, numero).items()] == [("Hawaiana", "grande")]
+    assert bot.get_conversation_state(numero) == 'confirmacion'
+    assert bot.get_temporary_value(numero, 'direccion') == "Calle 5 #12-30, Centro"
+
+
+@pytest.mark.unit
+async def test_question_with_address_goes_to_ai(db, bot, sample_cliente):
+    """Test that a price question with an address reaches the AI and creates no order"""
+    numero = sample_cliente.numero_whatsapp
+    await bot.process_message(numero, "hola, ¿cuánto cuesta la pepperoni grande? vivo en Calle 10 #5")
+
+    bot.process_with_ai.assert_awaited_once()
+    assert CartRepository(db, numero).items() == []
+    assert bot.get_conversation_state(numero) != 'confirmacion'
+
+
+@pytest.mark.unit
+async def test_address_is_not_read_as_part_of_the_order(db, bot, sample_cliente):
+    """Test that numbers in the address do not become quantities when the size is missing"""
+    numero = sample_cliente.numero_whatsapp
+    response = await bot.process_message(numero, "una pepperoni a la calle 3 #4-5 barrio centro")
+
+    assert "¿Qué tamaño quieres?" in response
+    assert bot.get_temporary_value(numero, 'pizza_parcial')['cantidad'] == 1
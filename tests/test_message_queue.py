@@ -0,0 +1,215 @@
+"""Pruebas para la cola de mensajes entrantes con pool de workers"""
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, patch
+from app.services.burst_coalescer import BurstCoalescer
+from app.services.message_queue_service import MessageQueueService
+from tests.conftest import TEST_URLS, VALID_PHONE_NUMBERS, HTTP_STATUS
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_queue_processes_messages_in_background():
+    """Test that enqueued messages are processed by the workers"""
+    processor = AsyncMock()
+    queue = MessageQueueService(num_workers=2, maxsize=10)
+    queue.register_processor(processor)
+    await queue.start()
+
+    assert queue.enqueue("+14155238886", "hola")
+    assert queue.enqueue("+14155238887", "menu")
+    await queue.stop()
+
+    assert processor.await_count == 2
+    stats = queue.get_stats()
+    assert stats['processed'] == 2
+    assert stats['failed'] == 0
+    assert stats['queue_depth'] == 0
+    assert not queue.running
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_queue_rejects_when_full():
+    """Test that enqueue fails fast when the queue is full"""
+    release = asyncio.Event()
+
+    async def slow_processor(from_number, body):
+        await release.wait()
+
+    queue = MessageQueueService(num_workers=1, maxsize=1)
+    queue.register_processor(slow_processor)
+    await queue.start()
+
+    assert queue.enqueue("+14155238886", "uno")
+    await asyncio.sleep(0)  # El worker toma el primer mensaje
+    assert queue.enqueue("+14155238886", "dos")
+    assert not queue.enqueue("+14155238886", "tres")
+    assert queue.get_stats()['rejected'] == 1
+
+    release.set()
+    await queue.stop()
+    assert queue.get_stats()['processed'] == 2
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_queue_counts_failures():
+    """Test that processor errors are counted and do not kill the worker"""
+    processor = AsyncMock(side_effect=[Exception("boom"), None])
+    queue = MessageQueueService(num_workers=1, maxsize=10)
+    queue.register_processor(processor)
+    await queue.start()
+
+    queue.enqueue("+14155238886", "uno")
+    queue.enqueue("+14155238886", "dos")
+    await queue.stop()
+
+    stats = queue.get_stats()
+    assert stats['failed'] == 1
+    assert stats['processed'] == 1
+
+
+@pytest.mark.unit
+def test_enqueue_without_workers_returns_false():
+    """Test that enqueue is rejected when the queue was not started"""
+    queue = MessageQueueService(num_workers=1, maxsize=10)
+    assert not queue.enqueue("+14155238886", "hola")
+
+
+@pytest.mark.integration
+def test_webhook_acknowledges_when_queue_running(client):
+    """Test that the webhook answers immediately when async mode is active"""
+    with patch('app.routers.webhook.message_queue_service') as mock_queue, \
+         patch('app.routers.webhook.process_whatsapp_message') as mock_process:
+        mock_queue.running = True
+        mock_queue.enqueue.return_value = True
+
+        response = client.post(
+            TEST_URLS['webhook'],
+            json={"From": VALID_PHONE_NUMBERS['customer'], "Body": "hola"}
+        )
+
+        assert response.status_code == HTTP_STATUS['success']
+        assert response.json()["status"] == "accepted"
+        mock_queue.enqueue.assert_called_once_with("+14155238886", "hola")
+        mock_process.assert_not_called()
+
+
+@pytest.mark.integration
+def test_webhook_returns_503_when_queue_full(client):
+    """Test that a full queue asks Twilio to retry later"""
+    with patch('app.routers.webhook.message_queue_service') as mock_queue:
+        mock_queue.running = True
+        mock_queue.enqueue.return_value = False
+
+        response = client.post(
+            TEST_URLS['webhook'],
+            json={"From": VALID_PHONE_NUMBERS['customer'], "Body": "hola"}
+        )
+
+        assert response.status_code == 503
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_burst_is_coalesced_into_one_turn():
+    """Test that rapid fragments from one number become a single bot turn"""
+    processor = AsyncMock()
+    queue = MessageQueueService(num_workers=1, maxsize=10, coalesce_window_ms=30, coalesce_max_window_ms=200)
+    queue.register_processor(processor)
+    await queue.start()
+
+    assert queue.enqueue("+14155238886", "hola")
+    assert queue.enqueue("+14155238886", "quiero una hawaiana")
+    assert queue.enqueue("+14155238887", "menu")
+    assert queue.enqueue("+14155238886", "grande")
+    await asyncio.sleep(0.1)
+    await queue.stop()
+
+    calls = sorted(c.args for c in processor.await_args_list)
+    assert calls == [
+        ("+14155238886", "hola\nquiero una hawaiana\ngrande"),
+        ("+14155238887", "menu"),
+    ]
+    stats = queue.get_stats()['coalescing']
+    assert stats['fragments'] == 4
+    assert stats['turns'] == 2
+    assert stats['llm_calls_saved'] == 2
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_burst_window_is_capped():
+    """Test that a never-ending burst is flushed after the max window"""
+    processor = AsyncMock()
+    queue = MessageQueueService(num_workers=1, maxsize=10, coalesce_window_ms=40, coalesce_max_window_ms=60)
+    queue.register_processor(processor)
+    await queue.start()
+
+    for i in range(6):
+        queue.enqueue("+14155238886", f"parte {i}")
+        await asyncio.sleep(0.02)
+
+    await queue.stop()
+    assert processor.await_count >= 2
+    assert queue.get_stats()['coalescing']['fragments'] == 6
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_pending_burst_is_flushed_on_stop():
+    """Test that stopping the queue processes bursts still inside their window"""
+    processor = AsyncMock()
+    queue = MessageQueueService(num_workers=1, maxsize=10, coalesce_window_ms=5000, coalesce_max_window_ms=5000)
+    queue.register_processor(processor)
+    await queue.start()
+
+    queue.enqueue("+14155238886", "hola")
+    await queue.stop()
+
+    processor.assert_awaited_once_with("+14155238886", "hola")
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_burst_is_processed_when_queue_fills_during_window():
+    """Test that an acknowledged burst is not lost when the queue is full at flush time"""
+    release = asyncio.Event()
+    processed = []
+
+    async def slow_processor(from_number, body):
+        await release.wait()
+        processed.append((from_number, body))
+
+    queue = MessageQueueService(num_workers=1, maxsize=1, coalesce_window_ms=20, coalesce_max_window_ms=50)
+    queue.register_processor(slow_processor)
+    await queue.start()
+
+    # La cola está vacía al recibirlos; se llena al cerrar las ventanas
+    for numero in ("+14155238886", "+14155238887", "+14155238888"):
+        assert queue.enqueue(numero, "hola")
+    await asyncio.sleep(0.1)
+
+    stats = queue.get_stats()
+    assert stats['overflow'] >= 1
+    assert stats['coalescing']['dropped'] == 0
+
+    release.set()
+    await queue.stop()
+    assert sorted(processed) == [
+        ("+14155238886", "hola"),
+        ("+14155238887", "hola"),
+        ("+14155238888", "hola"),
+    ]
+    assert queue.get_stats()['processed'] == 3
+
+
+@pytest.mark.unit
+def test_coalescer_counts_turns_the_sink_rejects():
+    """Test that a burst the sink does not accept is counted as dropped"""
+    coalescer = BurstCoalescer(window_ms=0, max_window_ms=0, sink=lambda numero, mensaje: False)
+
+    coalescer.add("+14155238886", "hola")
+
+    assert coalescer.get_stats()['dropped'] == 1
@@ -0,0 +1,158 @@
+"""Pruebas de la lectura local de pedidos en lenguaje natural"""
+import pytest
+from unittest.mock import AsyncMock, patch
+from app.models.pizza import Pizza
+from app.services.cart_repository import CartRepository
+from app.services.enhanced_bot_service import EnhancedBotService
+from app.services.handlers.order_handler import OrderHandler
+from app.services.menu_catalog import get_menu_catalog
+from app.services.order_parser import parse_order
+
+MENU = ["Margherita", "Pepperoni", "Hawaiana", "Cuatro Quesos", "Vegetariana", "Carnívora"]
+
+
+@pytest.fixture
+def catalog(db):
+    """Menú de ejemplo como el de init_db"""
+    for nombre in MENU:
+        db.add(Pizza(
+            nombre=nombre, descripcion=nombre, emoji="🍕", disponible=True,
+            precio_pequena=10.0, precio_mediana=15.0, precio_grande=20.0
+        ))
+    db.commit()
+    return get_menu_catalog(db)
+
+
+def triples(items):
+    """(cantidad, nombre, tamaño) de cada línea leída"""
+    return [(item.cantidad or 1, item.pizza.nombre, item.tamano) for item in items]
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("mensaje, esperado", [
+    ("dame 2 pizzas hawuaianas medianas y grande de pepperoni",
+     [(2, "Hawaiana", "mediana"), (1, "Pepperoni", "grande")]),
+    ("quiero una cuatro quesos grande, 3 peperonis chicas",
+     [(1, "Cuatro Quesos", "grande"), (3, "Pepperoni", "pequeña")]),
+    ("una hawaiana mediana y otra grande",
+     [(1, "Hawaiana", "mediana"), (1, "Hawaiana", "grande")]),
+    ("pepperoni grande x2", [(2, "Pepperoni", "grande")]),
+    ("quiero cuatro hawaianas grandes", [(4, "Hawaiana", "grande")]),
+    ("dos carnívoras familiares + una vegetariana personal",
+     [(2, "Carnívora", "grande"), (1, "Vegetariana", "pequeña")]),
+    ("una margarita", [(1, "Margherita", None)]),
+])
+def test_orders_by_name_are_parsed_into_triples(catalog, mensaje, esperado):
+    """Test that free Spanish text yields (quantity, pizza, size) triples"""
+    assert triples(parse_order(mensaje, catalog)) == esperado
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("mensaje", [
+    "hola", "1 mediana", "quiero una pizza", "solo quiero la hawaiana", "sin cebolla la pepperoni",
+    "quiero 50 hawaianas", "hawaiana grande",
+    "¿cuánto cuesta la pepperoni grande?", "qué ingredientes tiene la hawaiana?",
+    "tienen pizza vegetariana mediana?", "la hawaiana grande tiene piña?",
+    "quisiera saber si la pepperoni grande es picante", "precio de 2 hawaianas grandes"
+])
+def test_unreadable_or_modifying_messages_are_left_to_ai(catalog, mensaje):
+    """Test that questions, messages without order intent or menu names, cart changes or odd quantities are not parsed"""
+    assert parse_order(mensaje, catalog) is None
+
+
+@pytest.fixture
+def bot(db, catalog, sample_cliente):
+    """EnhancedBotService con la IA simulada"""
+    with patch('app.services.enhanced_bot_service.AIService'):
+        service = EnhancedBotService(db)
+    service.process_with_ai = AsyncMock(return_value="respuesta de la IA")
+    return service
+
+
+@pytest.mark.unit
+async def test_order_by_name_fills_cart_without_ai(db, bot, sample_cliente):
+    """Test that a parsed order goes straight to the cart and skips the AI"""
+    numero = sample_cliente.numero_whatsapp
+    response = await bot.process_message(numero, "dame 2 pizzas hawaianas medianas y grande de pepperoni")
+
+    bot.process_with_ai.assert_not_awaited()
+    assert "Carrito actual" in response
+    assert [(i['pizza_nombre'], i['tamano'], i['cantidad']) for i in CartRepository(db, numero).items()] == [
+        ("Hawaiana", "mediana", 2),
+        ("Pepperoni", "grande", 1)
+    ]
+    assert bot.get_conversation_state(numero) == 'pedido'
+
+
+@pytest.mark.unit
+async def test_missing_size_asks_for_it_and_keeps_quantity(db, bot, sample_cliente):
+    """Test that an order without size asks for it and then adds the requested quantity"""
+    numero = sample_cliente.numero_whatsapp
+    response = await bot.process_message(numero, "quiero 3 peperonis")
+    assert "¿Qué tamaño quieres?" in response
+
+    await bot.process_message(numero, "grande")
+
+    bot.process_with_ai.assert_not_awaited()
+    assert [(i['pizza_nombre'], i['tamano'], i['cantidad']) for i in CartRepository(db, numero).items()] == [
+        ("Pepperoni", "grande", 3)
+    ]
+
+
+@pytest.mark.unit
+async def test_unparseable_message_still_reaches_ai(bot, sample_cliente):
+    """Test that messages the parser cannot read keep going to the AI"""
+    await bot.process_message(sample_cliente.numero_whatsapp, "¿qué pizza me recomiendas?")
+
+    bot.process_with_ai.assert_awaited_once()
+
+
+@pytest.mark.unit
+async def test_price_question_is_not_added_to_cart(db, bot, sample_cliente):
+    """Test that a question naming a pizza and size goes to the AI and leaves the cart empty"""
+    numero = sample_cliente.numero_whatsapp
+    await bot.process_message(numero, "¿cuánto cuesta la pepperoni grande?")
+
+    bot.process_with_ai.assert_awaited_once()
+    assert CartRepository(db, numero).items() == []
+    assert bot.get_conversation_state(numero) != 'pedido'
+
+
+@pytest.mark.unit
+def test_order_handler_accepts_orders_by_name(db, catalog, sample_cliente):
+    """Test that the handler flow adds named orders that the numeric format rejected"""
+    numero = sample_cliente.numero_whatsapp
+    result = OrderHandler(db)._handle_pizza_selection(numero, "una vegetariana grande y 2 medianas de margarita")
+
+    assert result['success']
+    assert [(i['pizza_nombre'], i['tamano'], i['cantidad']) for i in CartRepository(db, numero).items()] == [
+        ("Vegetariana", "grande", 1),
+        ("Margherita", "mediana", 2)
+    ]
+
+
+@pytest.mark.unit
+async def test_sized_items_are_added_when_several_sizes_are_missing(db, bot, sample_cliente):
+    """Test that items with a size are added and listed while the missing sizes are asked for"""
+    numero = sample_cliente.numero_whatsapp
+    response = await bot.process_message(numero, "quiero 2 hawaianas medianas, una pepperoni y una vegetariana")
+
+    bot.process_with_ai.assert_not_awaited()
+    assert "Agregado al carrito" in response and "Hawaiana (mediana)" in response
+    assert "¿De qué tamaño quieres: Pepperoni, Vegetariana?" in response
+    assert [(i['pizza_nombre'], i['tamano'], i['cantidad']) for i in CartRepository(db, numero).items()] == [
+        ("Hawaiana", "mediana", 2)
+    ]
+
+
+@pytest.mark.unit
+def test_order_handler_adds_sized_items_when_a_size_is_missing(db, catalog, sample_cliente):
+    """Test that the handler flow keeps the sized items of a message where another lacks its size"""
+    numero = sample_cliente.numero_whatsapp
+    result = OrderHandler(db)._handle_pizza_selection(numero, "una vegetariana grande y 2 de margarita")
+
+    assert "Vegetariana (grande)" in result['response']
+    assert "¿De qué tamaño quieres: Margherita?" in result['response']
+    assert [(i['pizza_nombre'], i['tamano'], i['cantidad']) for i in CartRepository(db, numero).items()] == [
+        ("Vegetariana", "grande", 1)
+    ]
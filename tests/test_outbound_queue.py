@@ -0,0 +1,167 @@
+"""Pruebas para la cola de mensajes salientes con reintentos"""
+import asyncio
+import time
+import pytest
+from unittest.mock import AsyncMock, Mock, patch
+from twilio.base.exceptions import TwilioRestException
+from app.services.outbound_queue_service import OutboundMessageQueue, TokenBucket
+from tests.conftest import TEST_URLS, VALID_PHONE_NUMBERS, HTTP_STATUS
+
+
+def make_queue(sender, **kwargs):
+    """Crear una cola saliente rápida para pruebas"""
+    options = dict(
+        num_workers=1, maxsize=10, rate_per_second=1000, burst=10,
+        max_retries=3, backoff_base=0.01, backoff_max=0.02, dead_letter_max=5
+    )
+    options.update(kwargs)
+    queue = OutboundMessageQueue(**options)
+    queue.register_sender(sender)
+    return queue
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_retries_on_twilio_429_then_delivers():
+    """Test that a 429 from Twilio is retried instead of dropping the reply"""
+    sender = AsyncMock(side_effect=[TwilioRestException(status=429, uri="test"), "SM1"])
+    queue = make_queue(sender)
+    await queue.start()
+
+    assert queue.enqueue("+14155238886", "Tu pedido está confirmado")
+    await queue.stop()
+
+    assert sender.await_count == 2
+    stats = queue.get_stats()
+    assert stats['sent'] == 1
+    assert stats['retries'] == 1
+    assert stats['throttled'] == 1
+    assert stats['dead_lettered'] == 0
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_permanent_error_goes_to_dead_letter():
+    """Test that non-retryable errors are not retried"""
+    sender = AsyncMock(side_effect=TwilioRestException(status=400, uri="test"))
+    queue = make_queue(sender)
+    await queue.start()
+
+    queue.enqueue("+14155238886", "hola")
+    await queue.stop()
+
+    assert sender.await_count == 1
+    dead = queue.get_dead_letters()
+    assert len(dead) == 1
+    assert dead[0]['to_number'] == "+14155238886"
+    assert dead[0]['attempts'] == 1
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_exhausted_retries_go_to_dead_letter():
+    """Test that a message failing with 5xx is dead-lettered after max retries"""
+    sender = AsyncMock(side_effect=TwilioRestException(status=503, uri="test"))
+    queue = make_queue(sender, max_retries=2)
+    await queue.start()
+
+    queue.enqueue("+14155238886", "hola")
+    await queue.stop()
+
+    assert sender.await_count == 3
+    assert queue.get_stats()['dead_lettered'] == 1
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_retry_does_not_reorder_replies_to_same_number():
+    """Test that a later reply to a number waits for an earlier one being retried"""
+    delivered = []
+    failed_once = set()
+
+    async def sender(to_number, body):
+        if body == "1" and body not in failed_once:
+            failed_once.add(body)
+            raise TwilioRestException(status=503, uri="test")
+        delivered.append((to_number, body))
+        return "SM"
+
+    queue = make_queue(sender, num_workers=4, backoff_base=0.05, backoff_max=0.05)
+    await queue.start()
+    for body in ("1", "2", "3"):
+        queue.enqueue("+14155238886", body)
+        queue.enqueue("+5491100000000", f"otro {body}")
+    await queue.stop()
+
+    assert [body for number, body in delivered if number == "+14155238886"] == ["1", "2", "3"]
+    assert [body for number, body in delivered if number == "+5491100000000"] == ["otro 1", "otro 2", "otro 3"]
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_stop_dead_letters_queued_and_retrying_messages():
+    """Test that messages still queued or waiting for a retry at shutdown are dead-lettered, not dropped"""
+    sender = AsyncMock(side_effect=TwilioRestException(status=503, uri="test"))
+    queue = make_queue(sender, backoff_base=10, backoff_max=10)
+    await queue.start()
+
+    queue.enqueue("+14155238886", "primero")
+    queue.enqueue("+14155238886", "segundo")
+    await asyncio.sleep(0.05)
+    await queue.stop(timeout=0.1)
+
+    dead = queue.get_dead_letters()
+    assert sorted(item['body'] for item in dead) == ["primero", "segundo"]
+    assert queue.get_stats()['in_flight'] == 0
+
+
+@pytest.mark.unit
+def test_backoff_uses_full_jitter():
+    """Test that the backoff delay is drawn from zero up to the exponential ceiling"""
+    queue = make_queue(AsyncMock(), backoff_base=1, backoff_max=30)
+
+    delays = [queue._backoff_delay(3) for _ in range(200)]
+
+    assert all(0 <= delay <= 4 for delay in delays)
+    assert min(delays) < 2
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_token_bucket_paces_sends():
+    """Test that the token bucket limits throughput after the burst"""
+    bucket = TokenBucket(rate=50, capacity=2)
+    started = time.monotonic()
+    for _ in range(4):
+        await bucket.acquire()
+    elapsed = time.monotonic() - started
+
+    # 2 tokens inmediatos y 2 más a 50/s
+    assert elapsed >= 0.03
+
+
+@pytest.mark.integration
+def test_webhook_reply_goes_through_outbound_queue(client):
+    """Test that bot replies are enqueued when the outbound queue is running"""
+    with patch('app.routers.webhook.WhatsAppService') as mock_whatsapp, \
+         patch('app.routers.webhook.EnhancedBotService') as mock_bot, \
+         patch('app.routers.webhook.outbound_message_queue') as mock_outbound:
+        mock_bot_instance = Mock()
+        mock_bot_instance.process_message = AsyncMock(return_value="Test response")
+        mock_bot.return_value = mock_bot_instance
+
+        mock_whatsapp_instance = Mock()
+        mock_whatsapp_instance.send_message = AsyncMock(return_value="test_message_sid")
+        mock_whatsapp.return_value = mock_whatsapp_instance
+
+        mock_outbound.running = True
+        mock_outbound.enqueue.return_value = True
+
+        response = client.post(
+            TEST_URLS['webhook'],
+            json={"From": VALID_PHONE_NUMBERS['customer'], "Body": "hola"}
+        )
+
+        assert response.status_code == HTTP_STATUS['success']
+        mock_outbound.enqueue.assert_called_once_with("+14155238886", "Test response")
+        mock_whatsapp_instance.send_message.assert_not_called()
@@ -0,0 +1,87 @@
+"""Pruebas del índice difuso de nombres de pizza"""
+import pytest
+from unittest.mock import patch
+from app.models.pizza import Pizza
+from app.services.enhanced_bot_service import EnhancedBotService
+from app.services.handlers.order_handler import OrderHandler
+from app.services.menu_catalog import get_menu_catalog
+from app.services.pizza_name_index import normalize_words
+
+MENU = ["Margherita", "Pepperoni", "Hawaiana", "Cuatro Quesos", "Vegetariana", "Carnívora"]
+
+
+@pytest.fixture
+def menu(db):
+    """Menú de ejemplo como el de init_db"""
+    for nombre in MENU:
+        db.add(Pizza(
+            nombre=nombre, descripcion=nombre, emoji="🍕", disponible=True,
+            precio_pequena=10.0, precio_mediana=15.0, precio_grande=20.0
+        ))
+    db.commit()
+    return get_menu_catalog(db)
+
+
+@pytest.mark.unit
+def test_normalize_words_strips_accents_and_punctuation():
+    """Test that names are compared without accents, case or punctuation"""
+    assert normalize_words("¡Una CARNÍVORA, por favor!") == ["una", "carnivora", "por", "favor"]
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("texto, nombre", [
+    ("peperoni", "Pepperoni"),
+    ("hawuaiana", "Hawaiana"),
+    ("margarita", "Margherita"),
+    ("carnivora", "Carnívora"),
+    ("dame una vegetarina grande", "Vegetariana"),
+    ("cuatro quesos", "Cuatro Quesos"),
+    ("una de quesos", "Cuatro Quesos"),
+])
+def test_misspelled_names_resolve_to_the_right_pizza(menu, texto, nombre):
+    """Test that misspelled or accent-free names find the pizza with a confidence score"""
+    match = menu.match(texto)
+
+    assert match is not None
+    assert match.pizza.nombre == nombre
+    assert 0.55 <= match.score <= 1.0
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("texto", ["hola", "quiero cuatro pizzas", "grande", "pizza", ""])
+def test_messages_without_a_pizza_name_do_not_match(menu, texto):
+    """Test that greetings, quantities and sizes are not mistaken for pizza names"""
+    assert menu.match(texto) is None
+
+
+@pytest.mark.unit
+def test_exact_names_score_higher_than_typos(menu):
+    """Test that the confidence reflects how close the text is to the name"""
+    assert menu.match("pepperoni").score == 1.0
+    assert menu.match("peperoni").score < 1.0
+
+
+@pytest.mark.unit
+def test_find_falls_back_to_fuzzy_match(db, menu):
+    """Test that lookups by number, partial name and misspelled name all use the catalog"""
+    handler = OrderHandler(db)
+
+    assert handler._find_pizza_by_input("3").nombre == "Hawaiana"
+    assert handler._find_pizza_by_input("quesos").nombre == "Cuatro Quesos"
+    assert handler._find_pizza_by_input("peperoni").nombre == "Pepperoni"
+    assert handler._find_pizza_by_input("xyz") is None
+
+
+@pytest.mark.unit
+async def test_partial_request_recognizes_misspelled_pizza(db, menu):
+    """Test that a partial request with a typo asks for the size of the right pizza"""
+    with patch('app.services.enhanced_bot_service.AIService'):
+        service = EnhancedBotService(db)
+
+    with patch.object(service, 'set_temporary_value') as set_value, \
+         patch.object(service, 'set_conversation_state') as set_state:
+        response = await service.handle_partial_pizza_request("+10000000000", "dame una peperoni", None)
+
+    assert "Pepperoni" in response
+    assert set_value.call_args[0][2]['nombre'] == "Pepperoni"
+    set_state.assert_called_once_with("+10000000000", 'seleccion_tamano_pizza')
@@ -0,0 +1,105 @@
+"""Pruebas para el armado de prompts de IA con presupuesto de tokens"""
+import sys
+import types
+import pytest
+from unittest.mock import Mock, patch
+from app.services.prompt_assembler import PromptAssembler, PromptSection, TokenCounter
+
+
+class WordCounter(TokenCounter):
+    """Contador determinista: un token por palabra"""
+
+    def __init__(self):
+        super().__init__()
+        self.backend = "words"
+
+    def count(self, text: str) -> int:
+        return len(text.split())
+
+
+def make_sections():
+    return [
+        PromptSection('conversacion', "carrito " * 20, priority=90),
+        PromptSection('cliente', "cliente " * 40, priority=50),
+        PromptSection('recomendaciones', "recomendacion " * 60, priority=20),
+    ]
+
+
+HISTORY = [
+    {'role': 'user', 'text': 'quiero una pizza'},
+    {'role': 'bot', 'text': 'claro, cual tamaño'},
+    {'role': 'user', 'text': 'mediana'},
+    {'role': 'bot', 'text': 'agregada al carrito'},
+]
+
+
+@pytest.mark.unit
+def test_everything_fits_in_a_large_budget():
+    """Test that all sections and turns are sent in order when the budget allows"""
+    assembler = PromptAssembler(budget_tokens=10_000, history_turns=2, counter=WordCounter())
+
+    prompt = assembler.assemble("sistema", "hola", make_sections(), HISTORY)
+
+    assert prompt.dropped == []
+    assert [m['role'] for m in prompt.messages] == ['system', 'user', 'assistant', 'user', 'assistant', 'user']
+    assert prompt.messages[1]['content'] == 'quiero una pizza'
+    assert prompt.messages[-1]['content'].endswith("Mensaje del usuario: hola")
+    assert prompt.tokens <= 10_000
+
+
+@pytest.mark.unit
+def test_lowest_value_parts_are_dropped_first():
+    """Test that recommendations, then the customer summary and old turns, go before the cart"""
+    assembler = PromptAssembler(budget_tokens=70, history_turns=2, counter=WordCounter())
+
+    prompt = assembler.assemble("sistema", "hola", make_sections(), HISTORY)
+
+    assert prompt.tokens <= 70
+    assert 'recomendaciones' in prompt.dropped and 'cliente' in prompt.dropped
+    context = prompt.messages[-1]['content']
+    assert 'carrito' in context and 'cliente' not in context
+    # El turno más reciente se conserva
+    assert prompt.messages[-2]['content'] == 'agregada al carrito'
+
+    stats = assembler.get_stats()
+    assert stats['calls'] == 1
+    assert stats['last_prompt_tokens'] == prompt.tokens
+    assert stats['dropped_by_section']['recomendaciones'] == 1
+
+
+@pytest.mark.unit
+def test_history_is_limited_to_configured_turns():
+    """Test that only the last K user/bot turns are considered"""
+    assembler = PromptAssembler(budget_tokens=10_000, history_turns=1, counter=WordCounter())
+
+    prompt = assembler.assemble("sistema", "hola", [], HISTORY)
+
+    assert [m['content'] for m in prompt.messages[1:-1]] == ['mediana', 'agregada al carrito']
+
+
+@pytest.mark.unit
+def test_tokenizer_is_loaded_on_first_count_not_at_construction():
+    """Test that building a counter does not touch tiktoken until the first count"""
+    encoding = Mock(encode=lambda text: text.split())
+    fake_tiktoken = types.SimpleNamespace(encoding_for_model=Mock(return_value=encoding), get_encoding=Mock())
+
+    with patch.dict(sys.modules, {'tiktoken': fake_tiktoken}):
+        counter = TokenCounter()
+        fake_tiktoken.encoding_for_model.assert_not_called()
+        assert counter.backend == "pending"
+
+        assert counter.count("una pizza grande") == 3
+        assert counter.count("otra") == 1
+
+    fake_tiktoken.encoding_for_model.assert_called_once_with("gpt-4o")
+    assert counter.backend == "tiktoken"
+
+
+@pytest.mark.unit
+def test_counter_falls_back_to_approximation_without_tiktoken():
+    """Test that a missing tokenizer switches to the character approximation"""
+    with patch.dict(sys.modules, {'tiktoken': None}):
+        counter = TokenCounter()
+        assert counter.count("a" * 10) == 3
+
+    assert counter.backend == "heuristic"
@@ -0,0 +1,208 @@
+"""Pruebas para la agrupación de cargas concurrentes (single-flight)"""
+import asyncio
+import time
+import pytest
+from unittest.mock import patch, Mock
+from app.services.ai_service import AIService
+from app.services.cache_service import CacheService
+from app.services.optimized_conversation_service import OptimizedConversationService
+from app.utils.bounded_cache import BoundedTTLCache
+from app.utils.single_flight import SingleFlight
+
+
+@pytest.mark.unit
+async def test_concurrent_calls_share_one_execution():
+    """Test that concurrent callers with the same key await a single loader run"""
+    flight = SingleFlight()
+    runs = 0
+
+    async def loader():
+        nonlocal runs
+        runs += 1
+        await asyncio.sleep(0.01)
+        return {'valor': runs}
+
+    results = await asyncio.gather(*(flight.do('menu', loader) for _ in range(5)))
+
+    assert runs == 1
+    assert results == [{'valor': 1}] * 5
+    assert flight.get_stats()['coalesced'] == 4
+    assert not flight.in_flight('menu')
+
+    # Terminada la carga, la siguiente llamada vuelve a ejecutar el loader
+    assert await flight.do('menu', loader) == {'valor': 2}
+
+
+@pytest.mark.unit
+async def test_loader_error_reaches_every_waiter():
+    """Test that a failing load raises for all callers and is retried afterwards"""
+    flight = SingleFlight()
+
+    async def failing():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("BD caída")
+
+    results = await asyncio.gather(*(flight.do('k', failing) for _ in range(3)), return_exceptions=True)
+
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert flight.get_stats()['errors'] == 1
+    assert not flight.in_flight('k')
+
+
+@pytest.mark.unit
+async def test_cancelled_caller_does_not_cancel_shared_load():
+    """Test that cancelling one waiter leaves the load running for the others"""
+    flight = SingleFlight()
+    release = asyncio.Event()
+
+    async def loader():
+        await release.wait()
+        return 'ok'
+
+    first = asyncio.create_task(flight.do('k', loader))
+    second = asyncio.create_task(flight.do('k', loader))
+    await asyncio.sleep(0)
+    first.cancel()
+    release.set()
+
+    assert await second == 'ok'
+    with pytest.raises(asyncio.CancelledError):
+        await first
+
+
+@pytest.mark.unit
+async def test_get_or_load_caches_and_coalesces(fake_redis):
+    """Test that cache misses trigger one load and later reads are served from cache"""
+    cache = CacheService()
+    cache.enabled = True
+    cache.redis = fake_redis
+    runs = 0
+
+    async def loader():
+        nonlocal runs
+        runs += 1
+        await asyncio.sleep(0.01)
+        return ['margherita', 'pepperoni']
+
+    results = await asyncio.gather(*(cache.get_or_load('menu', loader) for _ in range(4)))
+    assert results == [['margherita', 'pepperoni']] * 4
+    assert runs == 1
+
+    cache.local.clear()
+    assert await cache.get_or_load('menu', loader) == ['margherita', 'pepperoni']
+    assert runs == 1
+
+
+@pytest.mark.unit
+async def test_system_prompt_is_built_once_for_concurrent_requests(db):
+    """Test that concurrent AI requests share a single system prompt rebuild"""
+    def slow_build(db=None):
+        time.sleep(0.05)
+        return "PROMPT"
+
+    with patch('app.services.ai_service.openai'), \
+         patch('app.services.ai_service.cache_service', CacheService()), \
+         patch.object(AIService, '_create_system_prompt', Mock(side_effect=slow_build)) as build:
+        services = [AIService(db) for _ in range(3)]
+        prompts = await asyncio.gather(*(service.get_system_prompt() for service in services))
+
+    assert prompts == ["PROMPT"] * 3
+    assert build.call_count == 1
+    # La carga compartida usa su propia sesión, no la de la petición que la inició
+    loader_db = build.call_args.args[0]
+    assert loader_db is not db
+    assert loader_db.get_bind() is db.get_bind()
+
+
+@pytest.mark.unit
+async def test_system_prompt_is_rebuilt_when_menu_changes(db, sample_pizza):
+    """Test that a price change is reflected in the next system prompt instead of waiting for the TTL"""
+    builds = []
+
+    def build(session=None):
+        builds.append(session)
+        return f"PROMPT {len(builds)}"
+
+    with patch('app.services.ai_service.openai'), \
+         patch('app.services.ai_service.cache_service', CacheService()), \
+         patch.object(AIService, '_create_system_prompt', Mock(side_effect=build)):
+        service = AIService(db)
+        assert await service.get_system_prompt() == "PROMPT 1"
+        assert await service.get_system_prompt() == "PROMPT 1"
+
+        sample_pizza.precio_grande = 21.0
+        db.commit()
+
+        assert await service.get_system_prompt() == "PROMPT 2"
+    assert len(builds) == 2
+
+
+@pytest.mark.unit
+async def test_get_or_load_coalesces_and_caches_without_redis():
+    """Test that with Redis unavailable loads are still shared and kept in the process L1"""
+    cache = CacheService()
+    cache.enabled = False
+    runs = 0
+
+    async def loader():
+        nonlocal runs
+        runs += 1
+        await asyncio.sleep(0.01)
+        return {'prompt': runs}
+
+    results = await asyncio.gather(*(cache.get_or_load('k', loader) for _ in range(4)))
+    assert results == [{'prompt': 1}] * 4
+    assert await cache.get_or_load('k', loader) == {'prompt': 1}
+    assert runs == 1
+
+    # Invalidar también borra la copia del L1 aunque Redis no esté
+    await cache.delete_many(['k'])
+    assert await cache.get_or_load('k', loader) == {'prompt': 2}
+
+
+@pytest.mark.unit
+async def test_concurrent_turns_of_new_number_load_state_once(db):
+    """Test that concurrent turns missing the cache share one database load on its own session"""
+    cache = CacheService()
+    cache.enabled = False
+    sessions = []
+
+    def slow_state(numero, session=None):
+        sessions.append(session)
+        time.sleep(0.05)
+        return 'SALUDO'
+
+    with patch('app.services.optimized_conversation_service.cache_service', cache), \
+         patch('app.services.optimized_conversation_service.conversation_state_cache',
+               BoundedTTLCache(max_entries=10, ttl_seconds=60)), \
+         patch.object(OptimizedConversationService, '_get_state_from_db', side_effect=slow_state):
+        turns = await asyncio.gather(*(
+            OptimizedConversationService(db).load_turn("+14155238886") for _ in range(3)
+        ))
+
+    assert [turn['estado'] for turn in turns] == ['SALUDO'] * 3
+    assert len(sessions) == 1
+    assert sessions[0] is not db
+
+
+@pytest.mark.unit
+async def test_client_profile_is_loaded_once_and_invalidated(db, sample_cliente):
+    """Test that concurrent AI requests share one customer profile load until it is invalidated"""
+    cache = CacheService()
+    cache.enabled = False
+
+    with patch('app.services.ai_service.openai'), \
+         patch('app.services.ai_service.cache_service', cache), \
+         patch.object(AIService, '_get_client_context', Mock(return_value="PERFIL")) as build:
+        services = [AIService(db) for _ in range(3)]
+        perfiles = await asyncio.gather(*(service.get_client_profile(sample_cliente) for service in services))
+        assert perfiles == ["PERFIL"] * 3
+        assert build.call_count == 1
+
+        await cache.delete_many([cache.client_profile_key(sample_cliente.numero_whatsapp)])
+        await services[0].get_client_profile(sample_cliente)
+        assert build.call_count == 2
+
+    cliente, loader_db = build.call_args.args
+    assert cliente.id == sample_cliente.id
+    assert loader_db is not db
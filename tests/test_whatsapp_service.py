@@ -5,6 +5,15 @@ from twilio.base.exceptions import TwilioRestException
 from app.services.whatsapp_service import WhatsAppService
 from tests.test_config import VALID_PHONE_NUMBERS, TEST_URLS, TWILIO_TEST_CONFIG
 
+@pytest.fixture(autouse=True)
+def twilio_settings(monkeypatch):
+    """Credenciales de Twilio de prueba, sin depender de las variables de entorno"""
+    from app.services.whatsapp_service import settings
+    monkeypatch.setattr(settings, 'TWILIO_ACCOUNT_SID', TWILIO_TEST_CONFIG['account_sid'])
+    monkeypatch.setattr(settings, 'TWILIO_AUTH_TOKEN', TWILIO_TEST_CONFIG['auth_token'])
+    monkeypatch.setattr(settings, 'TWILIO_PHONE_NUMBER', TWILIO_TEST_CONFIG['phone_number'])
+    return settings
+
 @pytest.mark.unit
 @pytest.mark.twilio
 @pytest.mark.asyncio
@@ -126,4 +135,109 @@ async def test_send_image_without_caption():
         VALID_PHONE_NUMBERS['customer'].replace('whatsapp:', ''),
         TEST_URLS['image']
     )
-    assert message_id == "test_message_sid" 
\ No newline at end of file
+    assert message_id == "test_message_sid" 
+
+@pytest.mark.unit
+@pytest.mark.twilio
+@pytest.mark.asyncio
+async def test_send_message_does_not_block_event_loop():
+    """Test that a slow synchronous Twilio client runs off the event loop"""
+    import asyncio
+    import time
+
+    mock_client = Mock()
+    mock_message = Mock()
+    mock_message.sid = "test_message_sid"
+
+    def slow_create(**kwargs):
+        time.sleep(0.1)
+        return mock_message
+
+    mock_client.messages.create.side_effect = slow_create
+    service = WhatsAppService(twilio_client=mock_client)
+
+    ticks = 0
+
+    async def ticker():
+        nonlocal ticks
+        while True:
+            await asyncio.sleep(0.01)
+            ticks += 1
+
+    ticker_task = asyncio.create_task(ticker())
+    await service.send_message(VALID_PHONE_NUMBERS['customer'].replace('whatsapp:', ''), "Test message")
+    ticker_task.cancel()
+
+    assert ticks >= 5
+
+@pytest.mark.unit
+@pytest.mark.twilio
+@pytest.mark.asyncio
+async def test_shared_client_is_reused_across_instances():
+    """Test that services without an injected client share one async Twilio client"""
+    from unittest.mock import AsyncMock
+
+    mock_message = Mock()
+    mock_message.sid = "test_message_sid"
+
+    with patch('app.services.whatsapp_service.Client') as mock_client_class:
+        mock_client_class.return_value.messages.create_async = AsyncMock(return_value=mock_message)
+        try:
+            for _ in range(3):
+                await WhatsAppService().send_message(
+                    VALID_PHONE_NUMBERS['customer'].replace('whatsapp:', ''),
+                    "Test message"
+                )
+        finally:
+            await WhatsAppService.close_shared_client()
+
+    assert mock_client_class.call_count == 1
+    assert mock_client_class.return_value.messages.create_async.await_count == 3
+    assert not mock_client_class.return_value.messages.create.called
+
+@pytest.mark.unit
+@pytest.mark.twilio
+@pytest.mark.asyncio
+async def test_stalled_twilio_request_times_out_and_frees_send_slot():
+    """Test that a Twilio request that never answers fails after TWILIO_HTTP_TIMEOUT"""
+    import asyncio
+    import time
+
+    class StalledSession:
+        """Sesión HTTP que nunca responde"""
+        closed = False
+
+        async def request(self, **kwargs):
+            await asyncio.sleep(3600)
+
+        async def close(self):
+            self.closed = True
+
+    with patch('app.services.whatsapp_service.settings') as mock_settings:
+        mock_settings.TWILIO_HTTP_TIMEOUT = 0.2
+        mock_settings.TWILIO_MAX_CONCURRENT_SENDS = 1
+        mock_settings.TWILIO_HTTP_POOL_SIZE = 1
+        mock_settings.TWILIO_HTTP_KEEPALIVE_SECONDS = 1
+        mock_settings.TWILIO_ACCOUNT_SID = "ACtest"
+        mock_settings.TWILIO_AUTH_TOKEN = "test"
+        mock_settings.TWILIO_PHONE_NUMBER = "+14155238886"
+        try:
+            WhatsAppService._ensure_shared_sender()
+            await WhatsAppService._shared_http_client.session.close()
+            WhatsAppService._shared_http_client.session = StalledSession()
+            service = WhatsAppService()
+
+            started_at = time.monotonic()
+            with pytest.raises(asyncio.TimeoutError):
+                await service.send_message(VALID_PHONE_NUMBERS['customer'].replace('whatsapp:', ''), "Test message")
+            assert time.monotonic() - started_at < 1.0
+
+            # El cupo se liberó: el siguiente envío también falla por timeout y no queda esperando
+            with pytest.raises(asyncio.TimeoutError):
+                await asyncio.wait_for(
+                    service.send_message(VALID_PHONE_NUMBERS['customer'].replace('whatsapp:', ''), "Test message"),
+                    timeout=1.0
+                )
+            assert WhatsAppService.get_sender_stats()['in_flight'] == 0
+        finally:
+            await WhatsAppService.close_shared_client()
@@ -0,0 +1,165 @@
+"""Pruebas para la persistencia write-behind del estado de conversación"""
+import json
+import pytest
+from unittest.mock import patch
+from sqlalchemy import event
+from sqlalchemy.orm import sessionmaker
+from app.models.conversation_state import ConversationState
+from app.services.conversation_context import conversation_unit_of_work
+from app.services.write_behind_service import ConversationWriteBehind
+
+NUMERO = "+14155238886"
+
+
+class FakeSnapshotCache:
+    """Sustituto en memoria de los métodos de snapshot de cache_service"""
+
+    def __init__(self, available=True):
+        self.redis = object()
+        self.available = available
+        self.snapshots = {}
+        self.dirty = set()
+
+    async def save_conversation_snapshot(self, user_id, snapshot, ttl):
+        if not self.available:
+            return False
+        self.snapshots[user_id] = json.loads(json.dumps(snapshot))
+        self.dirty.add(user_id)
+        return True
+
+    async def get_conversation_snapshot(self, user_id):
+        return self.snapshots.get(user_id) if self.available else None
+
+    async def get_conversation_snapshots(self, user_ids):
+        return {u: self.snapshots[u] for u in user_ids if u in self.snapshots}
+
+    async def pop_dirty_conversations(self, count):
+        popped = list(self.dirty)[:count]
+        self.dirty.difference_update(popped)
+        return popped
+
+    async def mark_conversations_dirty(self, user_ids):
+        self.dirty.update(user_ids)
+        return True
+
+    async def count_dirty_conversations(self):
+        return len(self.dirty)
+
+    async def discard_conversation_snapshots(self, user_ids):
+        for user_id in user_ids:
+            self.snapshots.pop(user_id, None)
+            self.dirty.discard(user_id)
+        return True
+
+    async def ping(self):
+        return self.available
+
+
+@pytest.fixture
+def write_behind(db):
+    """Write-behind activo sobre la BD de prueba y un Redis falso"""
+    fake_cache = FakeSnapshotCache()
+    service = ConversationWriteBehind(
+        enabled=True,
+        interval_seconds=60,
+        batch_size=2,
+        session_factory=sessionmaker(bind=db.get_bind())
+    )
+    with patch('app.services.write_behind_service.cache_service', fake_cache), \
+         patch('app.services.write_behind_service.conversation_write_behind', service):
+        yield service, fake_cache
+
+
+def db_row(db, numero=NUMERO):
+    db.expire_all()
+    return db.query(ConversationState).filter_by(numero_whatsapp=numero).first()
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_turn_goes_to_redis_not_database(db, write_behind):
+    """Test that a turn in write-behind mode writes a snapshot and skips the commit"""
+    service, fake_cache = write_behind
+    commits = []
+    event.listen(db, "after_commit", lambda session: None if session.in_nested_transaction() else commits.append(1))
+
+    async with conversation_unit_of_work(db, NUMERO) as ctx:
+        ctx.set_estado('pedido')
+        ctx.set_value('carrito', [{'pizza_id': 1}])
+
+    assert commits == []
+    assert fake_cache.snapshots[NUMERO]['estado'] == 'pedido'
+    assert NUMERO in fake_cache.dirty
+    assert db_row(db) is None
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_next_turn_reads_snapshot_without_query(db, write_behind):
+    """Test that the state is loaded from Redis when a snapshot exists"""
+    service, fake_cache = write_behind
+    fake_cache.snapshots[NUMERO] = {'estado': 'direccion', 'datos': {'direccion': 'Calle 1'}, 'deleted': False}
+
+    async with conversation_unit_of_work(db, NUMERO) as ctx:
+        assert ctx.estado == 'direccion'
+        assert ctx.get_value('direccion') == 'Calle 1'
+        assert ctx.queries == 0
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_flush_upserts_batches(db, write_behind):
+    """Test that dirty conversations are inserted and updated with a multi-row upsert"""
+    service, fake_cache = write_behind
+    db.add(ConversationState(numero_whatsapp="+14155238887", estado_actual='inicio'))
+    db.commit()
+
+    for numero, estado in [(NUMERO, 'pedido'), ("+14155238887", 'confirmacion'), ("+14155238888", 'menu')]:
+        async with conversation_unit_of_work(db, numero) as ctx:
+            ctx.set_estado(estado)
+
+    written = await service.flush_all()
+
+    assert written == 3
+    assert fake_cache.dirty == set()
+    assert db_row(db).estado_actual == 'pedido'
+    assert db_row(db, "+14155238887").estado_actual == 'confirmacion'
+    assert db_row(db, "+14155238888").estado_actual == 'menu'
+    assert service.get_stats()['flushes'] == 2  # lotes de 2
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_deleted_conversation_is_removed_on_flush(db, write_behind):
+    """Test that clearing a conversation with delete_row removes the row on flush"""
+    service, fake_cache = write_behind
+    db.add(ConversationState(numero_whatsapp=NUMERO, estado_actual='pedido'))
+    db.commit()
+
+    async with conversation_unit_of_work(db, NUMERO) as ctx:
+        ctx.clear(delete_row=True)
+
+    await service.flush_all()
+    assert db_row(db) is None
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_falls_back_to_write_through_when_redis_fails(db, write_behind):
+    """Test that the turn is committed to the database if Redis rejects the snapshot"""
+    service, fake_cache = write_behind
+    fake_cache.available = False
+
+    async with conversation_unit_of_work(db, NUMERO) as ctx:
+        ctx.set_estado('pedido')
+
+    assert db_row(db).estado_actual == 'pedido'
+    assert not service.active
+    assert service.get_stats()['fallbacks'] == 1
+
+    # Al volver Redis se descartan los snapshots obsoletos y se reactiva el modo
+    fake_cache.available = True
+    fake_cache.snapshots[NUMERO] = {'estado': 'inicio', 'datos': {}, 'deleted': False}
+    await service._recover_if_needed()
+    assert service.active
+    assert NUMERO not in fake_cache.snapshots